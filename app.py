@@ -1,16 +1,33 @@
 import gradio as gr
 from PIL import Image
-import torch
-from transformers import ViTImageProcessor, ViTForImageClassification
+from transformers import ViTImageProcessor
+from vit_inference import load_classifier, parse_label
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 import logging
+import os
+import sys
+from pathlib import Path
+from embedding_store import QueryEmbeddingCache, load_embedding_store
+from guide_chunks import aggregate_hits, chunk_guides
+from model_loader import MODEL_LOADING, ModelLoader
+from stage_metrics import ServerTimingMiddleware, StageMetrics
 
 # --- CONFIGURATION ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+KNOWLEDGE_DIR = Path(__file__).parent / "knowledge_base"
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Chunk hits retrieved per query before they are grouped back into guides
+CHUNK_HITS = 20
+# Free-text query embeddings kept in memory, beyond the precomputed plant names
+QUERY_CACHE_SIZE = int(os.environ.get("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+# Resolve every classifier label to its guide at startup instead of per image
+PRECOMPUTE_LABEL_GUIDES = os.environ.get("EMBEDDING_PRECOMPUTE_LABELS", "1") != "0"
+# Per-stage latency histograms, served on /metrics by create_server()
+metrics = StageMetrics("app")
+
 # --- KNOWLEDGE BASE (ULTIMATE SOUTH INDIA AGRICULTURAL GUIDE) ---
 # This structured database contains comprehensive farming information for Kerala & South India.
 DOCUMENTS = [
@@ -85,25 +102,77 @@ DOCUMENTS = [
 ]
 
 
+# --- GUIDE LOOKUP ---
+def find_guide(query):
+    """Closest guide to a query, found through its best-matching chunks"""
+    with metrics.stage("embed"):
+        query_emb = query_cache.get(query)
+    with metrics.stage("faiss_search"):
+        distances, indices = index.search(query_emb, min(CHUNK_HITS, index.ntotal))
+    return aggregate_hits(distances[0], indices[0], chunks, k=1)[0]
+
 # --- AI MODELS (Vision + RAG) ---
-try:
-    logger.info("Loading AI models... This may take several minutes on the first run.")
-    model_name = "wambugu71/crop_leaf_diseases_vit"
+# Independent models load in parallel on background threads (MODEL_LOADING=eager waits
+# for them at import); the UI answers with a "still loading" message until they are ready.
+model_name = "wambugu71/crop_leaf_diseases_vit"
+documents_dict = {doc['title'].lower(): doc for doc in DOCUMENTS}
+# One chunk per guide field (summary, fertilizer, each pest and disease)
+chunks = chunk_guides(DOCUMENTS)
+detector_processor = None
+detector_model = None
+embedding_model = None
+index = None
+query_cache = None
+# The classifier emits a fixed set of labels, so their guides can be resolved once
+label_guides = {}
+
+def load_detector_processor():
+    global detector_processor
     detector_processor = ViTImageProcessor.from_pretrained(model_name)
-    detector_model = ViTForImageClassification.from_pretrained(model_name)
-    
-    documents_dict = {doc['title'].lower(): doc for doc in DOCUMENTS}
-    all_titles = [doc['title'] for doc in DOCUMENTS]
-    embedding_model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    embeddings = embedding_model.encode(all_titles, convert_to_numpy=True)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-    
-    logger.info("✅ AI Models loaded successfully!")
-    MODELS_LOADED = True
-except Exception as e:
-    logger.error(f"❌ Error loading AI models: {e}")
-    MODELS_LOADED = False
+
+def load_detector_model():
+    global detector_model
+    # Inference backend is selected with ML_BACKEND (see vit_inference)
+    detector_model = load_classifier(model_name)
+
+def load_embedding_model():
+    global embedding_model
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+def load_guide_index():
+    global index, query_cache
+    encode = lambda texts: embedding_model.encode(texts, convert_to_numpy=True)
+    # Reuses knowledge_base/embeddings.npy (and faiss_index.bin) unless the chunks changed
+    _, index = load_embedding_store(KNOWLEDGE_DIR, [chunk.text for chunk in chunks], EMBEDDING_MODEL_NAME,
+                                    encode, rebuild="--build-index" in sys.argv)
+    query_cache = QueryEmbeddingCache(encode, QUERY_CACHE_SIZE)
+
+def precompute_label_guides():
+    global label_guides
+    labels = list(detector_model.id2label.values())
+    query_cache.precompute(parse_label(label)[0] for label in labels)
+    label_guides = {label: find_guide(parse_label(label)[0]) for label in labels}
+    logger.info(f"Precomputed guides for {len(label_guides)} classifier labels")
+
+def warmup():
+    """One forward pass through each model so the first upload does not pay for lazy initialisation"""
+    inputs = detector_processor(images=Image.new("RGB", (224, 224), (90, 140, 60)), return_tensors="np")
+    detector_model.logits(inputs["pixel_values"])
+    query = embedding_model.encode(["warmup"], convert_to_numpy=True)
+    index.search(np.asarray(query, dtype=np.float32), 1)
+
+loader = ModelLoader()
+loader.add("vit_processor", load_detector_processor)
+loader.add("vit_model", load_detector_model)
+loader.add("embedding_model", load_embedding_model)
+loader.add("faiss_index", load_guide_index, depends_on=["embedding_model"])
+if PRECOMPUTE_LABEL_GUIDES:
+    loader.add("label_guides", precompute_label_guides, depends_on=["vit_model", "faiss_index"])
+loader.add("warmup", warmup, depends_on=["vit_processor", "vit_model", "faiss_index"])
+logger.info("Loading AI models... This may take several minutes on the first run.")
+loader.start()
+if MODEL_LOADING == "eager" or "--build-index" in sys.argv:
+    loader.wait()
 
 # --- FORMATTING FUNCTION ---
 def format_guide(doc):
@@ -136,33 +205,36 @@ def format_guide(doc):
 
 # --- CORE ANALYSIS FUNCTION (MORE ROBUST) ---
 def analyze_plant_health(image_to_analyze):
-    if not MODELS_LOADED:
+    if loader.failed:
         return "Error: AI models could not be loaded. Please check the terminal for errors."
+    if not loader.ready:
+        return "AgriMithra is still loading its AI models. Please try again in a minute."
 
     try:
         # Stage 1: Analyze the image
-        image = Image.fromarray(image_to_analyze).convert("RGB")
-        inputs = detector_processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            outputs = detector_model(**inputs)
-        predicted_class_idx = outputs.logits.argmax(-1).item()
-        predicted_label = detector_model.config.id2label[predicted_class_idx]
+        with metrics.stage("classify"):
+            image = Image.fromarray(image_to_analyze).convert("RGB")
+            inputs = detector_processor(images=image, return_tensors="np")
+            logits = detector_model.logits(inputs["pixel_values"])
+        predicted_class_idx = int(logits.argmax(-1)[0])
+        predicted_label = detector_model.id2label[predicted_class_idx]
         
         logger.info(f"Model prediction: '{predicted_label}'")
 
         # Stage 2: Extract the plant name more safely
-        plant_name_parts = predicted_label.replace("_", " ").split("___")
-        plant_name = plant_name_parts[0].strip()
+        plant_name, _ = parse_label(predicted_label)
 
         logger.info(f"Parsed plant name for search: '{plant_name}'")
 
-        # Stage 3: Use RAG to find the comprehensive guide
-        query_emb = embedding_model.encode([plant_name], convert_to_numpy=True)
-        distances, indices = index.search(query_emb, 1)
-        best_match_doc = DOCUMENTS[indices[0][0]]
+        # Stage 3: Use RAG to find the comprehensive guide (a table lookup for known labels)
+        best_match = label_guides.get(predicted_label) or find_guide(plant_name)
+        logger.info(f"Best guide: '{DOCUMENTS[best_match['guide']]['title']}' via {best_match['fields'][:3]}")
+        logger.info(f"Query embedding cache: {query_cache.stats()}")
+        best_match_doc = DOCUMENTS[best_match['guide']]
 
         # Stage 4: Format and return the full guide
-        return format_guide(best_match_doc)
+        with metrics.stage("format"):
+            return format_guide(best_match_doc)
     
     except Exception as e:
         logger.error(f"An error occurred during analysis: {e}", exc_info=True)
@@ -178,5 +250,38 @@ demo = gr.Interface(
     allow_flagging="never"
 )
 
+def create_server():
+    """FastAPI app serving the UI at / plus /healthz (liveness), /readyz (readiness with
+    per-model load state and timing) and /metrics for orchestrated deployments"""
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    server = FastAPI()
+    # Gradio runs analyses on its own queue, so their stages reach /metrics but not the
+    # Server-Timing header of the HTTP request that submitted them
+    server.add_middleware(ServerTimingMiddleware, metrics=metrics)
+
+    @server.get("/metrics")
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @server.get("/healthz")
+    def healthz():
+        return {"status": "alive"}
+
+    @server.get("/readyz")
+    def readyz():
+        status = loader.status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    return gr.mount_gradio_app(server, demo, path="/")
+
 if __name__ == "__main__":
-    demo.launch(share=True)
+    if "--build-index" in sys.argv:
+        # Embeddings and index were rebuilt while loading the models above
+        sys.exit(0 if loader.ready else 1)
+    if "--serve" in sys.argv:
+        import uvicorn
+        uvicorn.run(create_server(), host="0.0.0.0", port=int(os.environ.get("APP_PORT", "7860")))
+    else:
+        demo.launch(share=True)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled QueryCategorizer vs the original per-call keyword loop.
+Checks that both return the same category before timing them, with the built-in keyword
+tables and with a synthetic table 10x larger.
+
+Usage: python3 benchmarks/bench_categorizer.py [--repeat N]
+"""
+
+import argparse
+import random
+import string
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from query_categorizer import QueryCategorizer  # noqa: E402
+from simple_rag_service import CATEGORY_KEYWORDS, PREDEFINED_QUERIES  # noqa: E402
+
+
+def legacy_categorize(query: str, categories=CATEGORY_KEYWORDS) -> str:
+    """The original SimpleRAGChatbot._categorize_query, keyword table rebuilt per call"""
+    query = query.lower()
+    categories = {category: list(keywords) for category, keywords in categories.items()}
+    scores = {category: 0 for category in categories}
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            if keyword in query:
+                scores[category] += 1
+    max_score = max(scores.values())
+    if max_score == 0:
+        return "general"
+    return max(scores.items(), key=lambda x: x[1])[0]
+
+
+def sample_queries(rng: random.Random, count: int):
+    """Predefined UI queries plus random recombinations of their words"""
+    queries = [q for questions in PREDEFINED_QUERIES.values() for q in questions]
+    words = " ".join(queries).split()
+    queries += [" ".join(rng.choice(words) for _ in range(rng.randint(4, 14))) for _ in range(count)]
+    return queries
+
+
+def time_per_query(fn, queries, repeat: int) -> float:
+    seconds = timeit.timeit(lambda: [fn(q) for q in queries], number=repeat)
+    return seconds / (repeat * len(queries)) * 1e6
+
+
+def run(keywords, queries, repeat: int, label: str):
+    categorizer = QueryCategorizer(keywords)
+    mismatches = [q for q in queries if categorizer.categorize(q) != legacy_categorize(q, keywords)]
+    if mismatches:
+        raise SystemExit(f"[{label}] categorizer disagrees with legacy on: {mismatches[:5]}")
+
+    n_keywords = sum(len(kws) for kws in keywords.values())
+    legacy_us = time_per_query(lambda q: legacy_categorize(q, keywords), queries, repeat)
+    compiled_us = time_per_query(categorizer.categorize, queries, repeat)
+    print(f"{label:<10} {n_keywords:>5} keywords  legacy {legacy_us:7.2f} us/query  "
+          f"compiled {compiled_us:7.2f} us/query  speedup {legacy_us / compiled_us:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="random queries on top of the predefined ones")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    queries = sample_queries(rng, args.queries)
+    run(CATEGORY_KEYWORDS, queries, args.repeat, "built-in")
+
+    # Simulate a much larger config-driven keyword table
+    large = {category: list(kws) for category, kws in CATEGORY_KEYWORDS.items()}
+    for category in large:
+        large[category] += ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+                            for _ in range(9 * len(large[category]))]
+    run(large, queries, max(1, args.repeat // 4), "10x table")
+
+
+if __name__ == "__main__":
+    main()
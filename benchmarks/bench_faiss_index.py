@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: approximate FAISS index types (HNSW, IVF-PQ) against the exact Flat baseline.
+Uses synthetic clustered embeddings shaped like the guide chunks (384-d, ~12 chunks per
+guide) and reports build time, query latency, chunk recall@k and top-1 guide agreement
+after aggregating chunk hits back to guides.
+
+Usage: python3 benchmarks/bench_faiss_index.py [--sizes 10000 100000] [--queries 500]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_store import create_index, resolve_index_type  # noqa: E402
+from guide_chunks import Chunk, aggregate_hits  # noqa: E402
+
+DIMENSION = 384
+CHUNKS_PER_GUIDE = 12
+
+
+def synthetic_corpus(rng: np.random.Generator, size: int, queries: int):
+    """Chunk vectors scattered around per-guide centres, plus perturbed chunk queries"""
+    n_guides = max(1, size // CHUNKS_PER_GUIDE)
+    centres = rng.standard_normal((n_guides, DIMENSION)).astype(np.float32)
+    guide_of = rng.integers(0, n_guides, size)
+    vectors = centres[guide_of] + 0.6 * rng.standard_normal((size, DIMENSION)).astype(np.float32)
+    picks = rng.integers(0, size, queries)
+    query_vectors = vectors[picks] + 0.3 * rng.standard_normal((queries, DIMENSION)).astype(np.float32)
+    chunks = [Chunk(int(g), "chunk", "") for g in guide_of]
+    return np.ascontiguousarray(vectors), np.ascontiguousarray(query_vectors), chunks
+
+
+def run(size: int, n_queries: int, k: int, rng: np.random.Generator):
+    vectors, queries, chunks = synthetic_corpus(rng, size, n_queries)
+    results = {}
+    for index_type in ("flat", "hnsw", "ivfpq"):
+        resolved = resolve_index_type(index_type, size)
+        if resolved != index_type:
+            print(f"{size:>8} chunks  {index_type:<6} skipped (too few vectors)")
+            continue
+        start = time.perf_counter()
+        index = create_index(vectors, index_type)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:  # one at a time, like interactive requests
+            index.search(query[None, :], k)
+        latency_ms = (time.perf_counter() - start) * 1000 / n_queries
+        distances, indices = index.search(queries, k)
+        results[index_type] = (distances, indices)
+
+        flat_d, flat_i = results["flat"]
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(indices, flat_i)])
+        guide_agreement = np.mean([
+            aggregate_hits(d, i, chunks)[0]["guide"] == aggregate_hits(fd, fi, chunks)[0]["guide"]
+            for d, i, fd, fi in zip(distances, indices, flat_d, flat_i)
+        ])
+        print(f"{size:>8} chunks  {index_type:<6} build {build_s:7.2f}s  {latency_ms:7.3f} ms/query  "
+              f"recall@{k} {recall:6.1%}  top-1 guide {guide_agreement:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=20, help="chunk hits per query")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    for size in args.sizes:
+        run(size, args.queries, args.k, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Simple RAG retrieval and answer path as the corpus grows.
+Generates synthetic corpora from the built-in DOCUMENTS (crops, places and figures swapped,
+sentences recombined within a category, categories drawn from a realistic mix), compiles
+each into a packed corpus and replays PREDEFINED_QUERIES plus a randomized query mix.
+
+For every corpus size it reports index build time and peak RSS, and per retrieval mode
+(legacy, bm25, hybrid) the p50/p99 latency and throughput of search and uncached chat, plus
+_categorize_query and generate_answer. Hybrid search uses random document embeddings and a
+hashing query encoder, so it measures the cost of dense retrieval, not its quality. Each
+size runs in a fresh process so peak RSS is per size.
+
+Usage: python3 benchmarks/bench_rag.py [--sizes 1000 10000 100000] [--queries 500]
+                                       [--output results.json] [--baseline previous.json]
+The 1M-document run (--sizes ... 1000000) needs roughly 6 GB of RAM and several minutes.
+"""
+
+import argparse
+import json
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from corpus_store import MappedCorpus, write_corpus  # noqa: E402
+from dense_index import DenseIndex, document_text, normalize_rows, text_hash  # noqa: E402
+from live_corpus import CorpusSnapshot  # noqa: E402
+from rag_index import tokenize  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from simple_rag_service import (DOCUMENTS, PREDEFINED_QUERIES, RETRIEVERS,  # noqa: E402
+                                SimpleRAGChatbot)
+
+# Share of each category in the synthetic corpus (disease and pest guides dominate real use)
+CATEGORY_MIX = {
+    "crop_disease": 0.30,
+    "pest_control": 0.20,
+    "fertilizers": 0.15,
+    "market_prices": 0.15,
+    "weather": 0.10,
+    "govt_schemes": 0.10,
+}
+CROPS = ["tomato", "rice", "paddy", "potato", "onion", "cotton", "grapes", "banana", "coconut", "pepper",
+         "cardamom", "rubber", "tapioca", "ginger", "turmeric", "brinjal", "okra", "chilli", "mango", "cashew"]
+PLACES = ["Kochi", "Palakkad", "Thrissur", "Kerala", "Ernakulam", "Aluva", "Kozhikode", "Kannur",
+          "Wayanad", "Idukki", "Kollam", "Alappuzha", "Kottayam", "Malappuram", "Coimbatore", "Mysuru"]
+CROP_PATTERN = re.compile(r"\b(tomato|rice|paddy|potato(?:es)?|onion|cotton|grapes)\b", re.IGNORECASE)
+PLACE_PATTERN = re.compile(r"\b(Kochi|Palakkad|Thrissur|Kerala|Ernakulam|Aluva|Maharashtra)\b")
+NUMBER_PATTERN = re.compile(r"\d+")
+QUERY_TEMPLATES = [
+    "{crop} leaves turning yellow with brown spots",
+    "what is the mandi price of {crop} in {place}",
+    "rain forecast for {place} this week",
+    "subsidy scheme for {crop} farmers in {place}",
+    "how much urea and potash for {crop}",
+    "organic spray for aphids on {crop}",
+    "{crop} {crop2} fertilizer schedule",
+]
+EMBEDDING_DIM = 384
+
+
+def synthetic_documents(size: int, rng: random.Random) -> List[Dict]:
+    """size documents rewritten from the built-in ones, categories drawn from CATEGORY_MIX"""
+    seeds: Dict[str, List[Dict]] = {}
+    for doc in DOCUMENTS:
+        seeds.setdefault(doc["category"], []).append(doc)
+    sentences = {category: [s for doc in docs for s in re.split(r"(?<=[.!?])\s+", doc["content"])]
+                 for category, docs in seeds.items()}
+    categories = rng.choices(list(CATEGORY_MIX), weights=list(CATEGORY_MIX.values()), k=size)
+
+    documents = []
+    for i, category in enumerate(categories):
+        seed = rng.choice(seeds[category])
+        crop, place = rng.choice(CROPS), rng.choice(PLACES)
+
+        def rewrite(text: str) -> str:
+            text = CROP_PATTERN.sub(lambda m: crop.capitalize() if m.group(0)[0].isupper() else crop, text)
+            text = PLACE_PATTERN.sub(place, text)
+            return NUMBER_PATTERN.sub(lambda m: str(max(1, int(m.group(0)) + rng.randint(-3, 3))), text)
+
+        extra = " ".join(rng.sample(sentences[category], min(2, len(sentences[category]))))
+        documents.append({
+            "id": f"synthetic/{i}",
+            "title": rewrite(seed["title"]),
+            "category": category,
+            "content": rewrite(f"{seed['content']} {extra}"),
+            "metadata": {},
+        })
+    return documents
+
+
+def query_mix(rng: random.Random, count: int) -> List[str]:
+    """PREDEFINED_QUERIES followed by count randomized template queries"""
+    queries = [q for questions in PREDEFINED_QUERIES.values() for q in questions]
+    for _ in range(count):
+        template = rng.choice(QUERY_TEMPLATES)
+        queries.append(template.format(crop=rng.choice(CROPS), crop2=rng.choice(CROPS), place=rng.choice(PLACES)))
+    return queries
+
+
+class HashingEncoder:
+    """Stand-in query encoder: sum of per-token random vectors, so hybrid search runs
+    without downloading a sentence-transformers model"""
+
+    ready = True
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._vectors: Dict[str, np.ndarray] = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._vectors.get(token)
+        if vector is None:
+            seed = int(text_hash(token), 16) % (2 ** 32)
+            vector = self._vectors[token] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def encode(self, query: str) -> np.ndarray:
+        tokens = tokenize(query) or [query]
+        return normalize_rows(np.sum([self._token_vector(t) for t in tokens], axis=0))
+
+
+def latency_stats(fn: Callable[[str], object], queries: Sequence[str]) -> Dict:
+    timings = []
+    start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    timings = np.array(timings) * 1000
+    return {
+        "n": len(queries),
+        "p50_ms": round(float(np.percentile(timings, 50)), 4),
+        "p99_ms": round(float(np.percentile(timings, 99)), 4),
+        "mean_ms": round(float(timings.mean()), 4),
+        "throughput_qps": round(len(queries) / total, 1),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def run_size(size: int, n_queries: int, top_k: int, seed: int) -> Dict:
+    """Build one synthetic corpus and time every retrieval mode against it"""
+    rng = random.Random(seed)
+    result = {"size": size, "build": {}}
+
+    start = time.perf_counter()
+    documents = synthetic_documents(size, rng)
+    result["build"]["generate_s"] = round(time.perf_counter() - start, 3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "corpus.bin"
+        start = time.perf_counter()
+        write_corpus(path, documents)
+        result["build"]["index_s"] = round(time.perf_counter() - start, 3)
+        result["build"]["corpus_mb"] = round(path.stat().st_size / 1e6, 1)
+
+        start = time.perf_counter()
+        corpus = MappedCorpus(path)
+        result["build"]["open_s"] = round(time.perf_counter() - start, 4)
+
+        # Random unit vectors stand in for --build-embeddings output
+        start = time.perf_counter()
+        np_rng = np.random.default_rng(seed)
+        embeddings = np.concatenate([
+            normalize_rows(np_rng.standard_normal((min(65536, size - i), EMBEDDING_DIM), dtype=np.float32))
+            for i in range(0, size, 65536)])
+        dense = DenseIndex(embeddings, [doc["id"] for doc in documents],
+                           [text_hash(document_text(doc)) for doc in documents], "hashing")
+        result["build"]["dense_s"] = round(time.perf_counter() - start, 3)
+        del documents
+
+        bot = SimpleRAGChatbot([])
+        bot._static_snapshot = CorpusSnapshot(corpus)
+        bot.dense, bot.query_encoder = dense, HashingEncoder()
+        bot.cache = ResponseCache(max_entries=0)  # time the full path, not cache hits
+        result["rss_after_build_mb"] = peak_rss_mb()
+
+        queries = query_mix(rng, n_queries)
+        for query in queries[:20]:  # warm the hashing encoder and dense view
+            bot.search(query, top_k, "hybrid")
+        result["categorize"] = latency_stats(bot._categorize_query, queries)
+        retrieved = {query: bot.search(query, top_k, "bm25") for query in queries}
+        result["generate_answer"] = latency_stats(lambda q: bot.generate_answer(q, retrieved[q]), queries)
+        result["modes"] = {
+            mode: {
+                "search": latency_stats(lambda q: bot.search(q, top_k, mode), queries),
+                "chat": latency_stats(lambda q: bot.chat(q, top_k=top_k, scorer=mode), queries),
+            }
+            for mode in RETRIEVERS
+        }
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_result(result: Dict):
+    build = result["build"]
+    print(f"{result['size']:>8} docs  index {build['index_s']:7.2f}s  dense {build['dense_s']:6.2f}s  "
+          f"peak RSS {result['peak_rss_mb']:8.1f} MB  categorize p50 {result['categorize']['p50_ms']:.3f} ms  "
+          f"generate_answer p50 {result['generate_answer']['p50_ms']:.3f} ms")
+    for mode, ops in result["modes"].items():
+        print("          " + "  ".join(
+            f"{mode:<6} {op:<6} p50 {s['p50_ms']:8.3f} ms  p99 {s['p99_ms']:8.3f} ms  {s['throughput_qps']:9.1f} q/s"
+            for op, s in ops.items()))
+
+
+def compare(results: List[Dict], baseline: Dict):
+    """Print p50/p99 changes against a previous run's JSON"""
+    previous = {r["size"]: r for r in baseline["results"]}
+    print(f"\nChange vs {baseline['meta']['commit']} (positive = slower):")
+    for result in results:
+        before = previous.get(result["size"])
+        if before is None:
+            continue
+        for mode, ops in result["modes"].items():
+            for op, stats in ops.items():
+                old = before.get("modes", {}).get(mode, {}).get(op)
+                if old:
+                    print(f"{result['size']:>8} docs  {mode:<6} {op:<6} "
+                          f"p50 {stats['p50_ms'] / old['p50_ms'] - 1:+7.1%}  "
+                          f"p99 {stats['p99_ms'] / old['p99_ms'] - 1:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=500, help="random queries on top of the predefined ones")
+    parser.add_argument("-k", "--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None,
+                        help="JSON results file (default benchmarks/results/bench_rag-<commit>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    for size in args.sizes:
+        # A fresh process per size keeps peak RSS from carrying over between sizes
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_size, size, args.queries, args.top_k, args.seed).result()
+        print_result(result)
+        results.append(result)
+
+    output = args.output or ROOT / "benchmarks" / "results" / f"bench_rag-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "meta": {
+            "benchmark": "bench_rag",
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {"sizes": args.sizes, "queries": args.queries, "top_k": args.top_k, "seed": args.seed},
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency check of the ViT inference backends against eager fp32.
+Runs every image in a local sample directory through each backend and reports top-1
+agreement with the fp32 labels, the largest probability difference and ms/image.
+Exits non-zero if any backend agrees on fewer than --min-agreement of the images.
+
+Usage: python3 benchmarks/check_vit_backend.py --images DIR [--backends int8 onnx-int8 ...]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from transformers import ViTImageProcessor  # noqa: E402
+
+from image_preprocess import init_worker, preprocess_image  # noqa: E402
+from vit_inference import BACKENDS, MIN_AGREEMENT, ViTClassifier, load_sample_batches, softmax  # noqa: E402
+
+MODEL_NAME = "wambugu71/crop_leaf_diseases_vit"
+
+
+def time_per_image(classifier: ViTClassifier, batches) -> float:
+    classifier.logits(batches[0])  # warm-up (torch.compile, ORT allocations)
+    start = time.perf_counter()
+    images = 0
+    for batch in batches:
+        classifier.logits(batch)
+        images += len(batch)
+    return (time.perf_counter() - start) * 1000 / images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, required=True, help="directory of sample leaf photos")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx", "onnx-int8"], choices=BACKENDS)
+    parser.add_argument("--revision", default="main")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="use at most this many images")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    args = parser.parse_args()
+
+    init_worker(ViTImageProcessor.from_pretrained(MODEL_NAME, revision=args.revision))
+    batches = load_sample_batches(args.images, lambda data: preprocess_image(data).pixel_values,
+                                  args.batch_size, args.limit)
+    if not batches:
+        raise SystemExit(f"No images found in {args.images}")
+    n_images = sum(len(batch) for batch in batches)
+
+    reference = ViTClassifier(MODEL_NAME, args.revision, "eager")
+    expected = [softmax(reference.logits(batch)) for batch in batches]
+    print(f"{n_images} images, eager fp32 {time_per_image(reference, batches):7.2f} ms/image")
+
+    failed = []
+    for backend in args.backends:
+        classifier = ViTClassifier(MODEL_NAME, args.revision, backend)
+        matches = 0
+        max_diff = 0.0
+        for batch, probabilities in zip(batches, expected):
+            actual = softmax(classifier.logits(batch))
+            matches += int((actual.argmax(axis=-1) == probabilities.argmax(axis=-1)).sum())
+            max_diff = max(max_diff, float(abs(actual - probabilities).max()))
+        agreement = matches / n_images
+        ms = time_per_image(classifier, batches)
+        print(f"{backend:<12} top-1 agreement {agreement:7.2%}  max prob diff {max_diff:.4f}  {ms:7.2f} ms/image")
+        if agreement < args.min_agreement:
+            failed.append(backend)
+
+    if failed:
+        raise SystemExit(f"Below {args.min_agreement:.0%} top-1 agreement: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
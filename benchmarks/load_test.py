@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the stack run.sh starts: the Simple RAG service, the ML service and
+Gemini, with local stand-ins so no model download or API key is needed.
+
+- The ML service runs with a deterministic stub classifier in place of the ViT model. Its
+  logits come from pixel statistics, and each forward pass sleeps for a configurable per-batch
+  and per-image cost. Decoding, preprocessing, micro-batching and caching stay real.
+- A fake Gemini endpoint answers generateContent with configurable latency and a 429 rate.
+- Traffic follows the chat UI: chat messages go to the RAG service; leaf images go to the ML
+  service, and low-confidence results (below the UI's 0.9 threshold) are followed by a Gemini
+  call. Requests arrive open-loop (Poisson) at each offered rate in --rates.
+
+For every rate it reports per-endpoint throughput, p50/p95/p99 latency and error rate, then
+the saturation throughput: the highest offered rate every endpoint kept up with inside the
+error and p99 budgets.
+
+Usage:
+    python3 benchmarks/load_test.py [--rates 5 10 20 40] [--duration 20] [--image-share 0.3]
+    python3 benchmarks/load_test.py --in-process          # services in this process, for a quick check
+    python3 benchmarks/load_test.py --next-url http://localhost:3000
+        # chat and Gemini calls through the Next.js API routes; start Next with
+        # GEMINI_API_BASE=http://127.0.0.1:18002 GEMINI_API_KEY=fake RAG_SERVICE_URL=http://127.0.0.1:18000
+
+Requires httpx (pip install httpx).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Labels of wambugu71/crop_leaf_diseases_vit
+LABELS = ["Corn___Common_Rust", "Corn___Gray_Leaf_Spot", "Corn___Healthy", "Corn___Northern_Leaf_Blight",
+          "Potato___Early_Blight", "Potato___Healthy", "Potato___Late_Blight", "Rice___Brown_Spot",
+          "Rice___Healthy", "Rice___Leaf_Blast", "Wheat___Brown_Rust", "Wheat___Healthy", "Wheat___Yellow_Rust"]
+# ai-chat.tsx skips Gemini when the local model is at least this confident
+LOCAL_CONFIDENCE_THRESHOLD = 0.9
+GEMINI_PATH = "/v1/models/gemini-2.5-flash:generateContent"
+CHAT_QUERIES = ["{crop} leaves turning yellow with brown spots", "mandi price of {crop} in Kochi today",
+                "rain forecast for my village this week", "subsidy for drip irrigation on {crop}",
+                "how much urea and DAP per acre for {crop}", "neem spray for aphids on {crop}"]
+CROPS = ["tomato", "rice", "paddy", "potato", "onion", "cotton", "banana", "coconut", "pepper", "chilli"]
+ROLES = ("rag", "ml", "gemini")
+
+
+class StubProcessor:
+    """Stand-in for ViTImageProcessor: 224x224 resize and [-1, 1] normalisation"""
+
+    size = {"height": 224, "width": 224}
+
+    def __call__(self, images, return_tensors: str = "np") -> Dict:
+        image = images.convert("RGB").resize((224, 224))
+        pixel_values = np.asarray(image, dtype=np.float32) / 127.5 - 1.0
+        return {"pixel_values": np.ascontiguousarray(pixel_values.transpose(2, 0, 1)[None])}
+
+
+class StubClassifier:
+    """Deterministic stand-in for the ViT classifier with a simulated forward-pass cost.
+
+    Logits are a fixed projection of per-channel pixel mean and spread, so the same image
+    always gets the same label and confidences vary across images.
+    """
+
+    revision = "stub"
+    backend = "stub"
+
+    def __init__(self, batch_ms: float, image_ms: float, seed: int = 0):
+        self.batch_ms = batch_ms
+        self.image_ms = image_ms
+        self.id2label = dict(enumerate(LABELS))
+        self.weights = np.random.default_rng(seed).standard_normal((6, len(LABELS))).astype(np.float32) * 6
+
+    def logits(self, pixel_values: np.ndarray) -> np.ndarray:
+        time.sleep((self.batch_ms + self.image_ms * len(pixel_values)) / 1000)
+        features = np.concatenate([pixel_values.mean(axis=(2, 3)), pixel_values.std(axis=(2, 3))], axis=1)
+        return features @ self.weights
+
+
+def gemini_app(latency_ms: float, error_rate: float, seed: int = 0):
+    """Fake Gemini generateContent endpoint"""
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "alive"}
+
+    @app.post("/v1/models/{model}:generateContent")
+    async def generate_content(model: str):
+        # Log-normal around latency_ms, like a remote model's long tail
+        await asyncio.sleep(latency_ms / 1000 * rng.lognormvariate(0, 0.35))
+        if rng.random() < error_rate:
+            return JSONResponse({"error": {"code": 429, "message": "Resource exhausted"}}, status_code=429)
+        text = f"Diagnostic report from {model}: remove affected leaves and apply a copper fungicide."
+        return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+    return app
+
+
+def create_app(role: str, args):
+    """The FastAPI app for one role, with stand-ins installed"""
+    if role == "rag":
+        from simple_rag_service import app
+        return app
+    if role == "ml":
+        # Process pool workers would load the real processor, so keep preprocessing in threads
+        os.environ["ML_PREPROCESS_POOL"] = "thread"
+        import ml_service
+        ml_service.loader = ml_service.create_loader(
+            StubProcessor, lambda: StubClassifier(args.ml_batch_ms, args.ml_image_ms, args.seed))
+        return ml_service.app
+    return gemini_app(args.gemini_latency_ms, args.gemini_error_rate, args.seed)
+
+
+def serve(role: str, port: int, args):
+    import uvicorn
+    uvicorn.run(create_app(role, args), host="127.0.0.1", port=port, log_level="warning")
+
+
+def stub_args(args) -> List[str]:
+    return ["--ml-batch-ms", str(args.ml_batch_ms), "--ml-image-ms", str(args.ml_image_ms),
+            "--gemini-latency-ms", str(args.gemini_latency_ms),
+            "--gemini-error-rate", str(args.gemini_error_rate), "--seed", str(args.seed)]
+
+
+def start_services(args) -> Dict[str, str]:
+    """Start every role not given an external URL; returns role -> base URL"""
+    urls = {"rag": args.rag_url, "ml": args.ml_url, "gemini": args.gemini_url}
+    for offset, role in enumerate(ROLES):
+        if urls[role]:
+            continue
+        port = args.base_port + offset
+        urls[role] = f"http://127.0.0.1:{port}"
+        if args.in_process:
+            import uvicorn
+            server = uvicorn.Server(uvicorn.Config(create_app(role, args), host="127.0.0.1", port=port,
+                                                   log_level="warning"))
+            threading.Thread(target=server.run, name=f"load-test-{role}", daemon=True).start()
+        else:
+            process = subprocess.Popen([sys.executable, __file__, "--serve", role, "--port", str(port),
+                                        *stub_args(args)], cwd=ROOT)
+            args.processes.append(process)
+    return urls
+
+
+async def wait_ready(client, urls: Dict[str, str], timeout: float = 120):
+    """Poll each service until it answers (the ML service until /readyz says ready)"""
+    probes = {"rag": "/", "ml": "/readyz", "gemini": "/healthz"}
+    deadline = time.monotonic() + timeout
+    for role, url in urls.items():
+        while True:
+            try:
+                if (await client.get(url + probes[role])).status_code == 200:
+                    break
+            except Exception:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{role} service at {url} did not become ready")
+            await asyncio.sleep(0.25)
+
+
+def leaf_images(count: int, seed: int) -> List[bytes]:
+    """Distinct leaf-coloured noise JPEGs, so the prediction cache does not serve most uploads"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        base = rng.uniform([20, 80, 10], [140, 200, 90])
+        pixels = np.clip(base + rng.normal(0, 40, (480, 640, 3)), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, wall: float) -> Dict:
+        report = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            ms = np.array(latencies) * 1000
+            errors = self.errors[endpoint]
+            report[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": round(errors / len(latencies), 4),
+                "throughput_rps": round((len(latencies) - errors) / wall, 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1),
+                "p99_ms": round(float(np.percentile(ms, 99)), 1),
+            }
+        return report
+
+
+async def timed(client, recorder: Recorder, endpoint: str, method: str, url: str, **kwargs):
+    """Send one request; any exception or 4xx/5xx counts as an error. Returns the response or None"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except Exception:
+        response, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    return response if ok else None
+
+
+async def chat_flow(client, recorder: Recorder, urls: Dict[str, str], rng: random.Random):
+    query = rng.choice(CHAT_QUERIES).format(crop=rng.choice(CROPS))
+    if urls.get("next"):
+        await timed(client, recorder, "next /api/rag-chatbot", "POST", urls["next"] + "/api/rag-chatbot",
+                    json={"query": query, "language": "en"})
+    else:
+        await timed(client, recorder, "rag /rag-chatbot", "POST", urls["rag"] + "/rag-chatbot",
+                    json={"query": query, "language": "en"})
+
+
+async def image_flow(client, recorder: Recorder, urls: Dict[str, str], rng: random.Random, images: List[bytes]):
+    """Upload a leaf photo; like the UI, ask Gemini when the local model is not confident"""
+    start = time.perf_counter()
+    response = await timed(client, recorder, "ml /predict", "POST", urls["ml"] + "/predict",
+                           content=rng.choice(images), headers={"Content-Type": "image/jpeg"})
+    ok = response is not None
+    if ok:
+        prediction = response.json()
+        ok = prediction.get("status") == "success"
+        if not ok:
+            recorder.errors["ml /predict"] += 1
+        elif prediction["confidence"] < LOCAL_CONFIDENCE_THRESHOLD:
+            prompt = f"Provide a diagnostic report for this leaf (local model: {prediction['label']})."
+            if urls.get("next"):
+                reply = await timed(client, recorder, "next /api/gemini", "POST", urls["next"] + "/api/gemini",
+                                    json={"prompt": prompt})
+            else:
+                reply = await timed(client, recorder, "gemini generateContent", "POST",
+                                    urls["gemini"] + GEMINI_PATH + "?key=fake",
+                                    json={"contents": [{"parts": [{"text": prompt}]}]})
+            ok = reply is not None
+    recorder.record("image flow (end to end)", time.perf_counter() - start, ok)
+
+
+async def run_stage(client, urls: Dict[str, str], rate: float, args, images: List[bytes],
+                    rng: random.Random) -> Dict:
+    """Offer rate requests/s (Poisson arrivals) for args.duration seconds, then drain"""
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    tasks = []
+    start = loop.time()
+    offset = 0.0
+    while True:
+        offset += rng.expovariate(rate)
+        if offset >= args.duration:
+            break
+        await asyncio.sleep(max(0.0, start + offset - loop.time()))
+        if rng.random() < args.image_share:
+            tasks.append(asyncio.create_task(image_flow(client, recorder, urls, rng, images)))
+        else:
+            tasks.append(asyncio.create_task(chat_flow(client, recorder, urls, rng)))
+    await asyncio.gather(*tasks)
+    wall = loop.time() - start
+    endpoints = recorder.summary(wall)
+    offered = len(tasks) / args.duration
+    completed = sum(s["requests"] - s["errors"] for name, s in endpoints.items()
+                    if name in ("rag /rag-chatbot", "next /api/rag-chatbot", "image flow (end to end)"))
+    keeping_up = all(s["error_rate"] <= args.max_error_rate and s["p99_ms"] <= args.slo_ms
+                     for s in endpoints.values()) and completed / wall >= 0.95 * offered
+    return {"offered_rps": round(offered, 2), "achieved_rps": round(completed / wall, 2),
+            "wall_s": round(wall, 2), "keeping_up": keeping_up, "endpoints": endpoints}
+
+
+def print_stage(stage: Dict):
+    print(f"offered {stage['offered_rps']:7.2f} req/s  achieved {stage['achieved_rps']:7.2f} req/s  "
+          f"{'ok' if stage['keeping_up'] else 'SATURATED'}")
+    for endpoint, s in stage["endpoints"].items():
+        print(f"    {endpoint:<26} {s['requests']:>6} req  {s['throughput_rps']:7.2f} ok/s  "
+              f"p50 {s['p50_ms']:8.1f}  p95 {s['p95_ms']:8.1f}  p99 {s['p99_ms']:8.1f} ms  "
+              f"errors {s['error_rate']:6.2%}")
+
+
+async def drive(args) -> Dict:
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("The load test needs httpx: pip install httpx")
+
+    urls = start_services(args)
+    if args.next_url:
+        urls["next"] = args.next_url
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        await wait_ready(client, {role: urls[role] for role in ROLES})
+        images = leaf_images(args.images, args.seed)
+        rng = random.Random(args.seed)
+        stages = []
+        for rate in args.rates:
+            stage = await run_stage(client, urls, rate, args, images, rng)
+            print_stage(stage)
+            stages.append(stage)
+
+    sustained = [stage["offered_rps"] for stage in stages if stage["keeping_up"]]
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("processes", "output")},
+        "stages": stages,
+        "saturation_rps": max(sustained) if sustained else None,
+        "peak_achieved_rps": max(stage["achieved_rps"] for stage in stages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rates", type=float, nargs="+", default=[5, 10, 20, 40],
+                        help="offered user requests per second, one stage each")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per stage")
+    parser.add_argument("--image-share", type=float, default=0.3, help="share of requests that upload an image")
+    parser.add_argument("--images", type=int, default=200, help="distinct images to upload")
+    parser.add_argument("--slo-ms", type=float, default=2000, help="p99 budget per endpoint")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-connections", type=int, default=256)
+    parser.add_argument("--in-process", action="store_true", help="run the services on threads of this process")
+    parser.add_argument("--base-port", type=int, default=18000, help="rag, ml and gemini use this port and the next two")
+    parser.add_argument("--rag-url", help="use a running RAG service instead of starting one")
+    parser.add_argument("--ml-url", help="use a running ML service instead of starting one")
+    parser.add_argument("--gemini-url", help="use a running Gemini stand-in instead of starting one")
+    parser.add_argument("--next-url", help="send chat and Gemini calls through the Next.js API routes")
+    parser.add_argument("--ml-batch-ms", type=float, default=20, help="stub forward pass: fixed cost per batch")
+    parser.add_argument("--ml-image-ms", type=float, default=15, help="stub forward pass: cost per image")
+    parser.add_argument("--gemini-latency-ms", type=float, default=1500)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="share of Gemini calls answered 429")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    parser.add_argument("--serve", choices=ROLES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args)
+        return
+
+    args.processes = []
+    try:
+        report = asyncio.run(drive(args))
+    finally:
+        for process in args.processes:
+            process.terminate()
+        for process in args.processes:
+            process.wait()
+
+    print(f"Saturation throughput: {report['saturation_rps']} req/s "
+          f"(peak achieved {report['peak_achieved_rps']} req/s)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
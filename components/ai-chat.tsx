@@ -38,6 +38,9 @@ const enhancedResponses = {
   ],
 }
 
+// Local leaf-disease predictions at or above this confidence skip the Gemini diagnosis
+const LOCAL_CONFIDENCE_THRESHOLD = 0.9
+
 const topicResponses = {
   market_prices:
     "📈 **Current Market Rates:** \n\n**Rice:** ₹2,100/quintal (+5.2%) \n**Wheat:** ₹2,050/quintal (+2.1%) \n**Corn:** ₹1,800/quintal (-1.5%) \n**Sugarcane:** ₹350/quintal (+3.8%) \n\n**Trend Analysis:** Rice prices expected to remain stable this week. Good time to sell!",
@@ -527,10 +530,11 @@ Give an extremely detailed, comprehensive, conversational, and helpful response
           // 1. Try Local ML prediction first
           let localPrediction = null;
           try {
+            // Send the raw file; base64 JSON is a third larger on the wire
             const mlRes = await fetch("http://localhost:8001/predict", {
                method: "POST",
-               headers: { "Content-Type": "application/json" },
-               body: JSON.stringify({ image: url }),
+               headers: { "Content-Type": file.type || "application/octet-stream" },
+               body: file,
             });
             if (mlRes.ok) {
               localPrediction = await mlRes.json();
@@ -539,13 +543,27 @@ Give an extremely detailed, comprehensive, conversational, and helpful response
             console.warn("Local ml_service not available, falling back to Gemini.");
           }
 
-          // 2. Decide: Use local result or fallback to Gemini
-          // Fail back if no local ml, error status, or low confidence (< 0.7)
-          // 2. Decide: Always show Gemini analysis as requested by user, but show Local ML as a quick preview
+          // 2. Decide: a confident local diagnosis is shown on its own; otherwise show it
+          // as a quick preview and ask Gemini for the full expert report
+          const localConfidence = localPrediction?.calibrated_confidence ?? localPrediction?.confidence ?? 0
+          if (localPrediction?.status === "success" && localConfidence >= LOCAL_CONFIDENCE_THRESHOLD) {
+            const alternatives = (localPrediction.top_k || []).slice(1)
+              .map((p: any) => `${p.crop} – ${p.disease} (${Math.round(p.confidence * 100)}%)`)
+              .join(", ")
+            setMessages((prev) => [...prev, {
+              id: (Date.now() + 1).toString(),
+              type: "ai",
+              content: `🌱 **Local Analysis**: ${localPrediction.crop} – ${localPrediction.disease} (${Math.round(localConfidence * 100)}% confidence)` +
+                (alternatives ? `\n\nOther possibilities: ${alternatives}` : ""),
+              timestamp: new Date(),
+            }])
+            return
+          }
+
           setMessages((prev) => [...prev, {
             id: (Date.now() + 1).toString(),
             type: "ai",
-            content: `🌱 **Local Analysis**: ${localPrediction?.label?.replace(/_/g, ' ') || "Analyzing..."} (${Math.round((localPrediction?.confidence || 0) * 100)}% confidence)\n\n**Requesting full expert diagnosis from Gemini...**`,
+            content: `🌱 **Local Analysis**: ${localPrediction?.label?.replace(/_/g, ' ') || "Analyzing..."} (${Math.round(localConfidence * 100)}% confidence)\n\n**Requesting full expert diagnosis from Gemini...**`,
             timestamp: new Date(),
           }])
 
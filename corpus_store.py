@@ -0,0 +1,391 @@
+"""
+AgriMithra packed corpus store
+Compiles the knowledge_base/ category directories into one on-disk file holding the
+document text, titles, categories, offsets and the keyword search index. Workers
+memory-map the file, so opening it costs O(1) in corpus size and the pages are shared
+between processes through the OS page cache.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from rag_index import FIELDS, InvertedIndex, IndexLookupMixin
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AGRIKB01"
+FORMAT_VERSION = 3
+CORPUS_FILENAME = "corpus.bin"
+BUILTIN_PREFIX = "builtin"
+ALIGNMENT = 8
+
+
+def load_document_file(path: Path) -> List[Dict]:
+    """Read the document(s) in one <category>/<name>.json file.
+
+    Each document gets a stable id: "<category dir>/<file stem>", with a "#<n>" suffix
+    when the file holds a list of documents.
+    """
+    category = path.parent.name
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    documents = []
+    # A file may hold a single document or a list of documents
+    items = data if isinstance(data, list) else [data]
+    for i, doc in enumerate(items):
+        if not isinstance(doc, dict) or not doc.get("title") or not doc.get("content"):
+            logger.warning(f"Skipping document without title/content in {path}")
+            continue
+        documents.append({
+            "id": f"{category}/{path.stem}" + (f"#{i}" if isinstance(data, list) else ""),
+            "title": str(doc["title"]),
+            "category": str(doc.get("category") or category),
+            "content": str(doc["content"]),
+            "metadata": doc.get("metadata") or {},
+        })
+    return documents
+
+
+def load_knowledge_dir(knowledge_dir: Path) -> List[Dict]:
+    """Read every <category>/*.json document under knowledge_dir"""
+    documents = []
+    if not knowledge_dir.is_dir():
+        return documents
+
+    for category_dir in sorted(p for p in knowledge_dir.iterdir() if p.is_dir()):
+        for path in sorted(category_dir.glob("*.json")):
+            try:
+                documents.extend(load_document_file(path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable document {path}: {e}")
+    return documents
+
+
+def seed_document_id(position: int) -> str:
+    """Stable id of a built-in (in-code) document"""
+    return f"{BUILTIN_PREFIX}/{position}"
+
+
+def seed_hash(seed_documents: Sequence[Dict]) -> str:
+    """Content hash of the built-in seed documents"""
+    return hashlib.sha256(
+        json.dumps(list(seed_documents), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def source_manifest(knowledge_dir: Path, seed_documents: Sequence[Dict]) -> Dict:
+    """Cheap fingerprint of the corpus sources used to detect a stale compiled file.
+
+    Records the seed documents' hash and each document file's mtime and size, so added,
+    removed and edited files are all caught with one stat per file and no reads.
+    """
+    files = {}
+    if knowledge_dir.is_dir():
+        for category_dir in sorted(p for p in knowledge_dir.iterdir() if p.is_dir()):
+            for path in sorted(category_dir.glob("*.json")):
+                st = path.stat()
+                files[f"{category_dir.name}/{path.name}"] = [st.st_mtime_ns, st.st_size]
+    return {"seed_hash": seed_hash(seed_documents), "files": files}
+
+
+class _SectionWriter:
+    """Accumulates aligned binary sections and their offsets"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.sections: Dict[str, List] = {}
+
+    def add(self, name: str, data, typecode: str = "B"):
+        payload = data.tobytes() if isinstance(data, array) else bytes(data)
+        padding = (-self.size) % ALIGNMENT
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+        self.sections[name] = [self.size, len(payload), typecode]
+        self.chunks.append(payload)
+        self.size += len(payload)
+
+    def add_strings(self, name: str, strings, offset_type: str = "Q"):
+        """Store strings as one UTF-8 blob plus an offsets array"""
+        offsets = array(offset_type, [0])
+        blob = bytearray()
+        for text in strings:
+            blob += text.encode("utf-8")
+            offsets.append(len(blob))
+        self.add(f"{name}.offsets", offsets, offset_type)
+        self.add(f"{name}.text", blob)
+
+
+def write_corpus(path: Path, documents: List[Dict], manifest: Optional[Dict] = None) -> Path:
+    """Index documents and write them to a packed corpus file (atomic replace)"""
+    index = InvertedIndex(documents)
+    categories = sorted({doc.get("category", "general") for doc in documents})
+    category_ids = {category: i for i, category in enumerate(categories)}
+
+    writer = _SectionWriter()
+    writer.add_strings("doc.id", (doc["id"] for doc in documents))
+    writer.add_strings("doc.title", (doc["title"] for doc in documents))
+    writer.add_strings("doc.content", (doc["content"] for doc in documents))
+    writer.add_strings("doc.metadata", (json.dumps(doc.get("metadata") or {}, ensure_ascii=False)
+                                        for doc in documents))
+    writer.add("doc.category", array("H", (category_ids[doc.get("category", "general")]
+                                          for doc in documents)), "H")
+
+    writer.add_strings("terms", index.vocabulary)
+    writer.add("terms.doc_freqs", index.doc_freqs, "I")
+    writer.add("terms.idf", index.idf, "f")
+
+    for field in FIELDS:
+        offsets = array("Q", [0])
+        doc_ids = array("I")
+        tfs = array("H")
+        for term in index.vocabulary:
+            term_docs, term_tfs = index.lookup_tf(field, term)
+            doc_ids.extend(term_docs)
+            tfs.extend(term_tfs)
+            offsets.append(len(doc_ids))
+        writer.add(f"{field}.postings.offsets", offsets, "Q")
+        writer.add(f"{field}.postings.docs", doc_ids, "I")
+        writer.add(f"{field}.postings.tfs", tfs, "H")
+        writer.add(f"{field}.lengths", index.field_lengths[field], "I")
+        writer.add(f"{field}.norms", index.length_norms[field], "f")
+
+    # Raw tokens and their trigrams answer the legacy scorer's substring matches
+    writer.add_strings("raw", index.raw_vocabulary)
+    for field in FIELDS:
+        offsets = array("Q", [0])
+        doc_ids = array("I")
+        for token in index.raw_vocabulary:
+            doc_ids.extend(index.raw_lookup(field, token))
+            offsets.append(len(doc_ids))
+        writer.add(f"{field}.raw.offsets", offsets, "Q")
+        writer.add(f"{field}.raw.docs", doc_ids, "I")
+    trigram_list = sorted(index.trigram_table)
+    writer.add_strings("trigrams", trigram_list)
+    offsets = array("Q", [0])
+    term_ids = array("I")
+    for trigram in trigram_list:
+        term_ids.extend(index.trigram_table[trigram])
+        offsets.append(len(term_ids))
+    writer.add("trigrams.term_offsets", offsets, "Q")
+    writer.add("trigrams.term_ids", term_ids, "I")
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "num_docs": len(documents),
+        "num_terms": len(index.vocabulary),
+        "categories": categories,
+        "category_counts": dict(Counter(doc.get("category", "general") for doc in documents)),
+        "manifest": manifest or {},
+        "sections": writer.sections,
+    }).encode("utf-8")
+    header += b" " * ((-(len(MAGIC) + 4 + len(header))) % ALIGNMENT)
+    base = len(MAGIC) + 4 + len(header)
+
+    # Section offsets are relative to the end of the header
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        assert f.tell() == base
+        for chunk in writer.chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    logger.info(f"Compiled {len(documents)} documents and {len(index.vocabulary)} terms into {path}")
+    return path
+
+
+class _StringTable(Sequence):
+    """Lazily decoded view of a strings section"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class _TermIds:
+    """term -> term id lookup by binary search over the sorted mapped vocabulary"""
+
+    def __init__(self, vocabulary: _StringTable):
+        self.vocabulary = vocabulary
+
+    def get(self, term: str, default=None):
+        i = bisect_left(self.vocabulary, term)
+        if i < len(self.vocabulary) and self.vocabulary[i] == term:
+            return i
+        return default
+
+    def __contains__(self, term: str):
+        return self.get(term) is not None
+
+
+class _MappedDocuments(Sequence):
+    """Documents decoded on access from the mapped text sections"""
+
+    def __init__(self, store: "MappedCorpus"):
+        self.ids = store._strings("doc.id")
+        self.titles = store._strings("doc.title")
+        self.contents = store._strings("doc.content")
+        self.metadata = store._strings("doc.metadata")
+        self.category_ids = store._array("doc.category")
+        self.categories = store.header["categories"]
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, doc_id):
+        if isinstance(doc_id, slice):
+            return [self[i] for i in range(*doc_id.indices(len(self)))]
+        return {
+            "id": self.ids[doc_id],
+            "title": self.titles[doc_id],
+            "category": self.categories[self.category_ids[doc_id]],
+            "content": self.contents[doc_id],
+            "metadata": json.loads(self.metadata[doc_id]),
+        }
+
+
+class MappedCorpus(IndexLookupMixin):
+    """Read-only corpus and keyword index backed by a memory-mapped corpus file.
+
+    Exposes the same lookup interface as rag_index.InvertedIndex so the scorers can use
+    either one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} is not an AgriMithra corpus file")
+        header_len = int.from_bytes(buf[len(MAGIC):len(MAGIC) + 4], "little")
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(bytes(buf[header_start:header_start + header_len]))
+        if self.header.get("version") != FORMAT_VERSION or self.header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{self.path} was written by an incompatible version or platform")
+        self._data = buf[header_start + header_len:]
+
+        self.num_docs = self.header["num_docs"]
+        self.manifest = self.header.get("manifest", {})
+        self.category_counts = self.header.get("category_counts", {})
+        self.vocabulary = self._strings("terms")
+        self.term_ids = _TermIds(self.vocabulary)
+        self.doc_freqs = self._array("terms.doc_freqs")
+        self.idf = self._array("terms.idf")
+        self.field_lengths = {field: self._array(f"{field}.lengths") for field in FIELDS}
+        self.length_norms = {field: self._array(f"{field}.norms") for field in FIELDS}
+        self._postings = {
+            field: (self._array(f"{field}.postings.offsets"),
+                    self._array(f"{field}.postings.docs"),
+                    self._array(f"{field}.postings.tfs"))
+            for field in FIELDS
+        }
+        self.documents = _MappedDocuments(self)
+        self._field_texts = {"title": self.documents.titles, "content": self.documents.contents}
+
+        self.raw_vocabulary = self._strings("raw")
+        self._raw_ids = _TermIds(self.raw_vocabulary)
+        self._raw_postings = {field: (self._array(f"{field}.raw.offsets"), self._array(f"{field}.raw.docs"))
+                              for field in FIELDS}
+        self._trigram_ids = _TermIds(self._strings("trigrams"))
+        self._trigram_terms = (self._array("trigrams.term_offsets"), self._array("trigrams.term_ids"))
+
+    def _array(self, name: str) -> memoryview:
+        offset, length, typecode = self.header["sections"][name]
+        return self._data[offset:offset + length].cast(typecode)
+
+    def _strings(self, name: str) -> _StringTable:
+        return _StringTable(self._array(f"{name}.offsets"), self._array(f"{name}.text"))
+
+    def lookup_tf(self, field: str, term: str):
+        """Return the doc ids and matching term frequencies for term in field"""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return _EMPTY, _EMPTY
+        offsets, docs, tfs = self._postings[field]
+        start, end = offsets[term_id], offsets[term_id + 1]
+        return docs[start:end], tfs[start:end]
+
+    def lookup(self, field: str, term: str):
+        """Return the doc ids containing term in field (ascending)"""
+        return self.lookup_tf(field, term)[0]
+
+    def raw_lookup(self, field: str, token: str):
+        """Return the doc ids whose field contains the raw lowercased token"""
+        token_id = self._raw_ids.get(token)
+        if token_id is None:
+            return _EMPTY
+        offsets, docs = self._raw_postings[field]
+        return docs[offsets[token_id]:offsets[token_id + 1]]
+
+    def trigram_terms(self, trigram: str):
+        """Return the raw token ids containing trigram"""
+        trigram_id = self._trigram_ids.get(trigram)
+        if trigram_id is None:
+            return _EMPTY
+        offsets, term_ids = self._trigram_terms
+        return term_ids[offsets[trigram_id]:offsets[trigram_id + 1]]
+
+    def field_text(self, field: str, doc_id: int) -> str:
+        """Return the original text of a document field"""
+        return self._field_texts[field][doc_id]
+
+
+_EMPTY = memoryview(b"").cast("I")
+
+
+class MemoryCorpus(InvertedIndex):
+    """In-memory corpus with the MappedCorpus interface, for ad-hoc document lists"""
+
+    def __init__(self, documents: List[Dict]):
+        super().__init__(documents)
+        self.documents = documents
+        self.category_counts = dict(Counter(doc.get("category", "general") for doc in documents))
+
+
+def build_corpus(path: Path, knowledge_dir: Path, seed_documents: Sequence[Dict]) -> Path:
+    """Compile the seed documents plus knowledge_dir into a packed corpus file"""
+    documents = [dict(doc, id=seed_document_id(i), metadata=doc.get("metadata") or {})
+                 for i, doc in enumerate(seed_documents)]
+    documents.extend(load_knowledge_dir(knowledge_dir))
+    return write_corpus(path, documents, source_manifest(knowledge_dir, seed_documents))
+
+
+def open_corpus(path: Path, knowledge_dir: Path, seed_documents: Sequence[Dict],
+                rebuild: bool = False) -> MappedCorpus:
+    """Map the compiled corpus, recompiling it first if missing or stale"""
+    if not rebuild and path.exists():
+        try:
+            corpus = MappedCorpus(path)
+            if corpus.manifest == source_manifest(knowledge_dir, seed_documents):
+                return corpus
+            logger.info(f"Corpus file {path} is stale, recompiling...")
+        except ValueError as e:
+            logger.warning(f"Ignoring corpus file {path}: {e}")
+
+    build_corpus(path, knowledge_dir, seed_documents)
+    return MappedCorpus(path)
@@ -0,0 +1,256 @@
+"""
+AgriMithra dense document index
+Semantic side of the Simple RAG service's hybrid retrieval. Document embeddings are
+computed offline (python3 simple_rag_service.py --build-embeddings) and memory-mapped at
+startup; queries are scored with one NumPy matrix-vector product (or faiss, if installed).
+Only the query encoder needs an embedding model, and it loads in the background.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILENAME = "doc_embeddings.npy"
+MANIFEST_FILENAME = "doc_embeddings.json"
+EMBEDDING_MODEL = os.environ.get("RAG_EMBEDDING_MODEL",
+                                 "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+
+def document_text(doc: Dict) -> str:
+    """Text embedded for a document"""
+    return f"{doc['title']}. {doc['content']}"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, so inner product is cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def build_document_embeddings(knowledge_dir: Path, documents: Sequence[Dict],
+                              encode: Callable[[List[str]], np.ndarray], model_name: str = EMBEDDING_MODEL,
+                              batch_size: int = 64):
+    """Encode every document and write knowledge_dir/doc_embeddings.npy and its manifest"""
+    texts = [document_text(doc) for doc in documents]
+    batches = [normalize_rows(encode(texts[i:i + batch_size])) for i in range(0, len(texts), batch_size)]
+    embeddings = np.concatenate(batches) if batches else np.zeros((0, 0), np.float32)
+
+    tmp_embeddings = knowledge_dir / (EMBEDDINGS_FILENAME + ".tmp")
+    with open(tmp_embeddings, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_embeddings, knowledge_dir / EMBEDDINGS_FILENAME)
+
+    manifest = {
+        "model": model_name,
+        "ids": [doc["id"] for doc in documents],
+        "hashes": [text_hash(text) for text in texts],
+    }
+    tmp_manifest = knowledge_dir / (MANIFEST_FILENAME + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, knowledge_dir / MANIFEST_FILENAME)
+    logger.info(f"Wrote {len(texts)} document embeddings to {knowledge_dir / EMBEDDINGS_FILENAME}")
+
+
+class _SnapshotView(NamedTuple):
+    """Embedding rows matched to one snapshot's documents"""
+    snapshot: object
+    delta_count: int
+    positions: np.ndarray  # row -> snapshot position, -1 if deleted or edited
+    missing: Dict[int, Tuple]  # position -> ((id, text hash), text) of documents without a row
+    extra_positions: np.ndarray  # positions of the missing documents embedded so far
+    extra_vectors: np.ndarray
+
+
+class DenseIndex:
+    """Precomputed document embeddings searched by cosine similarity.
+
+    Rows are matched to snapshot documents by id. Documents added or edited after the
+    embeddings were built are embedded on first use once encode_documents is set (the
+    query encoder), and left to the keyword side until then.
+    """
+
+    def __init__(self, embeddings: np.ndarray, ids: List[str], hashes: List[str], model_name: str):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.hashes = hashes
+        self.model_name = model_name
+        self.encode_documents: Optional[Callable[[List[str]], np.ndarray]] = None
+        self._faiss_index = None
+        if faiss is not None and len(ids):
+            self._faiss_index = faiss.IndexFlatIP(embeddings.shape[1])
+            self._faiss_index.add(np.ascontiguousarray(embeddings))
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._base: Tuple = (None, None, None)  # base corpus, row positions, missing documents
+        self._view: Optional[_SnapshotView] = None
+        self._extra_vectors: Dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, knowledge_dir: Path) -> Optional["DenseIndex"]:
+        """Memory-map knowledge_dir's document embeddings, or None if they were never built"""
+        embeddings_path = knowledge_dir / EMBEDDINGS_FILENAME
+        try:
+            with open(knowledge_dir / MANIFEST_FILENAME, encoding="utf-8") as f:
+                manifest = json.load(f)
+            embeddings = np.load(embeddings_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if embeddings.shape[0] != len(manifest["ids"]):
+            logger.warning(f"Ignoring {embeddings_path}: row count does not match its manifest")
+            return None
+        logger.info(f"Loaded {len(manifest['ids'])} document embeddings "
+                    f"({'faiss' if faiss is not None else 'numpy'} search)")
+        return cls(embeddings, manifest["ids"], manifest["hashes"], manifest["model"])
+
+    def _match(self, doc: Dict, position: int, positions: np.ndarray, missing: Dict):
+        """Point doc's embedding row at position, or record it as missing if it has no
+        up-to-date row"""
+        text = document_text(doc)
+        digest = text_hash(text)
+        row = self._rows.get(doc["id"])
+        if row is not None and self.hashes[row] == digest:
+            positions[row] = position
+        else:
+            missing[position] = ((doc["id"], digest), text)
+
+    def _base_view(self, base) -> Tuple[np.ndarray, Dict]:
+        """Row positions and missing documents of a base corpus, ignoring deletions; the
+        full pass over its documents runs once per base (at startup and after compaction)"""
+        if self._base[0] is not base:
+            positions = np.full(len(self.ids), -1, dtype=np.int64)
+            missing: Dict[int, Tuple] = {}
+            for position in range(base.num_docs):
+                self._match(base.documents[position], position, positions, missing)
+            self._base = (base, positions, missing)
+        return self._base[1], self._base[2]
+
+    def _snapshot_view(self, snapshot):
+        """Map embedding rows to snapshot positions (-1 if deleted or edited) and embed
+        documents that have no up-to-date row; computed once per snapshot.
+
+        A snapshot that extends the previous one (same base, delta segment and tombstone log)
+        is derived from its view, so a knowledge base write only costs the documents it
+        added and deleted.
+        """
+        with self._lock:
+            view = self._view
+            if view is not None and view.snapshot is snapshot:
+                return view.positions, view.extra_positions, view.extra_vectors
+
+            delta, deleted = snapshot.delta, snapshot.deleted
+            segment = delta.segment if delta is not None else None
+            delta_count = delta.num_docs if delta is not None else 0
+            previous = view.snapshot if view is not None else None
+            if (previous is not None and previous.base is snapshot.base
+                    and (previous.delta.segment if previous.delta is not None else None) is segment
+                    and previous.deleted.log is deleted.log
+                    and view.delta_count <= delta_count and len(previous.deleted) <= len(deleted)):
+                positions, missing = view.positions.copy(), dict(view.missing)
+                delta_start, deleted_start = view.delta_count, len(previous.deleted)
+            else:
+                base_positions, base_missing = self._base_view(snapshot.base)
+                positions, missing = base_positions.copy(), dict(base_missing)
+                delta_start = deleted_start = 0
+
+            offset = snapshot.base.num_docs
+            for position in range(offset + delta_start, offset + delta_count):
+                self._match(snapshot.documents[position], position, positions, missing)
+            for position in deleted.since(deleted_start):
+                if missing.pop(position, None) is None:
+                    row = self._rows.get(snapshot.documents[position]["id"])
+                    if row is not None and positions[row] == position:
+                        positions[row] = -1
+
+            if missing and self.encode_documents is not None:
+                unseen = [(key, text) for key, text in missing.values() if key not in self._extra_vectors]
+                if unseen:
+                    vectors = normalize_rows(self.encode_documents([text for _, text in unseen]))
+                    self._extra_vectors.update(zip((key for key, _ in unseen), vectors))
+            embedded = [(position, key) for position, (key, _) in missing.items() if key in self._extra_vectors]
+            extra_positions = np.array([position for position, _ in embedded], dtype=np.int64)
+            extra_vectors = np.array([self._extra_vectors[key] for _, key in embedded], dtype=np.float32)
+
+            self._view = _SnapshotView(snapshot, delta_count, positions, missing, extra_positions, extra_vectors)
+            return positions, extra_positions, extra_vectors
+
+    def search(self, query_vector: np.ndarray, snapshot, k: int) -> List[Tuple[int, float]]:
+        """Top k (snapshot position, cosine similarity) pairs for a normalized query vector"""
+        if k <= 0:
+            return []
+        positions, extra_positions, extra_vectors = self._snapshot_view(snapshot)
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        results = []
+        if self.ids:
+            # Over-fetch a little so rows of deleted or edited documents can be skipped
+            fetch = min(len(self.ids), k + 16)
+            if self._faiss_index is not None:
+                similarities, rows = self._faiss_index.search(query_vector, fetch)
+                similarities, rows = similarities[0], rows[0]
+            else:
+                all_similarities = self.embeddings @ query_vector[0]
+                rows = np.argpartition(-all_similarities, fetch - 1)[:fetch]
+                rows = rows[np.argsort(-all_similarities[rows])]
+                similarities = all_similarities[rows]
+            results = [(int(positions[row]), float(similarity))
+                       for row, similarity in zip(rows, similarities) if row >= 0 and positions[row] >= 0]
+        if len(extra_positions):
+            similarities = extra_vectors @ query_vector[0]
+            results.extend(zip(extra_positions.tolist(), similarities.tolist()))
+        results.sort(key=lambda item: -item[1])
+        return results[:k]
+
+
+class QueryEncoder:
+    """Embeds queries with a sentence-transformers model loaded on a background thread"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self.model = None
+        self.on_ready: List[Callable[[], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    def start(self):
+        """Begin loading the model; queries use keyword search alone until it is ready"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name="query-encoder", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name)
+        except Exception as e:
+            logger.warning(f"Query encoder unavailable, hybrid search will use keywords only: {e}")
+            return
+        logger.info(f"Query encoder {self.model_name} ready")
+        for callback in self.on_ready:
+            callback()
+
+    def encode(self, query: str) -> np.ndarray:
+        return normalize_rows(self.model.encode([query], convert_to_numpy=True))[0]
+
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True)
@@ -0,0 +1,276 @@
+"""
+AgriMithra embedding store
+Persists document embeddings (embeddings.npy) and, for approximate search, their FAISS index
+(faiss_index.bin) in the knowledge base, next to a manifest holding a content hash of the
+embedded texts. Startup only re-encodes when the documents or the embedding model change.
+
+The index type is configurable: exact flat search for small corpora, HNSW or IVF-PQ
+(approximate, much faster and smaller at scale) for large ones. Flat search runs on the
+memory-mapped embeddings.npy, so its pages are shared between processes; FAISS reads HNSW
+and IVF-PQ indexes fully into memory (IVF-PQ's compressed codes keep that small).
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # exact flat search needs only NumPy
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+INDEX_FILENAME = "faiss_index.bin"
+MANIFEST_FILENAME = "embeddings.json"
+
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivfpq")
+INDEX_TYPE = os.environ.get("EMBEDDING_INDEX_TYPE", "auto")
+ENCODE_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+
+# "auto" switches to approximate search above these corpus sizes
+HNSW_MIN_VECTORS = 10000
+IVFPQ_MIN_VECTORS = 1000000
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+
+
+def resolve_index_type(index_type: str, num_vectors: int) -> str:
+    """Concrete index type for a corpus size; IVF-PQ needs enough vectors to train on"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    if faiss is None:
+        if index_type not in ("auto", "flat"):
+            logger.warning(f"faiss is not installed, using a flat index instead of {index_type}")
+        return "flat"
+    if index_type == "auto":
+        if num_vectors >= IVFPQ_MIN_VECTORS:
+            return "ivfpq"
+        return "hnsw" if num_vectors >= HNSW_MIN_VECTORS else "flat"
+    if index_type == "ivfpq" and num_vectors < 256 * 39:
+        logger.warning(f"Only {num_vectors} vectors, too few to train IVF-PQ; using a flat index")
+        return "flat"
+    return index_type
+
+
+def create_index(embeddings: np.ndarray, index_type: str = "flat") -> "faiss.Index":
+    """Build a FAISS L2 index of the given type over embeddings"""
+    num_vectors, dimension = embeddings.shape
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_NEIGHBORS)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "ivfpq":
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        # Largest sub-quantizer count up to dimension / 4 that divides the dimension
+        subquantizers = max(m for m in range(1, dimension // 4 + 1) if dimension % m == 0)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, subquantizers, 8)
+        index.train(embeddings)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+    index.add(embeddings)
+    return index
+
+
+class FlatIndex:
+    """Exact L2 search over an embedding matrix (typically memory-mapped), with the
+    ntotal/search interface of a FAISS index"""
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.ntotal = len(embeddings)
+        self._norms = np.einsum("ij,ij->i", embeddings, embeddings) if self.ntotal else np.zeros(0, np.float32)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Squared L2 distances and row ids of the k nearest rows for each query,
+        padded with (inf, -1) like FAISS when k exceeds ntotal"""
+        queries = np.asarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        found = min(k, self.ntotal)
+        if found:
+            # |e - q|^2 = |e|^2 - 2 e.q + |q|^2
+            all_distances = self._norms[None, :] - 2 * (queries @ self.embeddings.T) \
+                + np.einsum("ij,ij->i", queries, queries)[:, None]
+            for i, row in enumerate(all_distances):
+                nearest = np.argpartition(row, found - 1)[:found]
+                nearest = nearest[np.argsort(row[nearest], kind="stable")]
+                distances[i, :found] = np.maximum(row[nearest], 0)
+                indices[i, :found] = nearest
+        return distances, indices
+
+
+def encode_in_batches(texts: List[str], encode: Callable[[List[str]], np.ndarray],
+                      batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+    """Encode texts batch by batch into one float32 matrix"""
+    batches = [np.asarray(encode(texts[i:i + batch_size]), dtype=np.float32)
+               for i in range(0, len(texts), max(1, batch_size))]
+    return np.ascontiguousarray(np.concatenate(batches)) if batches else np.zeros((0, 0), np.float32)
+
+
+def content_hash(texts: List[str], model_name: str, index_type: str = "flat") -> str:
+    """Hash of the embedding model, index type and every text, in order"""
+    digest = hashlib.sha256(f"{model_name}\0{index_type}".encode("utf-8"))
+    for text in texts:
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_embedding_store(store_dir: Path, texts: List[str], model_name: str,
+                          encode: Callable[[List[str]], np.ndarray],
+                          index_type: str = INDEX_TYPE) -> Tuple[np.ndarray, "faiss.Index"]:
+    """Encode texts and write the embeddings, FAISS index (approximate types only) and
+    manifest to store_dir"""
+    index_type = resolve_index_type(index_type, len(texts))
+    embeddings = encode_in_batches(texts, encode)
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    # Write to temp names first so a crash never leaves a manifest that matches stale files
+    tmp_embeddings = store_dir / (EMBEDDINGS_FILENAME + ".tmp")
+    with open(tmp_embeddings, "wb") as f:
+        np.save(f, embeddings)
+    if index_type == "flat":
+        index = FlatIndex(embeddings)
+        os.replace(tmp_embeddings, store_dir / EMBEDDINGS_FILENAME)
+        (store_dir / INDEX_FILENAME).unlink(missing_ok=True)
+    else:
+        index = create_index(embeddings, index_type)
+        tmp_index = store_dir / (INDEX_FILENAME + ".tmp")
+        faiss.write_index(index, str(tmp_index))
+        os.replace(tmp_embeddings, store_dir / EMBEDDINGS_FILENAME)
+        os.replace(tmp_index, store_dir / INDEX_FILENAME)
+
+    manifest = {
+        "hash": content_hash(texts, model_name, index_type),
+        "model": model_name,
+        "index_type": index_type,
+        "count": len(texts),
+        "dimension": int(embeddings.shape[1]),
+    }
+    tmp_manifest = store_dir / (MANIFEST_FILENAME + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, store_dir / MANIFEST_FILENAME)
+    logger.info(f"Wrote {len(texts)} embeddings and {index_type} FAISS index to {store_dir}")
+    return embeddings, index
+
+
+def read_manifest(store_dir: Path) -> dict:
+    try:
+        with open(store_dir / MANIFEST_FILENAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_embedding_store(store_dir: Path, texts: List[str], model_name: str,
+                         encode: Callable[[List[str]], np.ndarray], rebuild: bool = False,
+                         index_type: str = INDEX_TYPE) -> Tuple[np.ndarray, "faiss.Index"]:
+    """Memory-map the stored embeddings and load the index, rebuilding them first if they
+    are missing or were built from different texts, model or index type"""
+    embeddings_path = store_dir / EMBEDDINGS_FILENAME
+    index_path = store_dir / INDEX_FILENAME
+    index_type = resolve_index_type(index_type, len(texts))
+    expected = content_hash(texts, model_name, index_type)
+    if rebuild or read_manifest(store_dir).get("hash") != expected or not embeddings_path.exists() \
+            or (index_type != "flat" and not index_path.exists()):
+        logger.info(f"Embedding store in {store_dir} is missing or stale, re-encoding {len(texts)} texts")
+        return build_embedding_store(store_dir, texts, model_name, encode, index_type)
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    if index_type == "flat":
+        index = FlatIndex(embeddings)
+    else:
+        # FAISS cannot map HNSW or IVF-PQ indexes, so these are read into memory
+        index = faiss.read_index(str(index_path))
+    # Search-time parameters are not persisted with every index type
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "ivfpq":
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+    logger.info(f"Loaded {index.ntotal} embeddings from {store_dir} (hash {expected[:12]})")
+    return embeddings, index
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query embeddings with time-saved metrics.
+
+    Precomputed entries (e.g. every plant name the classifier can emit) are pinned and
+    never evicted; free-text queries share the remaining max_entries slots.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_entries: int = 1024):
+        self.encode = encode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        self.precompute_seconds = 0.0
+        self._pinned: Dict[str, np.ndarray] = {}
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def precompute(self, texts: Iterable[str]):
+        """Encode texts in one batch and pin them"""
+        texts = [text for text in dict.fromkeys(texts) if text not in self._pinned]
+        if not texts:
+            return
+        start = time.perf_counter()
+        vectors = np.asarray(self.encode(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._pinned.update(zip(texts, vectors))
+            self.precompute_seconds += elapsed
+
+    def get(self, text: str) -> np.ndarray:
+        """Embedding of text as a (1 x dimension) array"""
+        with self._lock:
+            vector = self._pinned.get(text)
+            if vector is None:
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+            if vector is not None:
+                self.hits += 1
+                return vector[None, :]
+
+        start = time.perf_counter()
+        vector = np.asarray(self.encode([text]), dtype=np.float32)[0]
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self.encode_seconds += elapsed
+            if self.max_entries > 0:
+                self._entries[text] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return vector[None, :]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            mean_encode = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "pinned": len(self._pinned),
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "encode_seconds": self.encode_seconds,
+                "precompute_seconds": self.precompute_seconds,
+                # Each hit skips one single-query encode of average cost
+                "saved_seconds": self.hits * mean_encode,
+            }
@@ -0,0 +1,59 @@
+"""
+AgriMithra guide chunking
+Splits the structured crop guides used by app.py into field-level chunks (summary,
+varieties, each fertilizer field, each pest and each disease) so semantic search matches
+the specific passage a question is about, then maps chunk hits back to whole guides.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Sequence
+
+
+class Chunk(NamedTuple):
+    guide: int   # index into the guide list
+    field: str   # e.g. "summary", "fertilizer_management.schedule", "pest_management[0]"
+    text: str
+
+
+def chunk_guide(guide_index: int, doc: Dict) -> List[Chunk]:
+    """Field-level chunks of one guide; each chunk names its crop so it embeds in context"""
+    title = doc["title"]
+    content = doc["content"]
+    if isinstance(content, str):
+        return [Chunk(guide_index, "content", f"{title}: {content}")]
+
+    chunks = [Chunk(guide_index, "title", title)]
+    for field in ("summary", "varieties"):
+        if content.get(field):
+            chunks.append(Chunk(guide_index, field, f"{title} {field}: {content[field]}"))
+    for key, value in content.get("fertilizer_management", {}).items():
+        chunks.append(Chunk(guide_index, f"fertilizer_management.{key}",
+                            f"{title} fertilizer ({key}): {value}"))
+    for i, item in enumerate(content.get("pest_management", [])):
+        chunks.append(Chunk(guide_index, f"pest_management[{i}]",
+                            f"{title} pest {item['pest']}: {item['solution']}"))
+    for i, item in enumerate(content.get("disease_management", [])):
+        chunks.append(Chunk(guide_index, f"disease_management[{i}]",
+                            f"{title} disease {item['disease']}: {item['solution']}"))
+    return chunks
+
+
+def chunk_guides(docs: Sequence[Dict]) -> List[Chunk]:
+    return [chunk for i, doc in enumerate(docs) for chunk in chunk_guide(i, doc)]
+
+
+def aggregate_hits(distances: Sequence[float], indices: Sequence[int], chunks: Sequence[Chunk],
+                   k: int = 1) -> List[Dict]:
+    """Rank guides by their closest chunk among the hits (FAISS L2 distances, ascending).
+
+    Returns up to k {"guide", "distance", "fields"} entries; fields lists the matched
+    chunks of the guide, best first.
+    """
+    guides: "OrderedDict[int, Dict]" = OrderedDict()
+    for distance, idx in zip(distances, indices):
+        if idx < 0:  # FAISS pads missing results with -1
+            continue
+        chunk = chunks[idx]
+        hit = guides.setdefault(chunk.guide, {"guide": chunk.guide, "distance": float(distance), "fields": []})
+        hit["fields"].append(chunk.field)
+    return list(guides.values())[:k]
@@ -0,0 +1,147 @@
+"""
+AgriMithra image preprocessing
+Decodes uploaded leaf photos straight at the classifier's input resolution and turns them
+into model-ready arrays. Runs in a worker pool so the ML service's event loop only does I/O.
+Imports no torch, so process-pool workers start quickly.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    from transformers import ViTImageProcessor
+except ImportError:  # stand-in processors (benchmarks/load_test.py) need no transformers
+    ViTImageProcessor = None
+
+logger = logging.getLogger(__name__)
+
+# "thread" shares the processor with the server; "process" sidesteps the GIL entirely
+PREPROCESS_POOL = os.environ.get("ML_PREPROCESS_POOL", "thread")
+PREPROCESS_WORKERS = int(os.environ.get("ML_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds to wait for process-pool workers to start before falling back to threads
+PROCESS_START_TIMEOUT = float(os.environ.get("ML_PREPROCESS_START_TIMEOUT", "30"))
+
+_processor: Optional[ViTImageProcessor] = None
+
+
+class PreparedImage(NamedTuple):
+    """A decoded upload: content digest, perceptual hash, model input and the (stage, seconds)
+    timings of producing it, carried back from the worker for the service's metrics"""
+    digest: str
+    phash: int
+    pixel_values: np.ndarray
+    timings: Tuple[Tuple[str, float], ...] = ()
+
+
+def init_worker(processor: ViTImageProcessor):
+    """Set the processor used by preprocess_image in this process"""
+    global _processor
+    _processor = processor
+
+
+def target_size(processor: ViTImageProcessor) -> Tuple[int, int]:
+    """(width, height) the processor resizes images to"""
+    size = processor.size
+    if "height" in size and "width" in size:
+        return size["width"], size["height"]
+    edge = size.get("shortest_edge", 224)
+    return edge, edge
+
+
+def decode_image(image_bytes: bytes, size: Tuple[int, int]) -> Image.Image:
+    """Decode image_bytes to RGB, no larger than needed to resize down to size.
+
+    JPEGs are decoded at a reduced DCT scale via draft mode, skipping most of the work for
+    multi-megapixel camera photos; other formats are shrunk by an integer factor with reduce().
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == "JPEG":
+        image.draft("RGB", size)
+    else:
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+    return image.convert("RGB")
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """Content address of an upload"""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash: stable under re-encoding, resizing and small edits"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def preprocess_image(image_bytes: bytes) -> PreparedImage:
+    """Decode and preprocess one image into a contiguous float32 array (1 x C x H x W)"""
+    start = perf_counter()
+    image = decode_image(image_bytes, target_size(_processor))
+    opened = perf_counter()
+    pixel_values = _processor(images=image, return_tensors="np")["pixel_values"]
+    prepared = PreparedImage(image_digest(image_bytes), perceptual_hash(image),
+                             np.ascontiguousarray(pixel_values, dtype=np.float32))
+    return prepared._replace(timings=(("image_open", opened - start), ("preprocess", perf_counter() - opened)))
+
+
+def preprocess_base64(image_data: str) -> PreparedImage:
+    """preprocess_image for a base64 string, with or without a data: URL prefix"""
+    start = perf_counter()
+    if "," in image_data:
+        image_data = image_data.split(",")[1]
+    image_bytes = base64.b64decode(image_data)
+    decoded = perf_counter() - start
+    prepared = preprocess_image(image_bytes)
+    return prepared._replace(timings=(("base64_decode", decoded), *prepared.timings))
+
+
+def _start_process_pool(processor: ViTImageProcessor, workers: int) -> Optional[Executor]:
+    """Process pool with its workers started, or None if they cannot start here (no
+    semaphore support, a processor that cannot be pickled, workers dying on start)"""
+    try:
+        # Workers get a pickled copy of the server's processor, so they use the same pinned
+        # revision and configuration instead of loading their own from the hub
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(processor,))
+    except (OSError, NotImplementedError) as e:
+        logger.warning(f"Process pool unavailable ({e}), preprocessing on threads instead")
+        return None
+    try:
+        # Workers start on the first submit; fail over now rather than on the first upload
+        pool.submit(int).result(timeout=PROCESS_START_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Process pool workers failed to start ({e!r}), preprocessing on threads instead")
+        pool.shutdown(wait=False, cancel_futures=True)
+        return None
+    return pool
+
+
+def create_pool(processor: ViTImageProcessor, kind: str = PREPROCESS_POOL,
+                workers: int = PREPROCESS_WORKERS) -> Executor:
+    """Executor for preprocess_image using processor; a process pool that cannot start
+    falls back to threads"""
+    workers = max(1, workers)
+    pool = None
+    if kind == "process":
+        pool = _start_process_pool(processor, workers)
+        if pool is None:
+            kind = "thread"
+    elif kind != "thread":
+        logger.warning(f"Unknown ML_PREPROCESS_POOL '{kind}', using threads")
+        kind = "thread"
+    if pool is None:
+        init_worker(processor)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vit-preprocess")
+    logger.info(f"Image preprocessing pool: {workers} {kind} worker(s)")
+    return pool
@@ -0,0 +1,583 @@
+"""
+AgriMithra live knowledge base
+Applies document adds, updates and deletes to the memory-mapped corpus without a restart.
+A change only tokenizes the documents it adds, appending them to an in-memory delta
+segment and tombstoning the ones it replaces, then swaps in a new immutable CorpusSnapshot
+with one attribute assignment, so in-flight queries keep reading the snapshot they started
+with. The delta is folded back into a freshly compiled corpus file once it grows past a
+threshold.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from corpus_store import (BUILTIN_PREFIX, MappedCorpus, load_document_file, open_corpus,
+                          seed_hash, write_corpus)
+from rag_index import (FIELD_B, FIELDS, TOKEN_PATTERN, IndexLookupMixin, bm25_idf, normalize_term,
+                       trigrams)
+
+logger = logging.getLogger(__name__)
+
+# Fold the delta segment into a new corpus file once it holds this many changes
+COMPACT_THRESHOLD = int(os.environ.get("RAG_COMPACT_THRESHOLD", "1000"))
+
+CATEGORY_PATTERN = re.compile(r"^[a-z0-9_]+$")
+
+
+class DeltaSegment:
+    """Append-only keyword index of the documents written since the base corpus was compiled.
+
+    A write only tokenizes its own document. Posting lists only grow and doc ids only
+    increase, so each snapshot reads the segment through a DeltaView cut off at the document
+    count it was built with, and later appends stay invisible to it.
+    """
+
+    def __init__(self):
+        self.documents: List[Dict] = []
+        self.postings: Dict[str, Dict[str, Tuple[array, array]]] = {field: {} for field in FIELDS}
+        self.term_docs: Dict[str, array] = {}  # term -> doc ids containing it in any field
+        self.raw_postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        self.raw_vocabulary: List[str] = []
+        self.trigram_table: Dict[str, array] = {}
+        self.field_lengths: Dict[str, array] = {field: array("I") for field in FIELDS}
+        self.length_totals: Dict[str, array] = {field: array("Q", [0]) for field in FIELDS}  # prefix sums
+        self._raw_ids: Dict[str, int] = {}
+
+    def append(self, doc: Dict):
+        """Index doc under the next doc id; caller holds LiveCorpus's write lock"""
+        doc_id = len(self.documents)
+        doc_terms = set()
+        for field in FIELDS:
+            raw_tokens = TOKEN_PATTERN.findall(doc.get(field, "").lower())
+            tokens = [normalize_term(token) for token in raw_tokens]
+            self.field_lengths[field].append(len(tokens))
+            self.length_totals[field].append(self.length_totals[field][-1] + len(tokens))
+            field_postings = self.postings[field]
+            for term, tf in Counter(tokens).items():
+                if term not in field_postings:
+                    field_postings[term] = (array("I"), array("H"))
+                doc_ids, tfs = field_postings[term]
+                doc_ids.append(doc_id)
+                tfs.append(min(tf, 0xFFFF))
+            doc_terms.update(tokens)
+            raw_field_postings = self.raw_postings[field]
+            for token in dict.fromkeys(raw_tokens):
+                self._add_raw_term(token)
+                if token not in raw_field_postings:
+                    raw_field_postings[token] = array("I")
+                raw_field_postings[token].append(doc_id)
+        for term in doc_terms:
+            if term not in self.term_docs:
+                self.term_docs[term] = array("I")
+            self.term_docs[term].append(doc_id)
+        # Published last: a DeltaView never counts a partly indexed document
+        self.documents.append(doc)
+
+    def _add_raw_term(self, token: str):
+        if token in self._raw_ids:
+            return
+        self._raw_ids[token] = term_id = len(self.raw_vocabulary)
+        self.raw_vocabulary.append(token)
+        for trigram in trigrams(token):
+            if trigram not in self.trigram_table:
+                self.trigram_table[trigram] = array("I")
+            self.trigram_table[trigram].append(term_id)
+
+
+def _cut(doc_ids: array, num_docs: int) -> array:
+    """Copy of an ascending posting list without the doc ids >= num_docs"""
+    return doc_ids[:bisect_left(doc_ids, num_docs)]
+
+
+class _DeltaLengthNorms:
+    """BM25 length norms of the first num_docs delta documents, against their average length"""
+
+    def __init__(self, lengths: array, total: int, num_docs: int, b: float):
+        self.lengths = lengths
+        self.avg_len = total / num_docs if num_docs else 0.0
+        self.b = b
+
+    def __getitem__(self, doc_id: int) -> float:
+        if not self.avg_len:
+            return 1.0
+        return 1.0 - self.b + self.b * self.lengths[doc_id] / self.avg_len
+
+
+class DeltaView(IndexLookupMixin):
+    """The first num_docs documents of a DeltaSegment, with the index interface"""
+
+    def __init__(self, segment: DeltaSegment, num_docs: int):
+        self.segment = segment
+        self.num_docs = num_docs
+        self.raw_vocabulary = segment.raw_vocabulary
+        self.length_norms = {field: _DeltaLengthNorms(segment.field_lengths[field],
+                                                      segment.length_totals[field][num_docs],
+                                                      num_docs, FIELD_B[field])
+                             for field in FIELDS}
+
+    def doc_freq(self, term: str) -> int:
+        return bisect_left(self.segment.term_docs.get(term, _EMPTY), self.num_docs)
+
+    def lookup_tf(self, field: str, term: str) -> Tuple[array, array]:
+        doc_ids, tfs = self.segment.postings[field].get(term, (_EMPTY, _EMPTY))
+        count = bisect_left(doc_ids, self.num_docs)
+        return doc_ids[:count], tfs[:count]
+
+    def lookup(self, field: str, term: str) -> array:
+        return self.lookup_tf(field, term)[0]
+
+    def raw_lookup(self, field: str, token: str) -> array:
+        return _cut(self.segment.raw_postings[field].get(token, _EMPTY), self.num_docs)
+
+    def trigram_terms(self, trigram: str) -> array:
+        return self.segment.trigram_table.get(trigram, _EMPTY)
+
+    def field_text(self, field: str, doc_id: int) -> str:
+        return self.segment.documents[doc_id].get(field, "")
+
+
+_EMPTY = array("I")
+
+
+class Tombstones:
+    """Deleted segmented doc ids as of one snapshot.
+
+    LiveCorpus appends to one insertion-ordered {doc id: sequence number} log per base
+    corpus; a snapshot sees the first count entries, so deleting never copies the set.
+    """
+
+    def __init__(self, log: Optional[Dict[int, int]] = None, count: int = 0):
+        self.log = log if log is not None else {}
+        self.count = count
+
+    def __contains__(self, doc_id: int) -> bool:
+        sequence = self.log.get(doc_id)
+        return sequence is not None and sequence < self.count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def since(self, count: int) -> List[int]:
+        """Doc ids deleted after the first count entries, up to this snapshot"""
+        return list(self.log)[count:self.count]  # list() copies the keys before a writer can append
+
+
+class _ConcatColumn:
+    """Read-only per-document column spanning the base and delta segments"""
+
+    def __init__(self, base, delta, offset: int):
+        self.base = base
+        self.delta = delta
+        self.offset = offset
+
+    def __getitem__(self, doc_id: int):
+        if doc_id < self.offset:
+            return self.base[doc_id]
+        return self.delta[doc_id - self.offset]
+
+
+class SegmentedIndex:
+    """Index view over base + delta segments, skipping tombstoned documents of either.
+
+    Delta doc ids follow the base ids. Document frequencies and the delta's average field
+    length include tombstoned documents until the next compaction, which only slightly
+    skews BM25.
+    """
+
+    def __init__(self, base, delta: DeltaView, deleted: Tombstones):
+        self.base = base
+        self.delta = delta
+        self.deleted = deleted
+        self.offset = base.num_docs
+        self.num_docs = base.num_docs + delta.num_docs - len(deleted)
+        self.length_norms = {field: _ConcatColumn(base.length_norms[field], delta.length_norms[field],
+                                                  self.offset)
+                             for field in FIELDS}
+
+    def doc_freq(self, term: str) -> int:
+        return self.base.doc_freq(term) + self.delta.doc_freq(term)
+
+    def term_idf(self, term: str) -> Optional[float]:
+        df = self.doc_freq(term)
+        return bm25_idf(self.num_docs, df) if df else None
+
+    def lookup_tf(self, field: str, term: str):
+        base_docs, base_tfs = self.base.lookup_tf(field, term)
+        delta_docs, delta_tfs = self.delta.lookup_tf(field, term)
+        if not self.deleted and not delta_docs:
+            return base_docs, base_tfs
+
+        doc_ids, tfs = [], []
+        for doc_id, tf in zip(base_docs, base_tfs):
+            if doc_id not in self.deleted:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        for doc_id, tf in zip(delta_docs, delta_tfs):
+            doc_id += self.offset
+            if doc_id not in self.deleted:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        return doc_ids, tfs
+
+    def lookup(self, field: str, term: str):
+        return self.lookup_tf(field, term)[0]
+
+    def substring_docs(self, field: str, word: str):
+        docs = set(self.base.substring_docs(field, word))
+        docs.update(doc_id + self.offset for doc_id in self.delta.substring_docs(field, word))
+        return {doc_id for doc_id in docs if doc_id not in self.deleted}
+
+
+class _SegmentedDocuments(Sequence):
+    """Documents addressed by segmented doc id"""
+
+    def __init__(self, base_documents, delta: DeltaView):
+        self.base = base_documents
+        self.delta = delta.segment.documents
+        self.offset = len(base_documents)
+        self.length = self.offset + delta.num_docs
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, doc_id):
+        if isinstance(doc_id, slice):
+            return [self[i] for i in range(*doc_id.indices(len(self)))]
+        if doc_id < self.offset:
+            return self.base[doc_id]
+        if doc_id >= self.length:
+            raise IndexError(doc_id)
+        return self.delta[doc_id - self.offset]
+
+
+class CorpusSnapshot:
+    """Immutable view of the knowledge base used to answer queries"""
+
+    def __init__(self, base, delta: Optional[DeltaView] = None, deleted: Tombstones = Tombstones(),
+                 generation: int = 0, category_counts: Optional[Dict[str, int]] = None):
+        self.base = base
+        self.delta = delta
+        self.deleted = deleted
+        self.generation = generation
+        self.category_counts = dict(base.category_counts) if category_counts is None else category_counts
+
+        if (delta is not None and delta.num_docs) or deleted:
+            self.index = SegmentedIndex(base, delta or DeltaView(DeltaSegment(), 0), deleted)
+            self.documents = _SegmentedDocuments(base.documents, self.index.delta)
+        else:
+            self.index = base
+            self.documents = base.documents
+
+    @property
+    def pending_changes(self) -> int:
+        return (self.delta.num_docs if self.delta is not None else 0) + len(self.deleted)
+
+    def live_documents(self) -> List[Dict]:
+        """Every visible document, in snapshot order"""
+        return [doc for doc_id, doc in enumerate(self.documents) if doc_id not in self.deleted]
+
+
+class LiveCorpus:
+    """Owns the current snapshot and serializes writes to the knowledge base"""
+
+    def __init__(self, corpus_path: Path, knowledge_dir: Path, seed_documents: Sequence[Dict]):
+        self.corpus_path = corpus_path
+        self.knowledge_dir = knowledge_dir
+        self.seed_documents = seed_documents
+        self.listeners: List[Callable[[CorpusSnapshot], None]] = []
+
+        self._write_lock = threading.RLock()
+        self._reset(open_corpus(corpus_path, knowledge_dir, seed_documents))
+        self.snapshot = self._next_snapshot(0)
+        # (mtime_ns, size) of each document file as last applied; starts as the files the base covers
+        self._file_state = self._manifest_state(self._base.manifest)
+        self._corpus_identity = self._stat_identity(corpus_path)
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+        self._compacting = False
+        self._compaction_log: Optional[List[Tuple[List[str], List[Dict]]]] = None
+
+    # --- Write API ---
+
+    def add_document(self, data: Dict) -> str:
+        """Persist a new document under knowledge_dir and apply it; returns its id"""
+        doc = self._validate(data)
+        with self._write_lock:
+            category_dir = self.knowledge_dir / doc["category"]
+            stem = _slugify(data.get("id") or doc["title"])
+            path = category_dir / f"{stem}.json"
+            suffix = 2
+            while path.exists() or self._find(f"{doc['category']}/{path.stem}") is not None:
+                path = category_dir / f"{stem}-{suffix}.json"
+                suffix += 1
+            doc_id = f"{doc['category']}/{path.stem}"
+            self._persist(path, doc)
+            self._apply(removed=[], added=[dict(doc, id=doc_id)])
+        logger.info(f"Added document '{doc_id}'")
+        return doc_id
+
+    def update_document(self, doc_id: str, data: Dict) -> str:
+        """Replace an existing document's title/content/category/metadata"""
+        doc = self._validate(data)
+        with self._write_lock:
+            path = self._document_path(doc_id)
+            self._persist(path, doc)
+            self._apply(removed=[doc_id], added=[dict(doc, id=doc_id)])
+        logger.info(f"Updated document '{doc_id}'")
+        return doc_id
+
+    def delete_document(self, doc_id: str) -> str:
+        """Remove a document from the knowledge base"""
+        with self._write_lock:
+            path = self._document_path(doc_id)
+            path.unlink(missing_ok=True)
+            self._file_state.pop(path, None)
+            self._apply(removed=[doc_id], added=[])
+        logger.info(f"Deleted document '{doc_id}'")
+        return doc_id
+
+    def _validate(self, data: Dict) -> Dict:
+        if not isinstance(data, dict):
+            raise ValueError("The document must be a JSON object")
+        title = str(data.get("title") or "").strip()
+        content = str(data.get("content") or "").strip()
+        category = str(data.get("category") or "general").strip().lower()
+        if not title or not content:
+            raise ValueError("Both 'title' and 'content' are required")
+        if not CATEGORY_PATTERN.match(category):
+            raise ValueError("'category' may only contain lowercase letters, digits and underscores")
+        metadata = data.get("metadata") or {}
+        if not isinstance(metadata, dict):
+            raise ValueError("'metadata' must be an object")
+        return {"title": title, "category": category, "content": content, "metadata": metadata}
+
+    def _document_path(self, doc_id: str) -> Path:
+        """File backing a single-document id; built-in and list-file documents are read-only"""
+        if self._find(doc_id) is None:
+            raise KeyError(doc_id)
+        if doc_id.startswith(f"{BUILTIN_PREFIX}/") or "#" in doc_id:
+            raise ValueError(f"Document '{doc_id}' is read-only through the API; edit its source instead")
+        category, _, stem = doc_id.partition("/")
+        return self.knowledge_dir / category / f"{stem}.json"
+
+    def _persist(self, path: Path, doc: Dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        # Record our own write so the watcher does not apply it a second time
+        self._file_state[path] = self._stat_identity(path)
+
+    # --- Snapshot maintenance ---
+
+    def _reset(self, base):
+        """Start an empty delta segment and tombstone log on top of base; caller holds the write lock"""
+        self._base = base
+        self._base_ids: Optional[Dict[str, int]] = None  # built lazily on the first write
+        self._delta = DeltaSegment()
+        self._delta_ids: Dict[str, int] = {}  # live delta document id -> segmented doc id
+        self._tombstones: Dict[int, int] = {}
+        self._category_counts = Counter(base.category_counts)
+
+    def _next_snapshot(self, generation: int) -> CorpusSnapshot:
+        delta = DeltaView(self._delta, len(self._delta.documents))
+        deleted = Tombstones(self._tombstones, len(self._tombstones))
+        counts = {category: count for category, count in self._category_counts.items() if count > 0}
+        return CorpusSnapshot(self._base, delta, deleted, generation, counts)
+
+    def _base_id_map(self) -> Dict[str, int]:
+        if self._base_ids is None:
+            self._base_ids = {doc_id: i for i, doc_id in enumerate(self._base.documents.ids)}
+        return self._base_ids
+
+    def _find(self, doc_id: str) -> Optional[int]:
+        """Segmented doc id of a live document"""
+        position = self._delta_ids.get(doc_id)
+        if position is not None:
+            return position
+        base_id = self._base_id_map().get(doc_id)
+        if base_id is not None and base_id not in self._tombstones:
+            return base_id
+        return None
+
+    def _stage(self, removed: List[str], added: List[Dict]):
+        """Tombstone removed and index added documents in place; only the new documents are
+        tokenized. Caller holds the write lock."""
+        for doc_id in removed:
+            position = self._find(doc_id)
+            if position is None:
+                continue
+            self._tombstones[position] = len(self._tombstones)
+            self._delta_ids.pop(doc_id, None)
+            self._category_counts[self._document(position)["category"]] -= 1
+        for doc in added:
+            self._delta_ids[doc["id"]] = self._base.num_docs + len(self._delta.documents)
+            self._delta.append(doc)
+            self._category_counts[doc["category"]] += 1
+
+    def _document(self, position: int) -> Dict:
+        offset = self._base.num_docs
+        return self._base.documents[position] if position < offset else self._delta.documents[position - offset]
+
+    def _apply(self, removed: List[str], added: List[Dict]):
+        """Apply a change and publish the next snapshot; caller holds the write lock"""
+        if self._compaction_log is not None:
+            self._compaction_log.append((removed, added))
+        self._stage(removed, added)
+        self._publish(self._next_snapshot(self.snapshot.generation + 1))
+        if self.snapshot.pending_changes >= COMPACT_THRESHOLD and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, name="corpus-compaction", daemon=True).start()
+
+    def _publish(self, snapshot: CorpusSnapshot):
+        self.snapshot = snapshot  # single reference swap; readers never see a partial update
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Knowledge base listener failed: {e}")
+
+    def compact(self):
+        """Recompile the corpus file from the live documents and drop the delta segment.
+
+        The file is written without holding the write lock, so writes keep being applied
+        meanwhile; they are logged and replayed on top of the new base before it is swapped in.
+        """
+        try:
+            with self._write_lock:
+                current = self.snapshot
+                if not current.pending_changes:
+                    return
+                documents = current.live_documents()
+                # The files these documents were loaded from, as applied; files changed but
+                # not yet polled stay out, so a worker adopting this base still applies them
+                manifest = {"seed_hash": seed_hash(self.seed_documents), "files": {
+                    f"{path.parent.name}/{path.name}": list(stamp) for path, stamp in self._file_state.items()}}
+                self._compaction_log = []
+
+            try:
+                write_corpus(self.corpus_path, documents, manifest)
+            except Exception:
+                with self._write_lock:
+                    self._compaction_log = None
+                raise
+
+            with self._write_lock:
+                log, self._compaction_log = self._compaction_log, None
+                self._corpus_identity = self._stat_identity(self.corpus_path)
+                # _file_state already covers the base plus the replayed writes
+                self._reset(MappedCorpus(self.corpus_path))
+                for removed, added in log:
+                    self._stage(removed, added)
+                self._publish(self._next_snapshot(self.snapshot.generation + 1))
+            logger.info(f"Compacted knowledge base into {self.corpus_path} "
+                        f"({len(documents)} documents, {len(log)} writes replayed)")
+        finally:
+            self._compacting = False
+
+    # --- File watcher ---
+
+    @staticmethod
+    def _stat_identity(path: Path) -> Tuple[int, int]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return (0, 0)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _manifest_state(self, manifest: Dict) -> Dict[Path, Tuple[int, int]]:
+        """File state recorded in a corpus manifest: the files its documents were loaded from"""
+        return {self.knowledge_dir / name: tuple(stamp) for name, stamp in manifest.get("files", {}).items()}
+
+    def _scan_files(self) -> Dict[Path, Tuple[int, int]]:
+        state = {}
+        if not self.knowledge_dir.is_dir():
+            return state
+        for category_dir in os.scandir(self.knowledge_dir):
+            if not category_dir.is_dir():
+                continue
+            for entry in os.scandir(category_dir.path):
+                if entry.name.endswith(".json") and not entry.name.startswith("."):
+                    st = entry.stat()
+                    state[Path(entry.path)] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def poll(self):
+        """Apply knowledge_dir file changes made since the previous poll"""
+        with self._write_lock:
+            # Another worker compacted the corpus: map its file as the new base (our own
+            # compaction swaps its file in itself, replaying the writes made meanwhile)
+            identity = self._stat_identity(self.corpus_path)
+            if identity != self._corpus_identity and identity != (0, 0) and self._compaction_log is None:
+                self._corpus_identity = identity
+                self._reset(MappedCorpus(self.corpus_path))
+                # Our file state describes the old base; rescanning against the new base's
+                # manifest re-applies every file it does not cover, including our own writes
+                self._file_state = self._manifest_state(self._base.manifest)
+                self._publish(self._next_snapshot(self.snapshot.generation + 1))
+                logger.info(f"Reloaded corpus file {self.corpus_path} written by another worker")
+
+            state = self._scan_files()
+            changed = [path for path, stamp in state.items() if self._file_state.get(path) != stamp]
+            removed_files = [path for path in self._file_state if path not in state]
+            self._file_state = state
+            if not changed and not removed_files:
+                return
+
+            removed, added = [], []
+            for path in changed + removed_files:
+                removed.extend(self._ids_for_file(path))
+            for path in changed:
+                try:
+                    added.extend(load_document_file(path))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable document {path}: {e}")
+            self._apply(removed=removed, added=added)
+            logger.info(f"Applied knowledge base changes: {len(changed)} changed, "
+                        f"{len(removed_files)} removed files")
+
+    def _ids_for_file(self, path: Path) -> List[str]:
+        """Ids of the live documents loaded from path (single doc or list file)"""
+        file_id = f"{path.parent.name}/{path.stem}"
+        ids = [doc_id for doc_id in self._delta_ids
+               if doc_id == file_id or doc_id.startswith(f"{file_id}#")]
+        ids.extend(doc_id for doc_id in self._base_id_map()
+                   if doc_id == file_id or doc_id.startswith(f"{file_id}#"))
+        return ids
+
+    def start_watcher(self, interval: float):
+        """Poll knowledge_dir for changes every interval seconds on a daemon thread"""
+        if self._watcher is not None or interval <= 0:
+            return
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Knowledge base watcher error: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="knowledge-base-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching {self.knowledge_dir} for changes every {interval}s")
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+
+def _slugify(text: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", str(text).lower()).strip("-")[:60]
+    return slug or "document"
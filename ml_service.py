@@ -1,17 +1,72 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List
+from image_preprocess import create_pool, init_worker, preprocess_base64, preprocess_image
+from vit_inference import TOP_K, describe_logits, load_classifier, validate_classifier
+from prediction_cache import PredictionCache
+from model_loader import MODEL_LOADING, ModelLoader
+from stage_metrics import ServerTimingMiddleware, StageMetrics
+from single_flight import AsyncSingleFlight
+from profiler import create_profiler_router
+from pathlib import Path
 from PIL import Image
-import torch
-from transformers import ViTImageProcessor, ViTForImageClassification
 import io
+from multipart.multipart import MultipartParser, parse_options_header
+import numpy as np
+import asyncio
 import logging
-import base64
+import os
+import time
+
+try:
+    from transformers import ViTImageProcessor
+except ImportError:  # benchmarks/load_test.py serves this app with a stand-in processor
+    ViTImageProcessor = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# --- BATCHING CONFIGURATION ---
+# Concurrent uploads are grouped into one forward pass of up to MAX_BATCH_SIZE images,
+# waiting at most MAX_BATCH_WAIT_MS after the first image of a batch arrives.
+MAX_BATCH_SIZE = int(os.environ.get("ML_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.environ.get("ML_MAX_BATCH_WAIT_MS", "10"))
+
+# Largest accepted image upload; base64 JSON bodies may be up to 4/3 of this
+MAX_UPLOAD_BYTES = int(os.environ.get("ML_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# /predict requests handled at once per process; beyond this new ones get a 503 so a
+# CPU-bound worker sheds load instead of queueing without bound (0 = unlimited)
+MAX_CONCURRENCY = int(os.environ.get("ML_MAX_CONCURRENCY", "0"))
+
+# --- PREDICTION CACHE CONFIGURATION ---
+# ML_CACHE_DB enables the on-disk tier; ML_CACHE_PHASH_DISTANCE >= 0 also serves
+# near-duplicate photos whose perceptual hashes differ by at most that many bits.
+CACHE_SIZE = int(os.environ.get("ML_CACHE_SIZE", "4096"))
+CACHE_DB = os.environ.get("ML_CACHE_DB", "")
+CACHE_DISK_ENTRIES = int(os.environ.get("ML_CACHE_DISK_ENTRIES", "100000"))
+CACHE_PHASH_DISTANCE = int(os.environ.get("ML_CACHE_PHASH_DISTANCE", "-1"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load models (in the background unless MODEL_LOADING=eager) and run the inference
+    scheduler for the lifetime of the server"""
+    loader.start()
+    if MODEL_LOADING == "eager":
+        await asyncio.get_running_loop().run_in_executor(None, loader.wait)
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    if preprocess_pool is not None:
+        preprocess_pool.shutdown(wait=False)
+    if prediction_cache is not None:
+        prediction_cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -21,56 +76,354 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage latency histograms, served on /metrics and in Server-Timing headers
+metrics = StageMetrics("ml")
+app.add_middleware(ServerTimingMiddleware, metrics=metrics)
+
+# On-demand /debug/profile and /debug/allocations, only when PROFILER_TOKEN is set
+profiler_router = create_profiler_router()
+if profiler_router is not None:
+    app.include_router(profiler_router)
+
 # --- AI MODELS ---
+# Loaded by the steps below when the server starts; /readyz reports their progress.
 model_name = "wambugu71/crop_leaf_diseases_vit"
-logger.info("Loading AI models...")
-try:
-    processor = ViTImageProcessor.from_pretrained(model_name)
-    model = ViTForImageClassification.from_pretrained(model_name)
-    logger.info("✅ ML Models loaded successfully!")
-    MODELS_AVAILABLE = True
-except Exception as e:
-    logger.error(f"❌ Error loading models: {e}")
-    MODELS_AVAILABLE = False
+model_revision = os.environ.get("ML_MODEL_REVISION", "main")
+processor = None
+classifier = None
+# Decode/preprocess workers (see image_preprocess)
+preprocess_pool = None
+# Cached predictions are only valid for the model revision and backend that produced them
+prediction_cache = None
 
-@app.post("/predict")
-async def predict(request: dict):
-    if not MODELS_AVAILABLE:
-        raise HTTPException(status_code=503, detail="ML Model not available")
+def load_processor() -> "ViTImageProcessor":
+    if ViTImageProcessor is None:
+        raise RuntimeError("The ViT processor needs transformers (pip install -r requirements.txt)")
+    return ViTImageProcessor.from_pretrained(model_name, revision=model_revision)
+
+def load_model():
+    # Backend and thread counts come from ML_BACKEND / ML_*_OP_THREADS (see vit_inference)
+    return load_classifier(model_name, model_revision)
+
+def start_preprocess_pool():
+    global preprocess_pool
+    preprocess_pool = create_pool(processor)
+
+def warmup():
+    """Validate the backend, then push one image through the pool and the model so the
+    first real request does not pay for lazy initialisation"""
+    validate_classifier(classifier, lambda data: preprocess_image(data).pixel_values)
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (90, 140, 60)).save(buffer, format="JPEG")
+    prepared = preprocess_pool.submit(preprocess_image, buffer.getvalue()).result()
+    forward_batch([prepared.pixel_values])
+
+def open_prediction_cache():
+    global prediction_cache
+    prediction_cache = PredictionCache(
+        f"{model_name}@{classifier.revision}/{classifier.backend}/logits", max_entries=CACHE_SIZE,
+        db_path=Path(CACHE_DB) if CACHE_DB else None, max_disk_entries=CACHE_DISK_ENTRIES,
+        phash_distance=CACHE_PHASH_DISTANCE,
+    )
+
+def create_loader(make_processor: Callable = load_processor, make_classifier: Callable = load_model) -> ModelLoader:
+    """Load steps of the service; benchmarks/load_test.py passes stand-in models"""
+    def processor_step():
+        global processor
+        processor = make_processor()
+        init_worker(processor)
+
+    def model_step():
+        global classifier
+        classifier = make_classifier()
+
+    loader = ModelLoader()
+    loader.add("vit_processor", processor_step)
+    loader.add("vit_model", model_step)
+    loader.add("preprocess_pool", start_preprocess_pool, depends_on=["vit_processor"])
+    loader.add("warmup", warmup, depends_on=["vit_model", "preprocess_pool"])
+    loader.add("prediction_cache", open_prediction_cache, depends_on=["warmup"])
+    return loader
+
+loader = create_loader()
+
+def require_ready():
+    """503 until every model has loaded and warmed up"""
+    if not loader.ready:
+        detail = "ML Model not available" if loader.failed else "ML Model loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+def forward_batch(pixel_values: List[np.ndarray]) -> List[Dict]:
+    """Run one batched forward pass and return the logits of each image"""
+    logits = classifier.logits(np.concatenate(pixel_values, axis=0))
+    return [{"logits": row.tolist()} for row in logits]
+
+class InferenceScheduler:
+    """Queues preprocessed images and runs them through the model in micro-batches.
+
+    A batch is dispatched once it holds max_batch_size images or max_wait_ms after its
+    first image arrived. Forward passes run on one worker thread, so the event loop keeps
+    accepting uploads while the model is busy and those uploads form the next batch.
+    """
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vit-inference")
+        self.queue = None
+        self._task = None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Inference scheduler started (max batch {self.max_batch_size}, "
+                    f"max wait {self.max_wait * 1000:.0f}ms)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=False)
+
+    async def predict(self, pixel_values: np.ndarray) -> Dict:
+        """Queue one preprocessed image (1 x C x H x W) and wait for its prediction"""
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((pixel_values, future))
+        result, forward_seconds = await future
+        # Everything but the batch's forward pass was spent waiting for the batch to form or run
+        metrics.record("queue", time.perf_counter() - start - forward_seconds)
+        metrics.record("forward", forward_seconds)
+        return result
+
+    async def _next_batch(self):
+        """Wait for one request, then collect more until the batch is full or the wait expires"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Requests whose client already went away are dropped before the forward pass
+        return [(pixel_values, future) for pixel_values, future in batch if not future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                start = time.perf_counter()
+                results = await loop.run_in_executor(
+                    self.executor, forward_batch, [pixel_values for pixel_values, _ in batch]
+                )
+                forward_seconds = time.perf_counter() - start
+            except Exception as e:
+                logger.error(f"Batch inference error: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result((result, forward_seconds))
 
+scheduler = InferenceScheduler()
+# Concurrent cold predictions for the same image, keyed by digest (or perceptual hash)
+flights = AsyncSingleFlight()
+
+def check_content_length(request: Request, limit: int):
+    """Reject a body whose declared length is over limit before reading any of it"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Upload larger than {limit} bytes")
+
+async def read_raw_upload(request: Request, limit: int) -> bytes:
+    """Read a raw image body chunk by chunk, stopping as soon as it exceeds limit"""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Upload larger than {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def read_multipart_upload(request: Request, boundary: bytes, limit: int) -> bytes:
+    """Stream a multipart body and keep only the first file part (or the "image" field)"""
+    chunks = []
+    state = {"size": 0, "header": b"", "value": b"", "capture": False, "done": False}
+
+    def on_part_begin():
+        state["capture"] = False
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        if state["header"].lower() == b"content-disposition" and not state["done"]:
+            _, options = parse_options_header(state["value"])
+            state["capture"] = b"filename" in options or options.get(b"name") == b"image"
+        state["header"] = state["value"] = b""
+
+    def on_part_data(data, start, end):
+        if state["capture"]:
+            state["size"] += end - start
+            if state["size"] > limit:
+                raise HTTPException(status_code=413, detail=f"Upload larger than {limit} bytes")
+            chunks.append(data[start:end])
+
+    def on_part_end():
+        if state["capture"]:
+            state["capture"] = False
+            state["done"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        if state["done"]:
+            break
+    if not state["done"]:
+        raise HTTPException(status_code=400, detail="No image file in multipart upload")
+    return b"".join(chunks)
+
+async def predict_uncached(prepared) -> Dict:
+    """Run one prepared image through the next micro-batch and cache the prediction"""
+    prediction = await scheduler.predict(prepared.pixel_values)
     try:
-        image_data = request.get("image")
-        if not image_data:
-            raise HTTPException(status_code=400, detail="No base64 image provided")
-        
-        # Decode base64 image
-        if "," in image_data:
-            image_data = image_data.split(",")[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        
-        # Preprocess and predict
-        inputs = processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        predicted_class_idx = outputs.logits.argmax(-1).item()
-        predicted_label = model.config.id2label[predicted_class_idx]
-        
-        # Get confidence score
-        probabilities = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        confidence = probabilities[0][predicted_class_idx].item()
+        await asyncio.to_thread(prediction_cache.put, prepared.digest, prepared.phash, prediction)
+    except Exception as e:
+        # The prediction is still good; only later repeats of this image miss the cache
+        logger.warning(f"Prediction cache write failed: {e}")
+    return prediction
+
+async def predict_image(preprocess, image, top_k: int = TOP_K) -> Dict:
+    """Decode and preprocess in the worker pool, then answer from the cache or predict
+    as part of the next micro-batch. Everything reported is derived from the logits."""
+    try:
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(preprocess_pool, preprocess, image)
+        metrics.record_all(prepared.timings)
+        with metrics.stage("cache"):
+            # May read SQLite: keep it off the event loop
+            prediction = await asyncio.to_thread(prediction_cache.get, prepared.digest, prepared.phash)
+        cached = prediction is not None
+        if not cached:
+            # Identical uploads in flight (perceptually identical ones when near-duplicate
+            # matching is on) share one forward pass
+            key = prepared.phash if CACHE_PHASH_DISTANCE >= 0 else prepared.digest
+            prediction = await flights.do(key, lambda: predict_uncached(prepared))
 
+        with metrics.stage("softmax"):
+            description = describe_logits(prediction["logits"], classifier.id2label, top_k)
         return {
-            "label": predicted_label,
-            "confidence": confidence,
+            **description,
+            "cached": cached,
             "status": "success"
         }
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         return {"status": "error", "message": str(e)}
 
+# /predict requests currently being handled (one event loop per process, so no lock)
+in_flight = 0
+
+@app.post("/predict")
+async def predict(request: Request, top_k: int = TOP_K):
+    """Classify a leaf image.
+
+    Send the image bytes as the body (image/* or application/octet-stream) or as a
+    multipart/form-data file. The JSON {"image": "<base64 data URL>"} form is kept for
+    older clients but costs a third more bandwidth and several extra copies.
+
+    Returns the best label with its crop/disease split, the top_k labels with
+    probabilities and, when ML_TEMPERATURE is set, a calibrated confidence.
+    """
+    global in_flight
+    require_ready()
+    if MAX_CONCURRENCY and in_flight >= MAX_CONCURRENCY:
+        raise HTTPException(status_code=503, detail="ML service busy", headers={"Retry-After": "1"})
+    in_flight += 1
+    try:
+        return await classify_upload(request, top_k)
+    finally:
+        in_flight -= 1
+
+async def classify_upload(request: Request, top_k: int) -> Dict:
+    """Read the upload in whichever encoding the client used and classify it"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type == b"application/json":
+        check_content_length(request, MAX_UPLOAD_BYTES * 4 // 3 + 1024)
+        try:
+            with metrics.stage("json_parse"):
+                payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        image_data = payload.get("image") if isinstance(payload, dict) else None
+        if not image_data:
+            return {"status": "error", "message": "No base64 image provided"}
+        return await predict_image(preprocess_base64, image_data, top_k)
+
+    check_content_length(request, MAX_UPLOAD_BYTES)
+    with metrics.stage("upload"):
+        if content_type == b"multipart/form-data":
+            if b"boundary" not in options:
+                raise HTTPException(status_code=400, detail="Missing multipart boundary")
+            image_bytes = await read_multipart_upload(request, options[b"boundary"], MAX_UPLOAD_BYTES)
+        else:
+            image_bytes = await read_raw_upload(request, MAX_UPLOAD_BYTES)
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Empty image upload")
+    return await predict_image(preprocess_image, image_bytes, top_k)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit ratios of the prediction cache and how many cold predictions were coalesced"""
+    require_ready()
+    return {**prediction_cache.stats(), "coalescing": flights.stats()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage and request latency histograms in Prometheus text format"""
+    body = metrics.render() + "\n".join([
+        "# HELP agrimithra_coalesced_requests_total Cold predictions that ran (leader) or waited for an identical one (follower)",
+        "# TYPE agrimithra_coalesced_requests_total counter",
+        *flights.render("agrimithra_coalesced_requests_total", 'service="ml"'),
+    ]) + "\n"
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, whether or not models have loaded"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once every model has loaded and warmed up, 503 before that or if a
+    load failed; reports the state and load time of each model"""
+    status = loader.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
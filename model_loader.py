@@ -0,0 +1,120 @@
+"""
+AgriMithra model loader
+Loads models on background threads so a service can bind its port and answer liveness
+probes immediately. Independent loads run in parallel; a load starts as soon as the ones it
+depends on are done. Per-model state and timings back the /readyz endpoints.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# "background": serve immediately and load in parallel; "eager": load before serving
+MODEL_LOADING = os.environ.get("MODEL_LOADING", "background")
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class _Task:
+    def __init__(self, name: str, load: Callable[[], None], depends_on: Sequence[str], required: bool):
+        self.name = name
+        self.load = load
+        self.depends_on = tuple(depends_on)
+        self.required = required
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.done = threading.Event()
+
+
+class ModelLoader:
+    """Runs named load steps once, honouring dependencies between them.
+
+    A step whose dependency failed is marked failed without running. The loader is ready
+    once every required step has succeeded.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.started_at = time.time()
+        self._tasks: Dict[str, _Task] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add(self, name: str, load: Callable[[], None], depends_on: Sequence[str] = (), required: bool = True):
+        """Register a load step; dependencies must be registered first"""
+        for dependency in depends_on:
+            if dependency not in self._tasks:
+                raise ValueError(f"'{name}' depends on unknown step '{dependency}'")
+        self._tasks[name] = _Task(name, load, depends_on, required)
+
+    def start(self):
+        """Start every step on a worker pool and return immediately"""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-loader")
+        for task in self._tasks.values():
+            self._executor.submit(self._run, task)
+        self._executor.shutdown(wait=False)
+
+    def _run(self, task: _Task):
+        for dependency in task.depends_on:
+            self._tasks[dependency].done.wait()
+        failed = [d for d in task.depends_on if self._tasks[d].state != READY]
+        if failed:
+            task.state = FAILED
+            task.error = f"dependency failed: {', '.join(failed)}"
+            task.done.set()
+            return
+
+        task.state = LOADING
+        task.started_at = time.time()
+        start = time.perf_counter()
+        try:
+            task.load()
+            task.state = READY
+            logger.info(f"Loaded {task.name} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            task.state = FAILED
+            task.error = str(e)
+            logger.error(f"❌ Error loading {task.name}: {e}")
+        task.seconds = time.perf_counter() - start
+        task.done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every step has finished; returns ready"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for task in self._tasks.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not task.done.wait(remaining):
+                return False
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return all(task.state == READY for task in self._tasks.values() if task.required)
+
+    @property
+    def failed(self) -> List[str]:
+        return [task.name for task in self._tasks.values() if task.required and task.state == FAILED]
+
+    def status(self) -> Dict:
+        """Readiness report: overall state plus state, error and load time of each step"""
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "models": {
+                task.name: {
+                    "state": task.state,
+                    "required": task.required,
+                    "seconds": None if task.seconds is None else round(task.seconds, 3),
+                    **({"error": task.error} if task.error else {}),
+                }
+                for task in self._tasks.values()
+            },
+        }
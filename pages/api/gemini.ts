@@ -3,6 +3,8 @@ import type { NextApiRequest, NextApiResponse } from 'next'
 
 let currentKeyIndex = 0;
 const MAX_RETRIES = 3;
+// Overridable so load tests can point the route at a local fake (benchmarks/load_test.py)
+const GEMINI_API_BASE = process.env.GEMINI_API_BASE || 'https://generativelanguage.googleapis.com';
 
 const getApiKeys = (): string[] => {
   const apiKeys: string[] = [];
@@ -42,7 +44,7 @@ const callGeminiAPI = async (prompt: string, apiKey: string, imageData?: string)
   contents.push({ parts });
 
   const response = await fetch(
-    `https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key=${apiKey}`,
+    `${GEMINI_API_BASE}/v1/models/gemini-2.5-flash:generateContent?key=${apiKey}`,
     {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
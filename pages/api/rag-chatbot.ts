@@ -2,21 +2,43 @@
 // File: /pages/api/rag-chatbot.ts
 import type { NextApiRequest, NextApiResponse } from 'next'
 
+const RAG_SERVICE_URL = process.env.RAG_SERVICE_URL || process.env.NEXT_PUBLIC_RAG_SERVICE_URL || 'http://localhost:8000'
+
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
   if (req.method !== 'POST') {
     return res.status(405).json({ error: 'Method not allowed' })
   }
-  const { query, language } = req.body
+  const { query, language, scorer, stream } = req.body
   try {
-    // TODO: Update URL if deploying RAG backend
-    const ragRes = await fetch('http://localhost:8000/rag-chatbot', {
+    const ragRes = await fetch(`${RAG_SERVICE_URL}/rag-chatbot`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ query, language }),
+      body: JSON.stringify({ query, language, scorer, stream }),
     })
-    const data = await ragRes.json()
-    return res.status(200).json(data)
+    const isEventStream = (ragRes.headers.get('content-type') || '').startsWith('text/event-stream')
+    if (stream && ragRes.ok && isEventStream && ragRes.body) {
+      // Relay Server-Sent Events chunk by chunk so the first answer part reaches the client early
+      res.writeHead(ragRes.status, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache, no-transform',
+        Connection: 'keep-alive',
+      })
+      const reader = ragRes.body.getReader()
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        res.write(value)
+      }
+      return res.end()
+    }
+    // Errors (e.g. a 400 for an invalid stream flag) come back as JSON even when streaming
+    // was requested; relay them with the backend's status
+    const data = await ragRes.json().catch(() => ({ error: `RAG backend returned ${ragRes.status}` }))
+    return res.status(ragRes.status).json(data)
   } catch (err) {
+    if (res.headersSent) {
+      return res.end()
+    }
     return res.status(500).json({ error: 'RAG backend unavailable' })
   }
 }
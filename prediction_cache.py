@@ -0,0 +1,202 @@
+"""
+AgriMithra prediction cache
+Content-addressed cache of leaf-disease predictions. Resent or forwarded photos skip the
+ViT forward pass: entries are keyed by a digest of the image bytes and, optionally, matched
+by perceptual hash for near-duplicates (re-encoded or resized copies of the same photo).
+An in-memory LRU tier can be backed by a SQLite file that survives restarts.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Perceptual hashes are indexed by bands of at least this many bits; a larger match
+# distance would make the bands so narrow that most entries collide, so it scans instead
+MIN_BAND_BITS = 8
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def hash_bands(distance: int, bits: int = 64) -> Optional[List[Tuple[int, int]]]:
+    """(shift, mask) of distance + 1 near-equal bands covering a bits-wide hash, or None if
+    they would be narrower than MIN_BAND_BITS.
+
+    Two hashes at most distance bits apart differ in at most distance bands, so they agree
+    exactly on at least one (multi-index hashing): looking up each band of a query hash finds
+    every candidate without comparing against all entries.
+    """
+    count = distance + 1
+    if bits // count < MIN_BAND_BITS:
+        return None
+    bands, shift = [], 0
+    for i in range(count):
+        width = bits // count + (1 if i < bits % count else 0)
+        bands.append((shift, (1 << width) - 1))
+        shift += width
+    return bands
+
+
+def _signed64(value: int) -> int:
+    """SQLite integers are signed, so 64-bit hashes are stored in two's complement"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class PredictionCache:
+    """Two-tier prediction cache scoped to one model id and revision.
+
+    Lookups try the exact digest in memory, then on disk, then (if phash_distance >= 0)
+    the closest perceptual hash in memory within phash_distance bits, found through a
+    banded index of the in-memory hashes. A disk tier written by a different model or
+    revision is emptied when opened. Lookups can block on SQLite, so call get() and put()
+    off the event loop.
+    """
+
+    def __init__(self, model_key: str, max_entries: int = 4096, db_path: Optional[Path] = None,
+                 max_disk_entries: int = 100000, phash_distance: int = -1):
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.phash_distance = phash_distance
+        self.hits = 0
+        self.disk_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # digest -> (phash, prediction)
+        self._bands = hash_bands(phash_distance) if phash_distance >= 0 else None
+        # One {band value: digests} table per band
+        self._band_tables: List[Dict[int, Set[str]]] = [{} for _ in self._bands or ()]
+        self._lock = threading.Lock()
+        self._db = self._open_db(db_path) if db_path else None
+
+    def _open_db(self, db_path: Path) -> Optional[sqlite3.Connection]:
+        """Open the disk tier, dropping its entries if they came from another model"""
+        try:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                       "(digest TEXT PRIMARY KEY, phash INTEGER, prediction TEXT)")
+            row = db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+            if row is None or row[0] != self.model_key:
+                if row is not None:
+                    logger.info(f"Model changed ({row[0]} -> {self.model_key}), clearing {db_path}")
+                db.execute("DELETE FROM predictions")
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (self.model_key,))
+            logger.info(f"Prediction cache disk tier: {db_path}")
+            return db
+        except sqlite3.Error as e:
+            logger.warning(f"Prediction cache disk tier disabled ({db_path}): {e}")
+            return None
+
+    def get(self, digest: str, phash: Optional[int] = None) -> Optional[Dict]:
+        """Cached prediction for an image, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT phash, prediction FROM predictions WHERE digest = ?",
+                                       (digest,)).fetchone()
+                if row is not None:
+                    prediction = json.loads(row[1])
+                    self._remember(digest, row[0] & ((1 << 64) - 1), prediction)
+                    self.disk_hits += 1
+                    return prediction
+
+            if phash is not None and self.phash_distance >= 0:
+                best = None
+                for cached_phash, prediction in self._near_candidates(phash):
+                    distance = hamming_distance(phash, cached_phash)
+                    if distance <= self.phash_distance and (best is None or distance < best[0]):
+                        best = (distance, prediction)
+                if best is not None:
+                    self.perceptual_hits += 1
+                    return best[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, digest: str, phash: int, prediction: Dict):
+        """Store a prediction in both tiers"""
+        with self._lock:
+            self._remember(digest, phash, prediction)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                     (digest, _signed64(phash), json.dumps(prediction)))
+                    # Rowids grow with each insert, so the smallest ones are the oldest entries
+                    self._db.execute("DELETE FROM predictions WHERE rowid <= "
+                                     "(SELECT MAX(rowid) FROM predictions) - ?", (self.max_disk_entries,))
+                except sqlite3.Error as e:
+                    logger.warning(f"Prediction cache write failed: {e}")
+
+    def _near_candidates(self, phash: int):
+        """(phash, prediction) of the entries that may be within phash_distance of phash"""
+        if self._bands is None:
+            return self._entries.values()
+        digests = set()
+        for (shift, mask), table in zip(self._bands, self._band_tables):
+            digests.update(table.get((phash >> shift) & mask, ()))
+        return [self._entries[digest] for digest in digests]
+
+    def _remember(self, digest: str, phash: int, prediction: Dict):
+        if self.max_entries <= 0:
+            return
+        if digest not in self._entries:
+            self._index(digest, phash, add=True)
+        self._entries[digest] = (phash, prediction)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            evicted, (evicted_phash, _) = self._entries.popitem(last=False)
+            self._index(evicted, evicted_phash, add=False)
+
+    def _index(self, digest: str, phash: int, add: bool):
+        """Add digest to, or remove it from, the band tables"""
+        for (shift, mask), table in zip(self._bands or (), self._band_tables):
+            key = (phash >> shift) & mask
+            if add:
+                table.setdefault(key, set()).add(digest)
+            else:
+                digests = table[key]
+                digests.discard(digest)
+                if not digests:
+                    del table[key]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.hits + self.disk_hits + self.perceptual_hits
+            lookups = hits + self.misses
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            return {
+                "model": self.model_key,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_entries": disk_entries,
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "perceptual_hits": self.perceptual_hits,
+                "misses": self.misses,
+                "hit_ratio": (hits / lookups) if lookups else 0.0,
+                "memory_hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "disk_hit_ratio": (self.disk_hits / lookups) if lookups else 0.0,
+                "perceptual_hit_ratio": (self.perceptual_hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,128 @@
+"""
+AgriMithra live profiler
+On-demand profiling of a running service, for chasing latency spikes and memory growth
+without restarting it under a profiler. Disabled unless PROFILER_TOKEN is set.
+
+- GET /debug/profile?seconds=10&hz=100 samples every thread's Python stack and returns
+  collapsed stacks ("thread;module:function:line;... count"), ready for flamegraph.pl,
+  speedscope or inferno.
+- GET /debug/allocations?seconds=10&top=50 traces allocations with tracemalloc for the
+  window and returns the call sites whose live memory grew the most.
+
+Both require the token in an X-Profiler-Token header. Only one session runs per process at a
+time and sessions are capped at MAX_SECONDS. Behind serve.py each request profiles the
+one worker that received it.
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+# Shared secret for the /debug endpoints; empty keeps them unregistered
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+
+# Longest profiling session, and the sampling rate ceiling; each sample briefly holds the GIL
+MAX_SECONDS = 60
+MAX_HZ = 1000
+
+# Frames kept per allocation traceback; deeper tracebacks cost more memory while tracing
+ALLOCATION_FRAMES = int(os.environ.get("PROFILER_ALLOCATION_FRAMES", "10"))
+
+_session = threading.Lock()
+
+
+def sample_stacks(seconds: float, hz: int = 100) -> Counter:
+    """Collapsed stack -> sample count for every thread but the sampler, root frame first"""
+    own = threading.get_ident()
+    interval = 1.0 / hz
+    samples: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def allocation_growth(seconds: float, top: int = 50) -> str:
+    """Call sites ranked by net memory allocated during the window and still alive"""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(ALLOCATION_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    # Ignore tracemalloc's own bookkeeping
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+    growth = sum(stat.size_diff for stat in diff)
+    lines = [f"# {seconds:g}s window, net growth {growth / 1024:.1f} KiB, top {top} call sites"]
+    for stat in diff[:top]:
+        lines.append(f"{stat.size_diff / 1024:+.1f} KiB, {stat.count_diff:+d} blocks "
+                     f"(now {stat.size / 1024:.1f} KiB in {stat.count} blocks)")
+        lines += [f"    {line}" for line in stat.traceback.format(most_recent_first=True)]
+    return "\n".join(lines) + "\n"
+
+
+def _run_session(work, *args):
+    """Run one profiling session, refusing if another is already running in this process"""
+    if not _session.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    try:
+        return work(*args)
+    finally:
+        _session.release()
+
+
+def create_profiler_router(token: str = PROFILER_TOKEN) -> Optional[APIRouter]:
+    """/debug profiling endpoints guarded by token, or None when profiling is disabled"""
+    if not token:
+        return None
+
+    def check_token(given: Optional[str]):
+        if not given or not hmac.compare_digest(given.encode(), token.encode()):
+            raise HTTPException(status_code=403, detail="Invalid profiler token")
+
+    router = APIRouter(prefix="/debug")
+
+    @router.get("/profile")
+    async def profile(seconds: float = Query(10, gt=0, le=MAX_SECONDS), hz: int = Query(100, gt=0, le=MAX_HZ),
+                      x_profiler_token: Optional[str] = Header(None)):
+        """Sample all threads for `seconds` and return collapsed stacks"""
+        check_token(x_profiler_token)
+        # The sampler runs on a pool thread so the event loop keeps serving (and being sampled)
+        samples = await run_in_threadpool(_run_session, sample_stacks, seconds, hz)
+        body = "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+        return PlainTextResponse(body)
+
+    @router.get("/allocations")
+    async def allocations(seconds: float = Query(10, gt=0, le=MAX_SECONDS), top: int = Query(50, gt=0, le=1000),
+                          x_profiler_token: Optional[str] = Header(None)):
+        """Trace allocations for `seconds` and return the call sites that grew the most"""
+        check_token(x_profiler_token)
+        return PlainTextResponse(await run_in_threadpool(_run_session, allocation_growth, seconds, top))
+
+    return router
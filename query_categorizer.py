@@ -0,0 +1,127 @@
+"""
+AgriMithra query categorizer
+Compiles every category keyword into one trie-shaped regular expression at startup, so a
+query is categorized in a single scan instead of one substring search per keyword.
+Keyword tables can be extended from knowledge_base/categories.json without code changes.
+"""
+
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES_FILENAME = "categories.json"
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Regex source matching any of words, factored into a trie so matching cost does not
+    grow with the number of keywords. At a given position the longest keyword wins."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class QueryCategorizer:
+    """Scores every category in one pass over the query.
+
+    Scores match the original substring rules exactly: a category gets +1 for each of its
+    keywords that appears anywhere in the lowercased query. The scan reports the longest
+    keyword starting at each position; keywords contained in it (e.g. "pest" inside
+    "pesticide") are counted through a precomputed containment table.
+    """
+
+    def __init__(self, category_keywords: Dict[str, List[str]]):
+        self.categories = list(category_keywords)
+        keywords = sorted({kw.lower() for kws in category_keywords.values() for kw in kws if kw})
+
+        # keyword -> indexes of the categories it belongs to
+        self._keyword_categories: Dict[str, Tuple[int, ...]] = {
+            keyword: tuple(i for i, category in enumerate(self.categories)
+                           if keyword in (kw.lower() for kw in category_keywords[category]))
+            for keyword in keywords
+        }
+        # keyword -> every keyword occurring inside it (itself included)
+        self._contained: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(other for other in keywords if other in keyword) for keyword in keywords
+        }
+        self._pattern = re.compile(_trie_pattern(keywords)) if keywords else None
+
+    def scores(self, query: str) -> List[int]:
+        """Keyword hit count per category, in category order"""
+        scores = [0] * len(self.categories)
+        if self._pattern is None:
+            return scores
+
+        query = query.lower()
+        found = set()
+        search = self._pattern.search
+        match = search(query)
+        while match is not None:
+            found.update(self._contained[match.group()])
+            match = search(query, match.start() + 1)
+
+        for keyword in found:
+            for category_index in self._keyword_categories[keyword]:
+                scores[category_index] += 1
+        return scores
+
+    def categorize(self, query: str) -> str:
+        """Category with the highest score (first on ties), or "general" if nothing matched"""
+        scores = self.scores(query)
+        max_score = max(scores, default=0)
+        if max_score == 0:
+            return "general"
+        return self.categories[scores.index(max_score)]
+
+
+def load_category_config(knowledge_dir: Path, keywords: Dict[str, List[str]], intros: Dict[str, str],
+                         followups: Dict[str, List[str]]) -> Tuple[Dict, Dict, Dict]:
+    """Merge knowledge_dir/categories.json into copies of the built-in category tables.
+
+    The file maps a category id to any of {"keywords": [...], "intro": "...",
+    "followups": [...]}. Keywords extend an existing category; intro and follow-ups replace it.
+    """
+    keywords = {category: list(kws) for category, kws in keywords.items()}
+    intros = dict(intros)
+    followups = {category: list(questions) for category, questions in followups.items()}
+
+    path = knowledge_dir / CATEGORIES_FILENAME
+    if not path.is_file():
+        return keywords, intros, followups
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("expected an object keyed by category id")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring category config {path}: {e}")
+        return keywords, intros, followups
+
+    for category, entry in config.items():
+        if not isinstance(entry, dict):
+            logger.warning(f"Ignoring category '{category}' in {path}: expected an object")
+            continue
+        if entry.get("keywords"):
+            existing = keywords.setdefault(category, [])
+            existing.extend(str(kw).lower() for kw in entry["keywords"] if str(kw).lower() not in existing)
+        if entry.get("intro"):
+            intros[category] = str(entry["intro"])
+        if entry.get("followups"):
+            followups[category] = [str(question) for question in entry["followups"]]
+    logger.info(f"Loaded category config for {len(config)} categories from {path}")
+    return keywords, intros, followups
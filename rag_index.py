@@ -0,0 +1,298 @@
+"""
+AgriMithra keyword index
+Tokenized inverted index used by the Simple RAG service. Built once at startup so
+a query only touches the posting lists of its own terms. Pure Python, no ML libraries.
+"""
+
+import heapq
+import math
+import re
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Searchable document fields, kept as separate posting lists so title hits can be weighted
+FIELDS = ("title", "content")
+
+# BM25F parameters: title matches count double, mirroring the legacy +2/+1 weighting
+FIELD_WEIGHTS = {"title": 2.0, "content": 1.0}
+FIELD_B = {"title": 0.75, "content": 0.75}
+BM25_K1 = 1.2
+
+# Very common words carry no ranking signal but have the longest posting lists
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "my", "of", "on", "or", "the", "this", "to", "what",
+    "when", "where", "which", "with", "vs",
+])
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=65536)
+def normalize_term(token: str) -> str:
+    """Fold simple English plurals so "tomatoes" and "tomato" share a term"""
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("ches", "shes", "xes", "oes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into normalized word tokens"""
+    return [normalize_term(token) for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def bm25_idf(num_docs: int, doc_freq: int) -> float:
+    """BM25 inverse document frequency (always positive)"""
+    return math.log(1.0 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+class IndexLookupMixin:
+    """Term statistics and substring matching shared by the in-memory and mapped indexes"""
+
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing term in any field"""
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else self.doc_freqs[term_id]
+
+    def term_idf(self, term: str) -> Optional[float]:
+        """Precomputed IDF of term, or None if it is not indexed"""
+        term_id = self.term_ids.get(term)
+        return None if term_id is None else self.idf[term_id]
+
+    def substring_docs(self, field: str, word: str) -> Iterable[int]:
+        """Doc ids whose lowercased field text contains word anywhere, as `word in text` would.
+
+        Word characters can only occur inside one raw token, so a plain word is answered
+        from the raw-token postings. A word with punctuation may span tokens: its word pieces
+        narrow the candidates down, then the candidates' text is checked.
+        """
+        if TOKEN_PATTERN.fullmatch(word):
+            return self._raw_docs(field, word)
+        candidates = None
+        for piece in TOKEN_PATTERN.findall(word):
+            docs = self._raw_docs(field, piece)
+            candidates = docs if candidates is None else candidates & docs
+            if not candidates:
+                return set()
+        if candidates is None:  # no word characters at all: only a scan can tell
+            candidates = range(self.num_docs)
+        return {doc_id for doc_id in candidates if word in self.field_text(field, doc_id).lower()}
+
+    def _raw_docs(self, field: str, piece: str) -> set:
+        """Doc ids with a raw token in field containing piece"""
+        docs = set()
+        for term in self._raw_terms_containing(piece):
+            docs.update(self.raw_lookup(field, term))
+        return docs
+
+    def _raw_terms_containing(self, piece: str) -> List[str]:
+        """Raw tokens containing piece, found through the trigram table"""
+        if len(piece) < 3:
+            return [term for term in self.raw_vocabulary if piece in term]
+        term_lists = sorted((self.trigram_terms(piece[i:i + 3]) for i in range(len(piece) - 2)), key=len)
+        term_ids = set(term_lists[0])
+        for other in term_lists[1:]:
+            if not term_ids:
+                break
+            term_ids.intersection_update(other)
+        vocabulary = self.raw_vocabulary
+        return [term for term in (vocabulary[term_id] for term_id in term_ids) if piece in term]
+
+
+def trigrams(term: str) -> Iterable[str]:
+    """Distinct 3-character substrings of term"""
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+class InvertedIndex(IndexLookupMixin):
+    """Term -> posting list of doc ids and term frequencies, one table per field.
+
+    Alongside the normalized terms scored by BM25 it keeps the raw lowercased tokens of each
+    field and a trigram table over them, which answer the legacy scorer's substring matches.
+    """
+
+    def __init__(self, documents: List[Dict]):
+        """Tokenize every document once and build postings and BM25 statistics"""
+        self.num_docs = len(documents)
+        self.documents = documents
+        self.postings: Dict[str, Dict[str, Tuple[array, array]]] = {field: {} for field in FIELDS}
+        self.raw_postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        self.field_lengths: Dict[str, array] = {field: array("I") for field in FIELDS}
+
+        for doc_id, doc in enumerate(documents):
+            for field in FIELDS:
+                raw_tokens = TOKEN_PATTERN.findall(doc.get(field, "").lower())
+                tokens = [normalize_term(token) for token in raw_tokens]
+                self.field_lengths[field].append(len(tokens))
+                field_postings = self.postings[field]
+                for term, tf in Counter(tokens).items():
+                    if term not in field_postings:
+                        field_postings[term] = (array("I"), array("H"))
+                    doc_ids, tfs = field_postings[term]
+                    doc_ids.append(doc_id)
+                    tfs.append(min(tf, 0xFFFF))
+                raw_field_postings = self.raw_postings[field]
+                for token in dict.fromkeys(raw_tokens):
+                    if token not in raw_field_postings:
+                        raw_field_postings[token] = array("I")
+                    raw_field_postings[token].append(doc_id)
+
+        self.vocabulary = sorted(set().union(*(self.postings[field] for field in FIELDS)))
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.vocabulary)}
+        self.raw_vocabulary = sorted(set().union(*(self.raw_postings[field] for field in FIELDS)))
+        self.trigram_table: Dict[str, array] = {}
+        for term_id, term in enumerate(self.raw_vocabulary):
+            for trigram in trigrams(term):
+                if trigram not in self.trigram_table:
+                    self.trigram_table[trigram] = array("I")
+                self.trigram_table[trigram].append(term_id)
+        self._compute_statistics()
+
+    def _compute_statistics(self):
+        """Precompute document frequencies, IDF and per-field length norms"""
+        self.doc_freqs = array("I")
+        self.idf = array("f")
+        for term in self.vocabulary:
+            docs = set()
+            for field in FIELDS:
+                docs.update(self.lookup(field, term))
+            df = len(docs)
+            self.doc_freqs.append(df)
+            self.idf.append(bm25_idf(self.num_docs, df))
+
+        # BM25 length normalisation 1 - b + b * len / avg_len, stored per document
+        self.length_norms: Dict[str, array] = {}
+        for field in FIELDS:
+            lengths = self.field_lengths[field]
+            avg_len = (sum(lengths) / len(lengths)) if lengths else 0.0
+            b = FIELD_B[field]
+            self.length_norms[field] = array(
+                "f", ((1.0 - b + b * length / avg_len) if avg_len else 1.0 for length in lengths)
+            )
+
+    def lookup(self, field: str, term: str) -> array:
+        """Return the doc ids containing term in field (ascending)"""
+        return self.postings[field].get(term, _EMPTY_POSTING)[0]
+
+    def lookup_tf(self, field: str, term: str) -> Tuple[array, array]:
+        """Return the doc ids and matching term frequencies for term in field"""
+        return self.postings[field].get(term, _EMPTY_POSTING)
+
+    def raw_lookup(self, field: str, token: str) -> array:
+        """Return the doc ids whose field contains the raw lowercased token"""
+        return self.raw_postings[field].get(token, _EMPTY_POSTING[0])
+
+    def trigram_terms(self, trigram: str) -> array:
+        """Return the raw token ids containing trigram"""
+        return self.trigram_table.get(trigram, _EMPTY_POSTING[0])
+
+    def field_text(self, field: str, doc_id: int) -> str:
+        """Return the original text of a document field"""
+        return self.documents[doc_id].get(field, "")
+
+
+class MemoizedIndex:
+    """Wraps an index so repeated posting, substring and IDF lookups are computed once.
+
+    Used for a batch of queries against one snapshot, where many queries share terms.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.num_docs = index.num_docs
+        self.length_norms = index.length_norms
+        self._postings: Dict[Tuple[str, str], Tuple] = {}
+        self._substring_docs: Dict[Tuple[str, str], Iterable[int]] = {}
+        self._idf: Dict[str, Optional[float]] = {}
+
+    def lookup_tf(self, field: str, term: str):
+        key = (field, term)
+        if key not in self._postings:
+            self._postings[key] = self.index.lookup_tf(field, term)
+        return self._postings[key]
+
+    def lookup(self, field: str, term: str):
+        return self.lookup_tf(field, term)[0]
+
+    def substring_docs(self, field: str, word: str):
+        key = (field, word)
+        if key not in self._substring_docs:
+            self._substring_docs[key] = self.index.substring_docs(field, word)
+        return self._substring_docs[key]
+
+    def term_idf(self, term: str) -> Optional[float]:
+        if term not in self._idf:
+            self._idf[term] = self.index.term_idf(term)
+        return self._idf[term]
+
+
+def legacy_scores(index: InvertedIndex, query: str) -> Dict[int, float]:
+    """The original keyword search's title-weighted match counts: for each whitespace-separated
+    query word, +1 if the lowercased content contains it and +2 if the title does"""
+    scores: Dict[int, float] = {}
+    for word in query.lower().split():
+        if len(word) > 3:  # Only consider words with more than 3 characters
+            for doc_id in index.substring_docs("content", word):
+                scores[doc_id] = scores.get(doc_id, 0) + 1
+            for doc_id in index.substring_docs("title", word):
+                scores[doc_id] = scores.get(doc_id, 0) + 2  # Title matches are weighted higher
+    return scores
+
+
+def bm25_scores(index: InvertedIndex, query: str) -> Dict[int, float]:
+    """BM25F over the title and content fields using the precomputed statistics"""
+    scores: Dict[int, float] = {}
+    # Short terms like "npk", "dap" and "rot" are kept; only stopwords are dropped
+    terms = dict.fromkeys(term for term in tokenize(query) if term not in STOPWORDS)
+    for term in terms:
+        idf = index.term_idf(term)
+        if idf is None:
+            continue
+
+        # Combine field term frequencies into one saturated pseudo-frequency per doc
+        pseudo_tf: Dict[int, float] = {}
+        for field in FIELDS:
+            doc_ids, tfs = index.lookup_tf(field, term)
+            weight = FIELD_WEIGHTS[field]
+            norms = index.length_norms[field]
+            for doc_id, tf in zip(doc_ids, tfs):
+                pseudo_tf[doc_id] = pseudo_tf.get(doc_id, 0.0) + weight * tf / norms[doc_id]
+
+        for doc_id, tf in pseudo_tf.items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (BM25_K1 + tf)
+    return scores
+
+
+SCORERS = {
+    "legacy": legacy_scores,
+    "bm25": bm25_scores,
+}
+
+
+def top_k(scores: Dict[int, float], k: int) -> List[Tuple[int, float]]:
+    """Select the k best (doc_id, score) pairs with a bounded heap; ties keep doc order"""
+    return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+# Rank damping constant of reciprocal-rank fusion (Cormack et al. use 60)
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = RRF_K) -> Dict[int, float]:
+    """Fuse ranked doc id lists: each list adds 1 / (k + rank) to the docs it contains"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+_EMPTY_POSTING = (array("I"), array("H"))
@@ -0,0 +1,100 @@
+"""
+AgriMithra response cache
+Bounded LRU cache with per-category TTLs for chatbot responses. Repeated queries
+(e.g. the predefined UI buttons) skip categorization, search and answer assembly.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+# Seconds a cached answer stays valid, by category. Prices and weather go stale quickly.
+DEFAULT_CATEGORY_TTLS = {
+    "market_prices": 300,
+    "weather": 600,
+    "govt_schemes": 6 * 3600,
+    "general": 3600,
+    "fertilizers": 24 * 3600,
+    "pest_control": 24 * 3600,
+    "crop_disease": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: lowercase with collapsed whitespace"""
+    return " ".join(query.lower().split())
+
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries expire after their category's TTL"""
+
+    def __init__(self, max_entries: int = 1024, category_ttls: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.category_ttls = dict(DEFAULT_CATEGORY_TTLS if category_ttls is None else category_ttls)
+        self.clock = clock
+        self.generation = 0  # bumped by clear() so results computed before it are not stored
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, categories: Iterable[str]) -> float:
+        """Shortest TTL among the categories an entry depends on"""
+        return min((self.category_ttls.get(category, DEFAULT_TTL) for category in categories),
+                   default=DEFAULT_TTL)
+
+    def get(self, key: Hashable):
+        """Return the cached value for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value, categories: Iterable[str], generation: Optional[int] = None):
+        """Store value; skipped if the cache was cleared since generation was read"""
+        if self.max_entries <= 0:
+            return
+        expires_at = self.clock() + self.ttl_for(categories)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the knowledge base changed"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
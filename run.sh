@@ -40,11 +40,11 @@ install_deps() {
 # Start RAG and ML services
 start_services() {
     echo "Starting Local Services..."
-    $PYTHON_CMD run_simple_server.py &
+    $PYTHON_CMD serve.py rag --pid .rag.pid &
     RAG_PID=$!
     echo "RAG service started at port 8000 (PID: $RAG_PID)"
     
-    $PYTHON_CMD ml_service.py &
+    $PYTHON_CMD serve.py ml --pid .ml.pid &
     ML_PID=$!
     echo "ML Disease Prediction service started at port 8001 (PID: $ML_PID)"
 }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+AgriMithra production launcher
+Runs the Simple RAG service or the ML service under gunicorn with uvicorn workers.
+
+Usage:
+    python3 serve.py rag [--workers 4] [--bind 0.0.0.0:8000]
+    python3 serve.py ml  [--workers 2] [--max-concurrency 32]
+
+- The app is imported and its startup hook run once in the master before workers are forked (disable with
+  --no-preload). The packed corpus, keyword index and document embeddings are then built
+  once and shared copy-on-write by every worker. The garbage collector is frozen before
+  forking so collections in the workers do not touch, and so copy, those pages. ML models
+  still load in each worker after the fork, because torch thread pools and the preprocessing
+  pool do not survive fork.
+- Each worker is pinned to its own slice of the CPUs available to the launcher. torch,
+  ONNX Runtime, OpenMP/BLAS and image preprocessing threads are capped at the slice size,
+  so workers x threads never oversubscribes the cores.
+- kill -HUP <master pid> restarts workers gracefully: new workers start and old ones finish
+  their in-flight requests. For a zero-downtime upgrade that also reloads code and the
+  preloaded corpus, send -USR2 to the master, then -QUIT to the old master.
+
+Gunicorn is POSIX-only; for local development run_simple_server.py / ml_service.py still
+start a single uvicorn process.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+except ImportError:
+    BaseApplication = object
+    import_app = None
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class Service(NamedTuple):
+    app: str
+    port: int
+    cpus_per_worker: int  # default CPU slice, which sets the default worker count
+    init: Optional[str] = None  # startup hook run when the app is loaded, before forking if preloaded
+
+
+SERVICES = {
+    "rag": Service("simple_rag_service:app", 8000, 1, "simple_rag_service:init_service"),
+    # Inference benefits from a few intra-op threads per model copy
+    "ml": Service("ml_service:app", 8001, 4),
+}
+
+# Thread pools sized from the worker's CPU slice unless already set in the environment
+THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+              "ML_INTRA_OP_THREADS", "ML_PREPROCESS_WORKERS")
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(cpus: List[int], workers: int) -> List[List[int]]:
+    """Split cpus into one contiguous slice per worker; with more workers than CPUs,
+    workers share single CPUs round-robin"""
+    if workers >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    return [cpus[i * len(cpus) // workers:(i + 1) * len(cpus) // workers] for i in range(workers)]
+
+
+def configure_thread_env(threads: int):
+    """Cap per-worker thread pools; must run before the app (and torch) is imported"""
+    for name in THREAD_ENV:
+        os.environ.setdefault(name, str(threads))
+    # Batches are already formed by the scheduler; one inter-op thread avoids nested pools
+    os.environ.setdefault("ML_INTER_OP_THREADS", "1")
+
+
+def worker_hooks(slices: Optional[List[List[int]]]) -> Dict:
+    """Gunicorn server hooks: freeze preloaded objects before forking and pin each worker
+    to its CPU slice"""
+    workers = len(slices) if slices else 0
+
+    def when_ready(server):
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Froze {gc.get_freeze_count()} preloaded objects before forking workers")
+
+    def pre_fork(server, worker):
+        if not slices:
+            return
+        used = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+        free = [slot for slot in range(workers) if slot not in used]
+        # During a graceful restart old and new workers overlap; share slices until the old exit
+        worker.cpu_slot = free[0] if free else worker.age % workers
+
+    def post_fork(server, worker):
+        if not slices:
+            return
+        os.sched_setaffinity(0, slices[worker.cpu_slot])
+        server.log.info(f"Worker {worker.pid} pinned to CPUs {slices[worker.cpu_slot]}")
+
+    return {"when_ready": when_ready, "pre_fork": pre_fork, "post_fork": post_fork}
+
+
+class Launcher(BaseApplication):
+    """Gunicorn application configured from a dict instead of a config file"""
+
+    def __init__(self, app_uri: str, options: Dict, init_uri: Optional[str] = None):
+        self.app_uri = app_uri
+        self.init_uri = init_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        app = import_app(self.app_uri)
+        if self.init_uri:
+            import_app(self.init_uri)()
+        return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="AgriMithra production launcher")
+    parser.add_argument("service", choices=sorted(SERVICES))
+    parser.add_argument("--bind", help="address to listen on (default 0.0.0.0:<service port>)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPUs / CPUs per worker)")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="thread pool size per worker (default: the worker's CPU slice)")
+    parser.add_argument("--no-affinity", action="store_true", help="do not pin workers to CPUs")
+    parser.add_argument("--no-preload", action="store_true", help="import the app in each worker")
+    parser.add_argument("--max-concurrency", type=int,
+                        help="ML service: /predict requests in flight per worker before answering 503 "
+                             "(default: ML_MAX_CONCURRENCY, else 32)")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds workers get to finish requests on restart or shutdown")
+    parser.add_argument("--timeout", type=int, default=120, help="seconds before a silent worker is killed")
+    parser.add_argument("--pid", help="write the master pid to this file")
+    args = parser.parse_args(argv)
+
+    if import_app is None:
+        logger.error("gunicorn is not installed; run `pip install -r requirements.txt`")
+        sys.exit(1)
+
+    service = SERVICES[args.service]
+    cpus = available_cpus()
+    workers = args.workers or max(1, len(cpus) // service.cpus_per_worker)
+    slices = None if args.no_affinity or not hasattr(os, "sched_setaffinity") else cpu_slices(cpus, workers)
+    threads = args.threads_per_worker or max(1, min(len(s) for s in slices) if slices else len(cpus) // workers)
+    configure_thread_env(threads)
+    if args.max_concurrency is not None:
+        os.environ["ML_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    elif args.service == "ml":
+        os.environ.setdefault("ML_MAX_CONCURRENCY", "32")
+
+    options = {
+        "bind": args.bind or f"0.0.0.0:{service.port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": not args.no_preload,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "pidfile": args.pid,
+        **worker_hooks(slices),
+    }
+    logger.info(f"Starting {args.service} service: {workers} workers x {threads} threads, "
+                f"{'pinned to ' + str(slices) if slices else 'no CPU affinity'}, "
+                f"{'preloaded' if options['preload_app'] else 'no preload'}")
+    Launcher(service.app, options, service.init).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,29 @@ AgriMithra Simple RAG Backend Service
 FastAPI microservice with a simplified RAG implementation that doesn't rely on external ML libraries.
 """
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
 import os
 import logging
 import random
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 
+from corpus_store import CORPUS_FILENAME, MemoryCorpus, build_corpus
+from dense_index import EMBEDDING_MODEL, DenseIndex, QueryEncoder, build_document_embeddings
+from live_corpus import CorpusSnapshot, LiveCorpus
+from query_categorizer import QueryCategorizer, load_category_config
+from rag_index import SCORERS, MemoizedIndex, reciprocal_rank_fusion, top_k as top_k_docs
+from response_cache import ResponseCache, normalize_query
+from single_flight import SingleFlight
+from stage_metrics import ServerTimingMiddleware, StageMetrics
+from profiler import create_profiler_router
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,9 +34,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-stage latency histograms, served on /metrics and in Server-Timing headers
+metrics = StageMetrics("rag")
+
 # Define knowledge base directory
 KNOWLEDGE_DIR = Path("knowledge_base")
 
+# Packed corpus compiled from DOCUMENTS plus the knowledge_base/ category directories
+CORPUS_PATH = KNOWLEDGE_DIR / CORPUS_FILENAME
+
+# Maximum number of cached chat responses (0 disables the response cache)
+CACHE_SIZE = int(os.environ.get("RAG_CACHE_SIZE", "1024"))
+
+# Largest number of queries accepted by /rag-chatbot/batch
+MAX_BATCH_SIZE = int(os.environ.get("RAG_MAX_BATCH_SIZE", "500"))
+
+# Seconds between polls of knowledge_base/ for changed documents (0 disables the watcher)
+WATCH_INTERVAL = float(os.environ.get("RAG_WATCH_INTERVAL", "2.0"))
+
+# Ranking used when a request does not choose one: "legacy" match counts, "bm25", or
+# "hybrid" (BM25 fused with dense similarity over knowledge_base/doc_embeddings.npy)
+DEFAULT_SCORER = os.environ.get("RAG_SCORER", "legacy")
+RETRIEVERS = (*SCORERS, "hybrid")
+
+# Candidates taken from each side of a hybrid search before rank fusion
+HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", "50"))
+
 # Comprehensive agriculture knowledge base
 DOCUMENTS = [
     # Crop Disease Analysis
@@ -55,176 +91,315 @@ DOCUMENTS = [
     {"title": "Homemade Neem Spray", "category": "pest_control", "content": "Neem spray recipe: Soak 5kg neem seeds overnight in water. Grind into paste next morning. Mix paste in 100 liters water with 100-200ml soap solution as sticker. Alternatively, mix 40-50ml commercial neem oil with 10-20ml liquid soap in 1 liter water, then dilute to 10 liters. Spray uniformly on both sides of leaves during early morning or late evening."}
 ]
 
+# Keywords used to categorize queries (extend via knowledge_base/categories.json)
+CATEGORY_KEYWORDS = {
+    "crop_disease": ["disease", "infection", "spots", "wilting", "blight", "mildew", "rust", "lesion", "fungus", "bacteria", "virus", "treatment"],
+    "market_prices": ["price", "market", "sell", "buying", "cost", "rate", "mandi", "trader", "export", "trend"],
+    "weather": ["rain", "forecast", "weather", "monsoon", "humidity", "temperature", "wind", "storm", "drought", "heat", "frost"],
+    "govt_schemes": ["scheme", "subsidy", "government", "loan", "insurance", "pm-kisan", "pmfby", "application", "eligibility", "document"],
+    "fertilizers": ["fertilizer", "nutrient", "nitrogen", "phosphorus", "potassium", "npk", "urea", "dap", "micronutrient", "deficiency"],
+    "pest_control": ["pest", "insect", "aphid", "borer", "caterpillar", "spray", "pesticide", "biological", "trap", "neem"]
+}
+
+# Answer intro per category of the retrieved documents
+CATEGORY_INTROS = {
+    "crop_disease": "Based on your query about crop disease: ",
+    "market_prices": "Regarding market prices: ",
+    "weather": "About the weather information: ",
+    "govt_schemes": "About government schemes: ",
+    "fertilizers": "For fertilizer recommendations: ",
+    "pest_control": "For pest control: ",
+    "general": "Here's what I found: "
+}
+
+# Suggested follow-up questions per query category
+CATEGORY_QUESTIONS = {
+    "crop_disease": [
+        "How quickly does this disease spread?",
+        "What are organic treatment options?",
+        "How can I prevent this in the future?"
+    ],
+    "market_prices": [
+        "What's the price trend forecast for next week?",
+        "Where can I get the best price for my crop?",
+        "Should I store my harvest or sell now?"
+    ],
+    "weather": [
+        "Is it a good time to spray pesticides?",
+        "How will this weather affect my crops?",
+        "When is the next dry period for harvesting?"
+    ],
+    "govt_schemes": [
+        "What documents do I need to apply?",
+        "When is the deadline for application?",
+        "Who do I contact for more information?"
+    ],
+    "fertilizers": [
+        "When is the best time to apply this fertilizer?",
+        "What are signs of over-fertilization?",
+        "Are there organic alternatives?"
+    ],
+    "pest_control": [
+        "Is this pesticide safe for beneficial insects?",
+        "How long before I can harvest after spraying?",
+        "What preventive measures should I take?"
+    ]
+}
+
+def parse_top_k(value, default: int) -> int:
+    """Validate a requested result count; null or missing means default"""
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError("'top_k' must be a positive integer")
+    return value
+
+def parse_flag(value, name: str) -> bool:
+    """Validate a boolean option: true/false, or the strings "true"/"false"/"1"/"0"; null or
+    missing means false"""
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "1", "false", "0"):
+        return value.lower() in ("true", "1")
+    raise ValueError(f"'{name}' must be true or false")
+
 class SimpleRAGChatbot:
     """Simple RAG chatbot that doesn't require ML libraries"""
     
-    def __init__(self):
-        """Initialize the chatbot with documents"""
-        self.documents = DOCUMENTS
-        logger.info(f"Initialized Simple RAG chatbot with {len(self.documents)} documents")
-
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Simple keyword-based search"""
-        query = query.lower()
-        results = []
-        
-        # Simple scoring based on keyword matching
-        for doc in self.documents:
-            score = 0
-            content = doc["content"].lower()
-            title = doc["title"].lower()
-            
-            # Check query words in content
-            for word in query.split():
-                if len(word) > 3:  # Only consider words with more than 3 characters
-                    if word in content:
-                        score += 1
-                    if word in title:
-                        score += 2  # Title matches are weighted higher
-            
-            if score > 0:
-                results.append({
-                    "content": doc["content"],
-                    "metadata": {
-                        "title": doc["title"],
-                        "category": doc["category"]
-                    },
-                    "score": score
-                })
-        
-        # Sort by score and return top_k
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:top_k]
+    def __init__(self, documents: Optional[List[Dict]] = None):
+        """Initialize the chatbot from the memory-mapped corpus, or from an in-memory document list"""
+        # Category tables and the keyword matcher are compiled once, not per request
+        keywords, self.category_intros, self.category_questions = load_category_config(
+            KNOWLEDGE_DIR, CATEGORY_KEYWORDS, CATEGORY_INTROS, CATEGORY_QUESTIONS)
+        self.categorizer = QueryCategorizer(keywords)
+        self.cache = ResponseCache(max_entries=CACHE_SIZE)
+        self.flights = SingleFlight()
+        if documents is None:
+            self.corpus = LiveCorpus(CORPUS_PATH, KNOWLEDGE_DIR, DOCUMENTS)
+            # Any knowledge base change invalidates cached answers
+            self.corpus.listeners.append(lambda snapshot: self.cache.clear())
+        else:
+            self.corpus = None
+            self._static_snapshot = CorpusSnapshot(MemoryCorpus(documents))
+
+        # Dense side of hybrid search: precomputed document embeddings plus a query encoder
+        self.dense = DenseIndex.load(KNOWLEDGE_DIR) if documents is None else None
+        self.query_encoder = QueryEncoder(self.dense.model_name) if self.dense is not None else None
+        if self.query_encoder is not None:
+            self.query_encoder.on_ready.append(self._enable_dense)
+        logger.info(f"Initialized Simple RAG chatbot with {len(self.snapshot.documents)} documents")
+
+    def _enable_dense(self):
+        """Called once the query encoder has loaded"""
+        # Documents added or edited since --build-embeddings are embedded on first use
+        self.dense.encode_documents = self.query_encoder.encode_documents
+        # Hybrid answers cached while the encoder was loading were keyword-only
+        self.cache.clear()
+
+    @property
+    def snapshot(self) -> CorpusSnapshot:
+        """Current immutable view of the knowledge base"""
+        return self.corpus.snapshot if self.corpus is not None else self._static_snapshot
+
+    def _answer_view(self) -> Tuple[int, CorpusSnapshot]:
+        """Cache generation and snapshot to answer from.
+
+        The generation is read first: an update published after it clears the cache and
+        bumps the generation, so answers built from the older snapshot are never stored.
+        """
+        generation = self.cache.generation
+        return generation, self.snapshot
+
+    def search(self, query: str, top_k: int = 5, scorer: str = DEFAULT_SCORER) -> List[Dict]:
+        """Search with the legacy or BM25 keyword scorer, or hybrid keyword + dense retrieval"""
+        # Read the snapshot once so a concurrent knowledge base update cannot mix views
+        snapshot = self.snapshot
+        return self._search(query, top_k, scorer, snapshot, snapshot.index)
+
+    def _search(self, query: str, top_k: int, scorer: str, snapshot: CorpusSnapshot, index) -> List[Dict]:
+        """Rank documents of snapshot through index (the snapshot's own or a batch-memoized view)"""
+        if scorer not in RETRIEVERS:
+            raise ValueError(f"Unknown scorer '{scorer}'. Available: {', '.join(RETRIEVERS)}")
+
+        if scorer == "hybrid":
+            scores = self._hybrid_scores(query, top_k, snapshot, index)
+        else:
+            scores = SCORERS[scorer](index, query)
+        return [self._format_result(snapshot.documents[doc_id], score)
+                for doc_id, score in top_k_docs(scores, top_k)]
+
+    def _hybrid_scores(self, query: str, top_k: int, snapshot: CorpusSnapshot, index) -> Dict[int, float]:
+        """Reciprocal-rank fusion of the BM25 ranking and the dense similarity ranking"""
+        candidates = max(HYBRID_CANDIDATES, top_k)
+        rankings = [[doc_id for doc_id, _ in top_k_docs(SCORERS["bm25"](index, query), candidates)]]
+        if self.query_encoder is not None and self.query_encoder.ready:
+            query_vector = self.query_encoder.encode(query)
+            rankings.append([doc_id for doc_id, _ in self.dense.search(query_vector, snapshot, candidates)])
+        return reciprocal_rank_fusion(rankings)
+
+    def _format_result(self, doc: Dict, score: float) -> Dict:
+        """Shape an indexed document as a search result"""
+        return {
+            "content": doc["content"],
+            "metadata": {
+                "title": doc["title"],
+                "category": doc["category"]
+            },
+            "score": score
+        }
 
     def generate_answer(self, query: str, retrieved_docs: List[Dict], language: str = "en") -> str:
         """Generate answer from retrieved documents"""
+        return "".join(self.generate_answer_parts(query, retrieved_docs, language))
+
+    def generate_answer_parts(self, query: str, retrieved_docs: List[Dict], language: str = "en") -> Iterator[str]:
+        """Yield the answer in display order: intro with the main document, each additional document, disclaimer"""
         if not retrieved_docs:
-            return "I don't have enough information to answer this query. Please try asking something else."
+            yield "I don't have enough information to answer this query. Please try asking something else."
+            return
                 
         # Get the category from retrieved docs
         categories = [doc["metadata"].get("category", "general") for doc in retrieved_docs]
         main_category = max(set(categories), key=categories.count) if categories else "general"
         
         # Create intro based on category
-        category_intros = {
-            "crop_disease": "Based on your query about crop disease: ",
-            "market_prices": "Regarding market prices: ",
-            "weather": "About the weather information: ",
-            "govt_schemes": "About government schemes: ",
-            "fertilizers": "For fertilizer recommendations: ",
-            "pest_control": "For pest control: ",
-            "general": "Here's what I found: "
-        }
-        
-        intro = category_intros.get(main_category, category_intros["general"])
+        intro = self.category_intros.get(main_category, self.category_intros["general"])
         
         # Use the first (most relevant) document as the main content
-        if retrieved_docs:
-            main_doc = retrieved_docs[0]
-            answer = f"{intro}{main_doc['content']}"
-            
-            # Add information from other docs
-            additional_info = []
-            for doc in retrieved_docs[1:3]:  # Use up to 2 more documents
-                additional_info.append(doc['content'])
-                
-            if additional_info:
-                answer += "\n\nAdditional information:\n" + "\n\n".join(additional_info)
-                
-            # Add standard disclaimer
-            disclaimer = "\n\nNote: Always consult with your local agricultural extension officer for advice specific to your region and conditions."
-            answer += disclaimer
+        main_doc = retrieved_docs[0]
+        yield f"{intro}{main_doc['content']}"
+        
+        # Add information from other docs
+        for position, doc in enumerate(retrieved_docs[1:3]):  # Use up to 2 more documents
+            prefix = "\n\nAdditional information:\n" if position == 0 else "\n\n"
+            yield prefix + doc['content']
             
-            return answer
-        else:
-            return "I couldn't find specific information about that. Please try rephrasing your question."
+        # Add standard disclaimer
+        yield "\n\nNote: Always consult with your local agricultural extension officer for advice specific to your region and conditions."
 
-    def chat(self, query: str, language: str = "en", top_k: int = 5) -> Dict:
+    def chat(self, query: str, language: str = "en", top_k: int = 5, scorer: str = DEFAULT_SCORER) -> Dict:
         """Process a chat query and return a response"""
+        generation, snapshot = self._answer_view()
+        return self._respond(query, language, top_k, scorer, generation, snapshot, snapshot.index)
+
+    def chat_batch(self, items: List, language: str = "en", top_k: int = 5,
+                   scorer: str = DEFAULT_SCORER) -> List[Dict]:
+        """Answer many queries against one snapshot, sharing posting lookups between them.
+
+        Items are query strings or {"query", "language", "top_k", "scorer"} objects; the
+        other arguments are their defaults. Results keep input order, and an invalid item
+        gets {"query", "error"} instead of failing the batch.
+        """
+        generation, snapshot = self._answer_view()
+        index = MemoizedIndex(snapshot.index)
+        responses = []
+        for item in items:
+            if isinstance(item, str):
+                item = {"query": item}
+            query = item.get("query", "") if isinstance(item, dict) else ""
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Each item must be a query string or an object with a 'query'")
+                if not isinstance(query, str) or not query.strip():
+                    raise ValueError("Please provide a query.")
+                item_top_k = parse_top_k(item.get("top_k"), top_k)
+                responses.append(self._respond(query, item.get("language") or language, item_top_k,
+                                               item.get("scorer") or scorer, generation, snapshot, index))
+            except (ValueError, TypeError) as e:
+                responses.append({"query": query if isinstance(query, str) else "", "error": str(e)})
+        return responses
+
+    def _respond(self, query: str, language: str, top_k: int, scorer: str, generation: int,
+                 snapshot: CorpusSnapshot, index) -> Dict:
+        """Build a chat response, reusing the cached answer for repeated queries"""
+        cached = self._cached_answer(query, language, top_k, scorer, generation, snapshot, index)
+        return self._finish_response(query, cached, "".join(cached["answer_parts"]))
+
+    def chat_stream(self, query: str, language: str = "en", top_k: int = 5,
+                    scorer: str = DEFAULT_SCORER) -> Iterator[Tuple[str, Dict]]:
+        """Yield a chat response as (event, payload) pairs for incremental delivery.
+
+        "answer" events carry the intro with the top source, then each additional document,
+        then the disclaimer; a final "metadata" event carries sources and follow-ups.
+        """
+        generation, snapshot = self._answer_view()
+        cached = self._cached_answer(query, language, top_k, scorer, generation, snapshot, snapshot.index)
+        sources = cached["sources"]
+        for position, part in enumerate(cached["answer_parts"]):
+            event = {"text": part}
+            if position < len(sources):
+                event["source"] = dict(sources[position])
+            yield "answer", event
+        yield "metadata", self._finish_response(query, cached)
+
+    def _cached_answer(self, query: str, language: str, top_k: int, scorer: str, generation: int,
+                       snapshot: CorpusSnapshot, index) -> Dict:
+        """Return the cacheable category/answer/sources for a query, computing it on a miss.
+
+        generation is the cache generation read before snapshot (see _answer_view).
+        """
+        # Repeated queries reuse the cached category, answer and sources
+        cache_key = (normalize_query(query), language, top_k, scorer)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            # Identical cold queries arriving together share one computation
+            cached = self.flights.do((cache_key, snapshot.generation), lambda: self._answer_and_cache(
+                cache_key, generation, query, language, top_k, scorer, snapshot, index))
+        return cached
+
+    def _answer_and_cache(self, cache_key, generation: int, query: str, language: str, top_k: int,
+                          scorer: str, snapshot: CorpusSnapshot, index) -> Dict:
+        cached = self._answer_query(query, language, top_k, scorer, snapshot, index)
+        self.cache.put(cache_key, cached,
+                       [cached["category"]] + [source["category"] for source in cached["sources"]],
+                       generation)
+        return cached
+
+    def _finish_response(self, query: str, cached: Dict, answer: Optional[str] = None) -> Dict:
+        """Add the per-request fields to a cached answer: query, timestamp and follow-ups"""
+        category = cached["category"]
+        
+        # Prepare response (timestamp and follow-ups are always fresh)
+        response = {"query": query}
+        if answer is not None:
+            response["answer"] = answer
+        response["sources"] = [dict(source) for source in cached["sources"]]
+        response["timestamp"] = datetime.now().isoformat()
+        
+        # Add suggested follow-up questions
+        if category in self.category_questions:
+            questions = self.category_questions[category]
+            response["suggested_followups"] = random.sample(questions, min(2, len(questions)))
+        
+        return response
+    
+    def _answer_query(self, query: str, language: str, top_k: int, scorer: str,
+                      snapshot: CorpusSnapshot, index) -> Dict:
+        """Categorize, search and build the cacheable part of a chat response"""
         # Get category of query
-        category = self._categorize_query(query)
+        with metrics.stage("categorize"):
+            category = self._categorize_query(query)
         
         # Search for relevant documents
-        retrieved_docs = self.search(query, top_k=top_k)
+        with metrics.stage("search"):
+            retrieved_docs = self._search(query, top_k, scorer, snapshot, index)
         
-        # Generate answer
-        answer = self.generate_answer(query, retrieved_docs, language)
+        # Generate answer (kept in parts so streaming responses can replay it)
+        with metrics.stage("answer"):
+            answer_parts = list(self.generate_answer_parts(query, retrieved_docs, language))
         
-        # Prepare response
-        response = {
-            "query": query,
-            "answer": answer,
+        return {
+            "category": category,
+            "answer_parts": answer_parts,
             "sources": [{"title": doc["metadata"]["title"], "category": doc["metadata"].get("category", "general")} 
-                      for doc in retrieved_docs[:3]],  # Include up to 3 sources
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Add suggested follow-up questions
-        category_questions = {
-            "crop_disease": [
-                "How quickly does this disease spread?",
-                "What are organic treatment options?",
-                "How can I prevent this in the future?"
-            ],
-            "market_prices": [
-                "What's the price trend forecast for next week?",
-                "Where can I get the best price for my crop?",
-                "Should I store my harvest or sell now?"
-            ],
-            "weather": [
-                "Is it a good time to spray pesticides?",
-                "How will this weather affect my crops?",
-                "When is the next dry period for harvesting?"
-            ],
-            "govt_schemes": [
-                "What documents do I need to apply?",
-                "When is the deadline for application?",
-                "Who do I contact for more information?"
-            ],
-            "fertilizers": [
-                "When is the best time to apply this fertilizer?",
-                "What are signs of over-fertilization?",
-                "Are there organic alternatives?"
-            ],
-            "pest_control": [
-                "Is this pesticide safe for beneficial insects?",
-                "How long before I can harvest after spraying?",
-                "What preventive measures should I take?"
-            ]
+                        for doc in retrieved_docs[:3]]  # Include up to 3 sources
         }
-        
-        if category in category_questions:
-            response["suggested_followups"] = random.sample(category_questions[category], 2)
-        
-        return response
     
     def _categorize_query(self, query: str) -> str:
         """Categorize the query based on keywords"""
-        query = query.lower()
-        
-        # Simple keyword-based categorization
-        categories = {
-            "crop_disease": ["disease", "infection", "spots", "wilting", "blight", "mildew", "rust", "lesion", "fungus", "bacteria", "virus", "treatment"],
-            "market_prices": ["price", "market", "sell", "buying", "cost", "rate", "mandi", "trader", "export", "trend"],
-            "weather": ["rain", "forecast", "weather", "monsoon", "humidity", "temperature", "wind", "storm", "drought", "heat", "frost"],
-            "govt_schemes": ["scheme", "subsidy", "government", "loan", "insurance", "pm-kisan", "pmfby", "application", "eligibility", "document"],
-            "fertilizers": ["fertilizer", "nutrient", "nitrogen", "phosphorus", "potassium", "npk", "urea", "dap", "micronutrient", "deficiency"],
-            "pest_control": ["pest", "insect", "aphid", "borer", "caterpillar", "spray", "pesticide", "biological", "trap", "neem"]
-        }
-        
-        # Score each category
-        scores = {category: 0 for category in categories}
-        for category, keywords in categories.items():
-            for keyword in keywords:
-                if keyword in query:
-                    scores[category] += 1
-        
-        # Return category with highest score, or "general" if all scores are 0
-        max_score = max(scores.values())
-        if max_score == 0:
-            return "general"
-        
-        return max(scores.items(), key=lambda x: x[1])[0]
+        return self.categorizer.categorize(query)
 
 # Predefined queries for UI buttons
 PREDEFINED_QUERIES = {
@@ -257,11 +432,40 @@ PREDEFINED_QUERIES = {
     ]
 }
 
+# Created by init_service() at startup, not at import, so importing the module has no side effects
+rag_bot: Optional[SimpleRAGChatbot] = None
+
+def init_service() -> SimpleRAGChatbot:
+    """Load the knowledge base, compiling knowledge_base/corpus.bin if it is missing or stale.
+
+    serve.py calls this in the gunicorn master so workers share the mapped corpus; otherwise
+    the app's startup runs it.
+    """
+    global rag_bot
+    if rag_bot is None:
+        logger.info("Initializing Simple RAG chatbot...")
+        rag_bot = SimpleRAGChatbot()
+        logger.info("Simple RAG chatbot initialized successfully")
+    return rag_bot
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the knowledge base and watch knowledge_base/ for document changes while the server runs"""
+    bot = init_service()
+    if bot.corpus is not None:
+        bot.corpus.start_watcher(WATCH_INTERVAL)
+    if bot.query_encoder is not None:
+        bot.query_encoder.start()
+    yield
+    if bot.corpus is not None:
+        bot.corpus.stop_watcher()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AgriMithra Simple RAG Service",
     description="Simple Retrieval-Augmented Generation chatbot for agricultural queries",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -272,11 +476,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+app.add_middleware(ServerTimingMiddleware, metrics=metrics)
 
-# Initialize RAG chatbot
-logger.info("Initializing Simple RAG chatbot...")
-rag_bot = SimpleRAGChatbot()
-logger.info("Simple RAG chatbot initialized successfully")
+# On-demand /debug/profile and /debug/allocations, only when PROFILER_TOKEN is set
+profiler_router = create_profiler_router()
+if profiler_router is not None:
+    app.include_router(profiler_router)
 
 @app.get("/")
 async def root():
@@ -288,16 +493,58 @@ async def root():
         "documentation": "/docs"
     }
 
-@app.post("/rag-chatbot")
-async def process_query(request: Request):
-    """Process a query using the Simple RAG chatbot"""
+def _sse(event: str, payload: Dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _read_json_object(request: Request) -> Dict:
+    """Parse the request body, answering 400 unless it is a JSON object"""
     try:
         data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be valid JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    return data
+
+async def _stream_chat(query: str, language: str, scorer: str):
+    """Stream a chat response as SSE: answer parts first, then metadata, then done"""
+    events = rag_bot.chat_stream(query, language, scorer=scorer)
+    try:
+        while True:
+            # Each step may search, or wait for an identical query in flight: run it on a worker
+            # thread so the event loop keeps serving other requests
+            item = await asyncio.to_thread(next, events, None)
+            if item is None:
+                break
+            event, payload = item
+            yield _sse(event, payload)
+    except Exception as e:
+        logger.error(f"Error streaming query: {e}")
+        yield _sse("error", {"message": "I apologize, but I encountered an error processing your query. Please try again."})
+    yield _sse("done", {})
+
+@app.post("/rag-chatbot")
+async def process_query(request: Request, stream: bool = False):
+    """Process a query using the Simple RAG chatbot (as SSE when "stream" is set)"""
+    try:
+        with metrics.stage("json_parse"):
+            data = await _read_json_object(request)
         query = data.get("query", "")
         language = data.get("language", "en")
+        scorer = data.get("scorer", DEFAULT_SCORER)
+        try:
+            stream = stream or parse_flag(data.get("stream"), "stream")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        logger.info(f"Received query: '{query}' (language: {language})")
+        logger.info(f"Received query: '{query}' (language: {language}, scorer: {scorer}, stream: {stream})")
         
+        if not query and stream:
+            return StreamingResponse(
+                iter([_sse("answer", {"text": "Please provide a query."}), _sse("done", {})]),
+                media_type="text/event-stream"
+            )
         if not query:
             return {
                 "query": "",
@@ -305,11 +552,26 @@ async def process_query(request: Request):
                 "sources": [],
                 "timestamp": datetime.now().isoformat()
             }
+
+        if scorer not in RETRIEVERS:
+            raise HTTPException(status_code=400, detail=f"Unknown scorer '{scorer}'. Available: {', '.join(RETRIEVERS)}")
         
-        # Generate response using Simple RAG chatbot
-        response = rag_bot.chat(query, language)
-        return response
+        if stream:
+            # Send each part as soon as it is ready; slow links see the intro and top source first
+            return StreamingResponse(
+                _stream_chat(query, language, scorer),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        # Generate response using Simple RAG chatbot, off the event loop so identical
+        # concurrent queries can overlap and be coalesced
+        response = await asyncio.to_thread(rag_bot.chat, query, language, scorer=scorer)
+        with metrics.stage("serialize"):
+            return JSONResponse(response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         return {
@@ -319,6 +581,44 @@ async def process_query(request: Request):
             "timestamp": datetime.now().isoformat()
         }
 
+@app.post("/rag-chatbot/stream")
+async def stream_query(request: Request):
+    """Stream the answer to a query as Server-Sent Events"""
+    return await process_query(request, stream=True)
+
+@app.post("/rag-chatbot/batch")
+async def process_batch(request: Request):
+    """Answer a batch of queries (e.g. from the SMS/IVR gateway) in one request"""
+    data = await _read_json_object(request)
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise HTTPException(status_code=400, detail="Provide a non-empty 'queries' list")
+    if len(queries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} queries per batch")
+    if not all(isinstance(item, (str, dict)) for item in queries):
+        raise HTTPException(status_code=400, detail="Each of 'queries' must be a query string or an object")
+    # Batch-level options are defaults for the items; null means not given
+    try:
+        top_k = parse_top_k(data.get("top_k"), 5)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    language = data.get("language") or "en"
+    if not isinstance(language, str):
+        raise HTTPException(status_code=400, detail="'language' must be a string")
+    scorer = data.get("scorer") or DEFAULT_SCORER
+    if scorer not in RETRIEVERS:
+        raise HTTPException(status_code=400, detail=f"Unknown scorer '{scorer}'. Available: {', '.join(RETRIEVERS)}")
+
+    logger.info(f"Received batch of {len(queries)} queries")
+    # The batch is CPU-bound; keep the event loop free for other requests
+    results = await asyncio.to_thread(rag_bot.chat_batch, queries, language, top_k, scorer)
+    return {
+        "results": results,
+        "count": len(results),
+        "errors": sum(1 for result in results if "error" in result),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.post("/chat")
 async def chat_endpoint(request: Request):
     """Chat endpoint that matches the route expected by the frontend"""
@@ -334,20 +634,69 @@ async def chat_endpoint(request: Request):
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage and request latency histograms in Prometheus text format"""
+    body = metrics.render() + "\n".join([
+        "# HELP agrimithra_coalesced_requests_total Cold queries that computed (leader) or waited for an identical one (follower)",
+        "# TYPE agrimithra_coalesced_requests_total counter",
+        *rag_bot.flights.render("agrimithra_coalesced_requests_total", 'service="rag"'),
+    ]) + "\n"
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the chat response cache and how many cold queries were coalesced"""
+    return {**rag_bot.cache.stats(), "coalescing": rag_bot.flights.stats()}
+
 @app.get("/categories")
 async def get_categories():
     """Get all available query categories with sample questions"""
+    category_counts = rag_bot.snapshot.category_counts
     return {
         "categories": [
             {
                 "id": category,
                 "name": category.replace("_", " ").title(),
-                "sample_questions": questions[:3]  # Return first 3 sample questions
+                "sample_questions": questions[:3],  # Return first 3 sample questions
+                "document_count": category_counts.get(category, 0)
             }
             for category, questions in PREDEFINED_QUERIES.items()
         ]
     }
 
+async def _write_document(operation, *args) -> Dict:
+    """Run a knowledge base write off the event loop and map errors to HTTP responses"""
+    try:
+        doc_id = await asyncio.to_thread(operation, *args)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Document '{args[0]}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    snapshot = rag_bot.snapshot
+    return {
+        "status": "success",
+        "id": doc_id,
+        "document_count": snapshot.index.num_docs
+    }
+
+@app.post("/add-document")
+async def add_document(request: Request):
+    """Add a document to the knowledge base without restarting the service"""
+    data = await _read_json_object(request)
+    return await _write_document(rag_bot.corpus.add_document, data)
+
+@app.put("/documents/{doc_id:path}")
+async def update_document(doc_id: str, request: Request):
+    """Replace a document previously added to the knowledge base"""
+    data = await _read_json_object(request)
+    return await _write_document(rag_bot.corpus.update_document, doc_id, data)
+
+@app.delete("/documents/{doc_id:path}")
+async def delete_document(doc_id: str):
+    """Remove a document from the knowledge base"""
+    return await _write_document(rag_bot.corpus.delete_document, doc_id)
+
 @app.get("/models")
 async def list_models():
     """Return available model options"""
@@ -432,5 +781,17 @@ async def analyze_image(request: Request):
         }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import sys
+
+    if "--build-corpus" in sys.argv:
+        # Recompile the packed corpus (e.g. after editing existing knowledge_base files) and exit
+        build_corpus(CORPUS_PATH, KNOWLEDGE_DIR, DOCUMENTS)
+    elif "--build-embeddings" in sys.argv:
+        # Precompute document embeddings for hybrid search (needs sentence-transformers) and exit
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(EMBEDDING_MODEL)
+        build_document_embeddings(KNOWLEDGE_DIR, init_service().snapshot.live_documents(),
+                                  lambda texts: encoder.encode(texts, convert_to_numpy=True))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
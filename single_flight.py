@@ -0,0 +1,110 @@
+"""
+AgriMithra request coalescing
+Single-flight: concurrent requests for the same key share one computation instead of each
+running it. Unlike the response caches this protects the cold path: when a broadcast sends
+thousands of farmers to the same query or sample photo within seconds, the first request
+computes and the others wait for its result.
+
+SingleFlight is for code running on threads, AsyncSingleFlight for coroutines on one event
+loop. Neither stores results; once the computation finishes the key is free again.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _FlightStats:
+    """Leader/follower counts; followers / (leaders + followers) is the coalescing ratio"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+
+    def stats(self) -> Dict:
+        total = self.leaders + self.followers
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalescing_ratio": round(self.followers / total, 4) if total else 0.0,
+        }
+
+    def render(self, name: str, labels: str) -> List[str]:
+        """Prometheus counter lines, one series per role"""
+        return [f'{name}{{{labels},role="leader"}} {self.leaders}',
+                f'{name}{{{labels},role="follower"}} {self.followers}']
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(_FlightStats):
+    """Thread-safe single-flight for blocking functions"""
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[[], object]):
+        """Return fn(), or the result of the identical call already running on another thread"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight(_FlightStats):
+    """Single-flight for coroutines sharing one event loop (so no locking is needed)"""
+
+    def __init__(self):
+        super().__init__()
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Await fn(), or the identical computation another request already started"""
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.followers += 1
+        # Shielded so a disconnecting client does not cancel the work the others wait on
+        return await asyncio.shield(task)
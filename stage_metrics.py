@@ -0,0 +1,163 @@
+"""
+AgriMithra stage metrics
+Per-stage latency histograms for the Python services, exposed in Prometheus text format on
+/metrics. The current request's stages are also returned in a Server-Timing header, so a
+browser's network panel shows where the time went.
+
+Timing a stage costs two perf_counter() calls and one bucket increment under a lock (a
+couple of microseconds), well under 1% of even a cache-hit request. Histograms are per process: behind
+serve.py each worker reports its own.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds, from 100us (a cached lookup) to 10s (a cold model)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stages recorded during the current request, read by ServerTimingMiddleware
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts are kept per bucket and made cumulative on render"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+class _Stage:
+    """Context manager timing one stage; a class rather than a generator to keep it cheap"""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "StageMetrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, perf_counter() - self.start)
+        return False
+
+
+class StageMetrics:
+    """Stage and request latency histograms for one service"""
+
+    def __init__(self, service: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.service = service
+        self.buckets = buckets
+        self.stages: Dict[str, Histogram] = {}
+        self.requests: Dict[Tuple[str, str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table: Dict, key) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def stage(self, name: str) -> _Stage:
+        """Time a block: `with metrics.stage("search"): ...`"""
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float):
+        """Record a stage timed elsewhere (e.g. in a worker process)"""
+        self._histogram(self.stages, name).observe(seconds)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, seconds))
+
+    def record_all(self, timings: Iterable[Tuple[str, float]]):
+        for name, seconds in timings:
+            self.record(name, seconds)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        self._histogram(self.requests, (method, route, str(status))).observe(seconds)
+
+    def render(self) -> str:
+        """All histograms in the Prometheus text exposition format"""
+        lines = ["# HELP agrimithra_stage_duration_seconds Time spent in each stage of request handling",
+                 "# TYPE agrimithra_stage_duration_seconds histogram"]
+        for name, histogram in sorted(self.stages.items()):
+            lines += histogram.render("agrimithra_stage_duration_seconds",
+                                      f'service="{self.service}",stage="{name}"')
+        lines += ["# HELP agrimithra_request_duration_seconds Time from request to the end of the response",
+                  "# TYPE agrimithra_request_duration_seconds histogram"]
+        for (method, route, status), histogram in sorted(self.requests.items()):
+            lines += histogram.render("agrimithra_request_duration_seconds",
+                                      f'service="{self.service}",method="{method}",route="{route}",status="{status}"')
+        return "\n".join(lines) + "\n"
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: collects the stages of each request, adds them as a Server-Timing
+    header and records the request duration per route template"""
+
+    def __init__(self, app, metrics: StageMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: List[Tuple[str, float]] = []
+        token = _request_stages.set(stages)
+        start = perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Streamed responses only report the stages finished before the first byte
+                timing = ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in
+                                   [*stages, ("total", perf_counter() - start)])
+                # Timing-Allow-Origin lets the cross-origin frontend read the header
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode("latin-1")),
+                                      (b"timing-allow-origin", b"*")]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+            # Route templates, not raw paths, so label cardinality stays bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.observe_request(scope["method"], route, status, perf_counter() - start)
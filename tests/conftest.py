@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The services are flat modules at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class StubProcessor:
+    """Stand-in for ViTImageProcessor: 32x32 resize and [0, 1] scaling"""
+
+    size = {"height": 32, "width": 32}
+
+    def __call__(self, images, return_tensors: str = "np"):
+        pixel_values = np.asarray(images.convert("RGB").resize((32, 32)), dtype=np.float32) / 255.0
+        return {"pixel_values": pixel_values.transpose(2, 0, 1)[None]}
+
+
+class StubClassifier:
+    """Stand-in for ViTClassifier: logits are the per-channel means of each image"""
+
+    revision = "stub"
+    backend = "stub"
+    id2label = {0: "Tomato___Early_blight", 1: "Tomato___healthy", 2: "Corn___Common_Rust"}
+
+    def __init__(self):
+        self.batches = []
+
+    def logits(self, pixel_values: np.ndarray) -> np.ndarray:
+        self.batches.append(len(pixel_values))
+        return pixel_values.mean(axis=(2, 3)) * 10
+
+
+@pytest.fixture
+def ml_client(monkeypatch):
+    """TestClient for ml_service with stub models, loaded and ready"""
+    from fastapi.testclient import TestClient
+
+    import ml_service
+
+    monkeypatch.setattr(ml_service, "loader", ml_service.create_loader(StubProcessor, StubClassifier))
+    monkeypatch.setattr(ml_service, "scheduler", ml_service.InferenceScheduler())
+    monkeypatch.setattr(ml_service, "flights", ml_service.AsyncSingleFlight())
+    with TestClient(ml_service.app) as client:
+        ml_service.loader.wait()
+        assert ml_service.loader.ready
+        yield client
@@ -0,0 +1,81 @@
+import math
+
+import pytest
+
+from rag_index import BM25_K1, InvertedIndex, bm25_idf, bm25_scores, top_k
+from simple_rag_service import DOCUMENTS, SimpleRAGChatbot
+
+
+def brute_force_bm25(documents, query, field_weights=None):
+    """BM25F computed directly from the documents, without any precomputed statistics"""
+    from rag_index import FIELD_B, FIELD_WEIGHTS, FIELDS, STOPWORDS, tokenize
+
+    weights = field_weights or FIELD_WEIGHTS
+    tokens = [{field: tokenize(doc.get(field, "")) for field in FIELDS} for doc in documents]
+    avg_len = {field: sum(len(t[field]) for t in tokens) / len(tokens) for field in FIELDS}
+    scores = {}
+    for term in dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS):
+        df = sum(1 for t in tokens if any(term in t[field] for field in FIELDS))
+        if not df:
+            continue
+        idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+        for doc_id, t in enumerate(tokens):
+            tf = sum(weights[field] * t[field].count(term)
+                     / (1 - FIELD_B[field] + FIELD_B[field] * len(t[field]) / avg_len[field])
+                     for field in FIELDS)
+            if tf:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (BM25_K1 + tf)
+    return scores
+
+
+@pytest.mark.parametrize("query", [
+    "NPK dose for paddy", "tomato yellow leaves", "onion price in Kochi today", "rot", "DAP urea",
+    "the and of", "powdery mildew on grapes",
+])
+def test_bm25_matches_brute_force(query):
+    index = InvertedIndex(DOCUMENTS)
+    expected = brute_force_bm25(DOCUMENTS, query)
+    scores = bm25_scores(index, query)
+    assert scores.keys() == expected.keys()
+    for doc_id, score in expected.items():
+        assert scores[doc_id] == pytest.approx(score, rel=1e-5)
+
+
+def test_bm25_keeps_short_terms_and_drops_stopwords():
+    index = InvertedIndex([
+        {"title": "NPK basics", "content": "Apply NPK before sowing"},
+        {"title": "Pests", "content": "How to spot the stem borer"},
+    ])
+    assert set(bm25_scores(index, "npk")) == {0}
+    assert bm25_scores(index, "how to the") == {}
+
+
+def test_idf_is_positive_even_for_terms_in_every_document():
+    assert bm25_idf(10, 10) > 0
+    assert bm25_idf(10, 1) > bm25_idf(10, 5)
+
+
+def test_title_matches_outrank_content_matches():
+    index = InvertedIndex([
+        {"title": "General advice", "content": "Check for blight weekly"},
+        {"title": "Blight control", "content": "Check fields weekly"},
+    ])
+    ranking = [doc_id for doc_id, _ in top_k(bm25_scores(index, "blight"), 2)]
+    assert ranking == [1, 0]
+
+
+def test_top_k_matches_a_full_stable_sort():
+    scores = {doc_id: float(doc_id % 7) for doc_id in range(100)}
+    expected = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:10]
+    assert top_k(scores, 10) == expected
+    assert top_k({}, 5) == []
+
+
+def test_chatbot_search_selects_the_scorer():
+    bot = SimpleRAGChatbot(DOCUMENTS)
+    # "DAP" is too short for the legacy scorer but is an ordinary BM25 term
+    bm25 = bot.search("DAP", scorer="bm25")
+    assert [r["metadata"]["title"] for r in bm25] == ["Paddy Fertilizer Dosage"]
+    assert bot.search("DAP", scorer="legacy") == []
+    with pytest.raises(ValueError):
+        bot.search("DAP", scorer="tfidf")
@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from corpus_store import (MappedCorpus, MemoryCorpus, build_corpus, load_knowledge_dir, open_corpus,
+                          source_manifest, write_corpus)
+from rag_index import bm25_scores, legacy_scores
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SEED = [{"title": "Tomato Yellow Spots", "content": "Early blight shows yellow spots on tomato leaves.",
+         "category": "crop_disease"}]
+
+
+def write_doc(path: Path, doc):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(doc), encoding="utf-8")
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path):
+    root = tmp_path / "knowledge_base"
+    write_doc(root / "market_prices" / "onion-kochi.json",
+              {"title": "Onion Prices Kochi", "content": "Onion sells at ₹45-50/kg in Kochi.",
+               "metadata": {"source": "market"}})
+    write_doc(root / "fertilizers" / "paddy.json",
+              [{"title": "Paddy Urea", "content": "Split urea in three doses."},
+               {"title": "Paddy DAP", "content": "Apply DAP at transplanting."}])
+    return root
+
+
+def test_knowledge_dir_documents_get_stable_ids(knowledge_dir):
+    docs = load_knowledge_dir(knowledge_dir)
+    assert [doc["id"] for doc in docs] == ["fertilizers/paddy#0", "fertilizers/paddy#1", "market_prices/onion-kochi"]
+    assert docs[-1]["category"] == "market_prices" and docs[-1]["metadata"] == {"source": "market"}
+
+
+def test_mapped_corpus_round_trips_documents_and_index(tmp_path, knowledge_dir):
+    path = build_corpus(tmp_path / "corpus.bin", knowledge_dir, SEED)
+    mapped = MappedCorpus(path)
+    docs = [dict(SEED[0], id="builtin/0", metadata={})] + load_knowledge_dir(knowledge_dir)
+    memory = MemoryCorpus(docs)
+
+    assert mapped.num_docs == len(docs)
+    assert list(mapped.documents.ids) == [doc["id"] for doc in docs]
+    for doc_id, doc in enumerate(docs):
+        assert mapped.documents[doc_id]["title"] == doc["title"]
+        assert mapped.documents[doc_id]["content"] == doc["content"]
+        assert mapped.documents[doc_id]["metadata"] == doc.get("metadata", {})
+    assert mapped.category_counts == memory.category_counts
+    for query in ["onion price", "urea dap paddy", "₹45-50/kg", "yellow tomatoes", "nothing here"]:
+        assert bm25_scores(mapped, query) == pytest.approx(bm25_scores(memory, query))
+        assert legacy_scores(mapped, query) == legacy_scores(memory, query)
+
+
+def test_corrupt_file_is_rejected(tmp_path):
+    path = tmp_path / "corpus.bin"
+    path.write_bytes(b"not a corpus")
+    with pytest.raises(ValueError):
+        MappedCorpus(path)
+
+
+def test_open_corpus_reuses_an_up_to_date_file(tmp_path, knowledge_dir):
+    path = tmp_path / "corpus.bin"
+    open_corpus(path, knowledge_dir, SEED)
+    stamp = path.stat().st_mtime_ns
+    assert open_corpus(path, knowledge_dir, SEED).num_docs == 4
+    assert path.stat().st_mtime_ns == stamp
+
+
+def test_editing_a_document_in_place_makes_the_file_stale(tmp_path, knowledge_dir):
+    path = tmp_path / "corpus.bin"
+    open_corpus(path, knowledge_dir, SEED)
+    category_dir = knowledge_dir / "market_prices"
+    dir_mtime = category_dir.stat().st_mtime_ns
+
+    doc_path = category_dir / "onion-kochi.json"
+    write_doc(doc_path, {"title": "Onion Prices Kochi", "content": "Onion now sells at ₹60/kg in Kochi."})
+    os.utime(category_dir, ns=(dir_mtime, dir_mtime))  # only the file itself changed
+
+    corpus = open_corpus(path, knowledge_dir, SEED)
+    assert "₹60/kg" in corpus.documents[3]["content"]
+
+
+def test_manifest_tracks_seed_documents_and_files(knowledge_dir):
+    manifest = source_manifest(knowledge_dir, SEED)
+    assert sorted(manifest["files"]) == ["fertilizers/paddy.json", "market_prices/onion-kochi.json"]
+    assert manifest != source_manifest(knowledge_dir, SEED + SEED)
+    (knowledge_dir / "fertilizers" / "paddy.json").unlink()
+    assert sorted(source_manifest(knowledge_dir, SEED)["files"]) == ["market_prices/onion-kochi.json"]
+
+
+def test_write_corpus_is_atomic_over_an_open_mapping(tmp_path, knowledge_dir):
+    path = build_corpus(tmp_path / "corpus.bin", knowledge_dir, SEED)
+    old = MappedCorpus(path)
+    write_corpus(path, [dict(SEED[0], id="builtin/0")])
+    assert MappedCorpus(path).num_docs == 1
+    assert old.num_docs == 4 and old.documents[3]["title"] == "Onion Prices Kochi"
+
+
+def test_importing_the_service_does_not_write_the_corpus(tmp_path):
+    subprocess.run([sys.executable, "-c", "import simple_rag_service"], cwd=tmp_path, check=True,
+                   env=dict(os.environ, PYTHONPATH=str(REPO_ROOT)), capture_output=True)
+    assert not (tmp_path / "knowledge_base").exists()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+
+import numpy as np
+import pytest
+
+from dense_index import DenseIndex, build_document_embeddings
+from live_corpus import LiveCorpus
+
+SEED = [
+    {"title": "Tomato Yellow Spots", "content": "Early blight shows yellow spots on tomato leaves.",
+     "category": "crop_disease"},
+    {"title": "Onion Prices Kochi", "content": "Onion sells at 45-50 rupees per kg in Kochi.",
+     "category": "market_prices"},
+]
+
+
+def encode(texts):
+    """Deterministic stand-in for the embedding model"""
+    return np.array([np.frombuffer(hashlib.blake2b(text.encode(), digest_size=16).digest(), np.uint8)
+                     for text in texts], dtype=np.float32) - 128
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    knowledge_dir = tmp_path / "knowledge_base"
+    (knowledge_dir / "pest_control").mkdir(parents=True)
+    for name in ("aphids", "stem-borer"):
+        (knowledge_dir / "pest_control" / f"{name}.json").write_text(json.dumps(
+            {"title": name, "content": f"How to control {name} on crops."}), encoding="utf-8")
+    corpus = LiveCorpus(knowledge_dir / "corpus.bin", knowledge_dir, SEED)
+    build_document_embeddings(knowledge_dir, corpus.snapshot.live_documents(), encode, "stub")
+    return corpus
+
+
+def load(corpus):
+    dense = DenseIndex.load(corpus.knowledge_dir)
+    dense.encode_documents = encode
+    return dense
+
+
+def view(dense, snapshot):
+    """Snapshot position -> embedding of every document the index can search"""
+    positions, extra_positions, extra_vectors = dense._snapshot_view(snapshot)
+    vectors = {int(position): dense.embeddings[row].tolist() for row, position in enumerate(positions)
+               if position >= 0}
+    vectors.update((int(position), vector.tolist()) for position, vector in zip(extra_positions, extra_vectors))
+    return vectors
+
+
+def note(title):
+    return {"title": title, "content": f"{title} advice for paddy.", "category": "fertilizers"}
+
+
+def test_incremental_views_match_a_full_rebuild(corpus):
+    dense = load(corpus)
+    view(dense, corpus.snapshot)
+    writes = [
+        lambda: corpus.add_document(note("Urea")),
+        lambda: corpus.update_document("pest_control/aphids", {"title": "aphids", "content": "Neem oil spray."}),
+        lambda: corpus.delete_document("pest_control/stem-borer"),
+        lambda: corpus.delete_document("fertilizers/urea"),
+        lambda: corpus.update_document("pest_control/aphids",
+                                       {"title": "aphids", "content": "How to control aphids on crops."}),
+        lambda: corpus.add_document(note("Zinc")),
+    ]
+    for write in writes:
+        write()
+        snapshot = corpus.snapshot
+        expected = view(load(corpus), snapshot)
+        assert view(dense, snapshot) == expected
+        assert sorted(expected) == [position for position in range(len(snapshot.documents))
+                                    if position not in snapshot.deleted]
+
+
+def test_a_write_only_examines_the_documents_it_changed(corpus, monkeypatch):
+    dense = load(corpus)
+    view(dense, corpus.snapshot)
+    matched = []
+    match = dense._match
+    monkeypatch.setattr(dense, "_match", lambda doc, *args: matched.append(doc["id"]) or match(doc, *args))
+
+    corpus.add_document(note("Urea"))
+    corpus.delete_document("pest_control/aphids")
+    view(dense, corpus.snapshot)
+    assert matched == ["fertilizers/urea"]
+
+
+def test_older_snapshots_and_compaction_are_still_matched(corpus):
+    dense = load(corpus)
+    first = corpus.snapshot
+    corpus.add_document(note("Urea"))
+    second = corpus.snapshot
+    assert view(dense, second) == view(load(corpus), second)
+    assert view(dense, first) == view(load(corpus), first)
+
+    corpus.compact()
+    assert view(dense, corpus.snapshot) == view(load(corpus), corpus.snapshot)
@@ -0,0 +1,127 @@
+import hashlib
+
+import numpy as np
+
+from embedding_store import (EMBEDDINGS_FILENAME, FlatIndex, QueryEmbeddingCache, build_embedding_store,
+                             content_hash, load_embedding_store)
+
+GUIDES = ["Tomato: apply mancozeb for early blight.", "Paddy: split urea in three doses.",
+          "Cotton: spray neem oil against aphids."]
+
+
+class CountingEncoder:
+    """Deterministic stand-in for the embedding model that records what it encodes"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([np.frombuffer(hashlib.blake2b(text.encode(), digest_size=8).digest(), np.uint8)
+                         for text in texts], dtype=np.float32)
+
+
+def test_content_hash_covers_texts_model_and_index_type():
+    base = content_hash(GUIDES, "model-a")
+    assert content_hash(list(GUIDES), "model-a") == base
+    assert content_hash(GUIDES[:2] + ["Cotton: spray neem oil."], "model-a") != base
+    assert content_hash(GUIDES, "model-b") != base
+    assert content_hash(GUIDES, "model-a", "hnsw") != base
+    # Texts are delimited, so moving a boundary changes the hash
+    assert content_hash(["ab", "c"], "model-a") != content_hash(["a", "bc"], "model-a")
+
+
+def test_store_is_reused_until_a_guide_changes(tmp_path):
+    encode = CountingEncoder()
+    load_embedding_store(tmp_path, GUIDES, "model-a", encode, index_type="flat")
+    assert encode.encoded == GUIDES
+
+    encode.encoded.clear()
+    embeddings, index = load_embedding_store(tmp_path, GUIDES, "model-a", encode, index_type="flat")
+    assert encode.encoded == []
+    assert isinstance(embeddings, np.memmap) and index.embeddings is embeddings
+
+    changed = GUIDES[:2] + ["Cotton: release ladybirds against aphids."]
+    embeddings, index = load_embedding_store(tmp_path, changed, "model-a", encode, index_type="flat")
+    assert encode.encoded == changed
+    assert np.array_equal(np.load(tmp_path / EMBEDDINGS_FILENAME), encode(changed))
+
+    encode.encoded.clear()
+    load_embedding_store(tmp_path, changed, "model-b", encode, index_type="flat")
+    assert encode.encoded == changed
+
+
+def test_flat_index_matches_brute_force_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    distances, indices = FlatIndex(vectors).search(queries, 5)
+    expected = ((vectors[None, :, :] - queries[:, None, :]) ** 2).sum(-1)
+    assert np.array_equal(indices, np.argsort(expected, axis=1)[:, :5])
+    assert np.allclose(distances, np.sort(expected, axis=1)[:, :5], atol=1e-4)
+
+    distances, indices = FlatIndex(vectors[:2]).search(queries[:1], 4)
+    assert indices[0, 2:].tolist() == [-1, -1] and np.isinf(distances[0, 2:]).all()
+
+
+def test_rebuild_is_forced_on_request(tmp_path):
+    encode = CountingEncoder()
+    build_embedding_store(tmp_path, GUIDES, "model-a", encode, index_type="flat")
+    encode.encoded.clear()
+    load_embedding_store(tmp_path, GUIDES, "model-a", encode, rebuild=True, index_type="flat")
+    assert encode.encoded == GUIDES
+
+
+def test_query_cache_hits_and_misses():
+    encode = CountingEncoder()
+    cache = QueryEmbeddingCache(encode, max_entries=4)
+    first = cache.get("Tomato")
+    assert first.shape == (1, 8)
+    assert np.array_equal(cache.get("Tomato"), first)
+    assert encode.encoded == ["Tomato"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"], stats["entries"]) == (1, 1, 0.5, 1)
+    assert stats["saved_seconds"] == stats["encode_seconds"]
+
+
+def test_query_cache_evicts_the_least_recently_used_query():
+    encode = CountingEncoder()
+    cache = QueryEmbeddingCache(encode, max_entries=2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")  # "b" is now the least recently used
+    cache.get("c")
+    encode.encoded.clear()
+    cache.get("a")
+    cache.get("c")
+    assert encode.encoded == []
+    cache.get("b")
+    assert encode.encoded == ["b"]
+    assert cache.stats()["entries"] == 2
+
+
+def test_precomputed_queries_are_pinned():
+    encode = CountingEncoder()
+    cache = QueryEmbeddingCache(encode, max_entries=1)
+    cache.precompute(["Tomato", "Paddy", "Tomato"])
+    assert encode.encoded == ["Tomato", "Paddy"]
+    cache.precompute(["Paddy"])
+    assert encode.encoded == ["Tomato", "Paddy"]
+
+    for query in ["free text 1", "free text 2", "free text 3"]:
+        cache.get(query)
+    encode.encoded.clear()
+    cache.get("Tomato")
+    cache.get("Paddy")
+    assert encode.encoded == []
+    stats = cache.stats()
+    assert (stats["pinned"], stats["entries"], stats["hits"]) == (2, 1, 2)
+
+
+def test_query_cache_can_be_disabled():
+    encode = CountingEncoder()
+    cache = QueryEmbeddingCache(encode, max_entries=0)
+    cache.get("a")
+    cache.get("a")
+    assert encode.encoded == ["a", "a"]
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,47 @@
+import numpy as np
+
+from embedding_store import FlatIndex
+from guide_chunks import Chunk, aggregate_hits, chunk_guide, chunk_guides
+
+GUIDES = [
+    {"title": "Rice (Paddy)", "content": {
+        "summary": "Staple kharif crop.",
+        "fertilizer_management": {"schedule": "Urea in three splits", "organic": "Green manure"},
+        "pest_management": [{"pest": "Stem borer", "solution": "Pheromone traps"}],
+        "disease_management": [{"disease": "Blast", "solution": "Tricyclazole spray"}],
+    }},
+    {"title": "Coconut", "content": "Apply 1.3 kg urea per palm per year."},
+]
+
+
+def test_structured_guides_are_split_per_field():
+    fields = [chunk.field for chunk in chunk_guide(0, GUIDES[0])]
+    assert fields == ["title", "summary", "fertilizer_management.schedule", "fertilizer_management.organic",
+                      "pest_management[0]", "disease_management[0]"]
+    assert chunk_guide(0, GUIDES[0])[4].text == "Rice (Paddy) pest Stem borer: Pheromone traps"
+
+
+def test_text_guides_are_one_chunk():
+    assert chunk_guides(GUIDES)[-1] == Chunk(1, "content", "Coconut: Apply 1.3 kg urea per palm per year.")
+
+
+def test_hits_are_aggregated_to_guides_by_their_closest_chunk():
+    chunks = chunk_guides(GUIDES)
+    hits = aggregate_hits([0.1, 0.2, 0.3, 0.0], [6, 4, 2, -1], chunks, k=2)
+    assert hits == [
+        {"guide": 1, "distance": 0.1, "fields": ["content"]},
+        {"guide": 0, "distance": 0.2, "fields": ["pest_management[0]", "fertilizer_management.schedule"]},
+    ]
+    assert aggregate_hits([0.5], [-1], chunks) == []
+
+
+def test_a_question_about_one_field_finds_its_guide():
+    chunks = chunk_guides(GUIDES)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((len(chunks), 16)).astype(np.float32)
+    index = FlatIndex(vectors)
+    # A query close to the rice blast chunk
+    query = vectors[5] + 0.01 * rng.standard_normal(16).astype(np.float32)
+    distances, indices = index.search(query[None, :], 3)
+    best = aggregate_hits(distances[0], indices[0], chunks, k=1)[0]
+    assert best["guide"] == 0 and best["fields"][0] == "disease_management[0]"
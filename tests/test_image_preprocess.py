@@ -0,0 +1,143 @@
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_preprocess
+from image_preprocess import create_pool, decode_image, init_worker, perceptual_hash, preprocess_base64, \
+    preprocess_image, target_size
+
+
+class SizedProcessor:
+    """Picklable stand-in for ViTImageProcessor with a configurable input size"""
+
+    def __init__(self, edge: int):
+        self.size = {"height": edge, "width": edge}
+
+    def __call__(self, images, return_tensors: str = "np"):
+        edge = self.size["width"]
+        pixel_values = np.asarray(images.convert("RGB").resize((edge, edge)), dtype=np.float32) / 255.0
+        return {"pixel_values": pixel_values.transpose(2, 0, 1)[None]}
+
+
+def photo(seed: int = 0, size=(1200, 900), image_format: str = "JPEG") -> bytes:
+    rng = np.random.default_rng(seed)
+    pixels = (rng.random((size[1] // 50, size[0] // 50, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def processor():
+    previous = image_preprocess._processor
+    processor = SizedProcessor(48)
+    init_worker(processor)
+    yield processor
+    image_preprocess._processor = previous
+
+
+def test_target_size():
+    assert target_size(SizedProcessor(32)) == (32, 32)
+    shortest_edge = type("P", (), {"size": {"shortest_edge": 384}})()
+    assert target_size(shortest_edge) == (384, 384)
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG"])
+def test_decode_shrinks_large_photos_before_resizing(image_format):
+    image = decode_image(photo(image_format=image_format), (48, 48))
+    assert image.mode == "RGB"
+    assert 48 <= min(image.size) < 900
+
+
+def test_preprocess_image():
+    prepared = preprocess_image(photo())
+    assert prepared.pixel_values.shape == (1, 3, 48, 48)
+    assert prepared.pixel_values.dtype == np.float32 and prepared.pixel_values.flags.c_contiguous
+    assert [stage for stage, _ in prepared.timings] == ["image_open", "preprocess"]
+    assert prepared.digest == preprocess_image(photo()).digest != preprocess_image(photo(1)).digest
+
+
+def test_preprocess_base64_accepts_data_urls():
+    data = base64.b64encode(photo()).decode()
+    prepared = preprocess_base64(f"data:image/jpeg;base64,{data}")
+    assert prepared.digest == preprocess_base64(data).digest == preprocess_image(photo()).digest
+    assert prepared.timings[0][0] == "base64_decode"
+
+
+def test_perceptual_hash_survives_reencoding():
+    original = Image.open(io.BytesIO(photo()))
+    buffer = io.BytesIO()
+    original.resize((600, 450)).save(buffer, format="JPEG", quality=60)
+    reencoded = Image.open(io.BytesIO(buffer.getvalue()))
+    assert bin(perceptual_hash(original) ^ perceptual_hash(reencoded)).count("1") <= 4
+    assert perceptual_hash(original) != perceptual_hash(Image.open(io.BytesIO(photo(1))))
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_pool_workers_use_the_server_processor(kind):
+    pool = create_pool(SizedProcessor(40), kind, workers=1)
+    try:
+        prepared = pool.submit(preprocess_image, photo()).result(timeout=60)
+    finally:
+        pool.shutdown()
+    assert prepared.pixel_values.shape == (1, 3, 40, 40)
+
+
+@pytest.mark.skipif(image_preprocess.ViTImageProcessor is None, reason="transformers is not installed")
+def test_real_processor_survives_pickling_into_a_worker():
+    import pickle
+
+    processor = image_preprocess.ViTImageProcessor(size={"height": 40, "width": 40}, image_mean=[0.1, 0.2, 0.3])
+    copy = pickle.loads(pickle.dumps(processor))
+    assert copy.to_dict() == processor.to_dict()
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_pool_output_matches_in_process_preprocessing(kind, processor):
+    images = [photo(0), photo(1, size=(640, 480)), photo(2, size=(500, 500), image_format="PNG")]
+    expected = [preprocess_image(data) for data in images]
+    pool = create_pool(processor, kind, workers=2)
+    try:
+        results = list(pool.map(preprocess_image, images, timeout=60))
+    finally:
+        pool.shutdown()
+    for result, reference in zip(results, expected):
+        assert (result.digest, result.phash) == (reference.digest, reference.phash)
+        assert result.pixel_values.dtype == np.float32 and result.pixel_values.flags["C_CONTIGUOUS"]
+        np.testing.assert_allclose(result.pixel_values, reference.pixel_values, atol=1e-6)
+
+
+def test_process_pool_that_cannot_be_created_falls_back_to_threads(monkeypatch, processor):
+    def no_semaphores(*args, **kwargs):
+        raise OSError("[Errno 38] Function not implemented")
+
+    monkeypatch.setattr(image_preprocess, "ProcessPoolExecutor", no_semaphores)
+    pool = create_pool(processor, "process", workers=1)
+    try:
+        assert isinstance(pool, ThreadPoolExecutor)
+        assert pool.submit(preprocess_image, photo()).result(timeout=60).pixel_values.shape == (1, 3, 48, 48)
+    finally:
+        pool.shutdown()
+
+
+def test_process_pool_whose_workers_die_falls_back_to_threads(monkeypatch, processor):
+    server_pid = os.getpid()
+    init_worker = image_preprocess.init_worker
+
+    def crash_in_worker(processor):
+        if os.getpid() != server_pid:
+            os._exit(1)
+        init_worker(processor)
+
+    monkeypatch.setattr(image_preprocess, "init_worker", crash_in_worker)
+    pool = create_pool(processor, "process", workers=1)
+    try:
+        assert isinstance(pool, ThreadPoolExecutor)
+        assert pool.submit(preprocess_image, photo()).result(timeout=60).pixel_values.shape == (1, 3, 48, 48)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import ml_service
+from ml_service import InferenceScheduler
+
+
+class RecordingClassifier:
+    """Logits are each image's channel means; records every batch it is given"""
+
+    def __init__(self, error: Exception = None):
+        self.batches = []
+        self.error = error
+
+    def logits(self, pixel_values: np.ndarray) -> np.ndarray:
+        self.batches.append(len(pixel_values))
+        if self.error is not None:
+            raise self.error
+        return pixel_values.mean(axis=(2, 3))
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    classifier = RecordingClassifier()
+    monkeypatch.setattr(ml_service, "classifier", classifier, raising=False)
+    return classifier
+
+
+def image(value: float) -> np.ndarray:
+    return np.full((1, 3, 4, 4), value, dtype=np.float32)
+
+
+def run(scheduler: InferenceScheduler, values):
+    """Submit one image per value at once; returns the results (or exceptions) and the elapsed time"""
+    async def scenario():
+        await scheduler.start()
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(scheduler.predict(image(v)) for v in values), return_exceptions=True)
+            return results, time.perf_counter() - start
+        finally:
+            await scheduler.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_batches_of_at_most_max_batch_size(classifier):
+    results, _ = run(InferenceScheduler(max_batch_size=4, max_wait_ms=200), range(10))
+    assert classifier.batches == [4, 4, 2]
+    # Each caller gets the logits of its own image
+    assert [result["logits"] for result in results] == [[float(v)] * 3 for v in range(10)]
+
+
+def test_a_partial_batch_is_dispatched_after_max_wait(classifier):
+    results, elapsed = run(InferenceScheduler(max_batch_size=8, max_wait_ms=50), range(3))
+    assert classifier.batches == [3]
+    assert 0.04 <= elapsed < 2
+    assert all("logits" in result for result in results)
+
+
+def test_no_wait_dispatches_what_is_queued(classifier):
+    run(InferenceScheduler(max_batch_size=8, max_wait_ms=0), range(3))
+    assert sum(classifier.batches) == 3 and all(size <= 8 for size in classifier.batches)
+
+
+def test_a_model_error_reaches_every_waiting_request(classifier):
+    classifier.error = RuntimeError("CUDA out of memory")
+    results, _ = run(InferenceScheduler(max_batch_size=4, max_wait_ms=50), range(6))
+    assert classifier.batches == [4, 2]
+    assert all(isinstance(result, RuntimeError) and str(result) == "CUDA out of memory" for result in results)
+
+
+def test_the_scheduler_keeps_serving_after_a_failed_batch(classifier):
+    scheduler = InferenceScheduler(max_batch_size=2, max_wait_ms=10)
+
+    async def scenario():
+        await scheduler.start()
+        try:
+            classifier.error = ValueError("bad batch")
+            with pytest.raises(ValueError):
+                await scheduler.predict(image(1))
+            classifier.error = None
+            return await scheduler.predict(image(2))
+        finally:
+            await scheduler.stop()
+
+    assert asyncio.run(scenario())["logits"] == [2.0, 2.0, 2.0]
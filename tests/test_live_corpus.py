@@ -0,0 +1,206 @@
+import json
+import threading
+
+import pytest
+
+import live_corpus
+from corpus_store import MemoryCorpus
+from live_corpus import LiveCorpus
+from rag_index import bm25_scores, legacy_scores
+
+SEED = [
+    {"title": "Tomato Yellow Spots", "content": "Early blight shows yellow spots on tomato leaves.",
+     "category": "crop_disease"},
+    {"title": "Onion Prices Kochi", "content": "Onion sells at 45-50 rupees per kg in Kochi.",
+     "category": "market_prices"},
+]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    knowledge_dir = tmp_path / "knowledge_base"
+    (knowledge_dir / "pest_control").mkdir(parents=True)
+    (knowledge_dir / "pest_control" / "aphids.json").write_text(json.dumps(
+        {"title": "Cotton Aphids", "content": "Spray neem oil against aphids on cotton."}), encoding="utf-8")
+    return LiveCorpus(knowledge_dir / "corpus.bin", knowledge_dir, SEED)
+
+
+def new_doc(title, content, category="fertilizers"):
+    return {"title": title, "content": content, "category": category}
+
+
+def ranked_ids(snapshot, scorer, query):
+    scores = scorer(snapshot.index, query)
+    return {snapshot.documents[doc_id]["id"]: score for doc_id, score in scores.items()}
+
+
+def assert_matches_fresh_index(snapshot):
+    """Legacy scores and BM25 matches of a segmented snapshot equal those of a rebuilt index"""
+    documents = snapshot.live_documents()
+    fresh = MemoryCorpus(documents)
+    assert snapshot.index.num_docs == len(documents)
+    for query in ["tomato blight", "onion price", "neem aphids", "urea dose", "paddy", "leaves"]:
+        expected = {documents[doc_id]["id"]: score for doc_id, score in legacy_scores(fresh, query).items()}
+        assert ranked_ids(snapshot, legacy_scores, query) == expected
+        expected = {documents[doc_id]["id"] for doc_id in bm25_scores(fresh, query)}
+        assert set(ranked_ids(snapshot, bm25_scores, query)) == expected
+
+
+def test_add_update_delete(corpus):
+    doc_id = corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    assert doc_id == "fertilizers/paddy-urea"
+    assert (corpus.knowledge_dir / "fertilizers" / "paddy-urea.json").exists()
+    assert corpus.snapshot.category_counts["fertilizers"] == 1
+    assert_matches_fresh_index(corpus.snapshot)
+
+    corpus.update_document(doc_id, new_doc("Paddy Urea", "Apply urea with neem coated granules."))
+    assert_matches_fresh_index(corpus.snapshot)
+    assert "paddy-urea" not in str(ranked_ids(corpus.snapshot, legacy_scores, "three doses"))
+
+    corpus.update_document("pest_control/aphids", new_doc("Cotton Aphids", "Use yellow sticky traps.",
+                                                          "pest_control"))
+    assert_matches_fresh_index(corpus.snapshot)
+
+    corpus.delete_document(doc_id)
+    corpus.delete_document("pest_control/aphids")
+    assert "fertilizers" not in corpus.snapshot.category_counts
+    assert corpus.snapshot.index.num_docs == 2
+    assert_matches_fresh_index(corpus.snapshot)
+
+
+def test_add_gives_unique_ids(corpus):
+    first = corpus.add_document(new_doc("Paddy Urea", "One."))
+    second = corpus.add_document(new_doc("Paddy Urea", "Two."))
+    assert (first, second) == ("fertilizers/paddy-urea", "fertilizers/paddy-urea-2")
+
+
+def test_invalid_writes(corpus):
+    with pytest.raises(ValueError):
+        corpus.add_document(["not", "an", "object"])
+    with pytest.raises(ValueError):
+        corpus.add_document({"title": "No content"})
+    with pytest.raises(ValueError):
+        corpus.add_document(new_doc("Bad", "Category", category="Crop Disease"))
+    with pytest.raises(KeyError):
+        corpus.delete_document("fertilizers/missing")
+    with pytest.raises(ValueError):
+        corpus.delete_document("builtin/0")  # built-in documents are read-only
+
+
+def test_snapshots_are_immutable(corpus):
+    before = corpus.snapshot
+    doc_id = corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    corpus.delete_document("pest_control/aphids")
+    after = corpus.snapshot
+
+    assert after.generation == before.generation + 2
+    assert len(before.documents) == 3 and before.index.num_docs == 3
+    assert ranked_ids(before, legacy_scores, "urea") == {}
+    assert "pest_control/aphids" in ranked_ids(before, legacy_scores, "aphids")
+    assert set(ranked_ids(after, legacy_scores, "urea")) == {doc_id}
+    assert ranked_ids(after, legacy_scores, "aphids") == {}
+
+
+def test_writes_extend_one_delta_segment(corpus, monkeypatch):
+    corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    first = corpus.snapshot
+    appended = []
+    original = live_corpus.DeltaSegment.append
+    monkeypatch.setattr(live_corpus.DeltaSegment, "append",
+                        lambda self, doc: (appended.append(doc["id"]), original(self, doc)))
+    corpus.add_document(new_doc("Paddy DAP", "Apply DAP at transplanting."))
+
+    assert appended == ["fertilizers/paddy-dap"]  # earlier delta documents are not re-indexed
+    assert corpus.snapshot.delta.segment is first.delta.segment
+    assert first.delta.num_docs == 1 and corpus.snapshot.delta.num_docs == 2
+
+
+def test_watcher_applies_file_changes(corpus):
+    corpus.start_watcher(3600)  # records the current files; polled by hand below
+    try:
+        path = corpus.knowledge_dir / "fertilizers" / "zinc.json"
+        path.parent.mkdir()
+        path.write_text(json.dumps({"title": "Zinc", "content": "Zinc sulfate for paddy."}), encoding="utf-8")
+        (corpus.knowledge_dir / "pest_control" / "aphids.json").unlink()
+        corpus.poll()
+    finally:
+        corpus.stop_watcher()
+    ids = {doc["id"] for doc in corpus.snapshot.live_documents()}
+    assert ids == {"builtin/0", "builtin/1", "fertilizers/zinc"}
+    assert_matches_fresh_index(corpus.snapshot)
+
+
+def test_changes_made_before_start_watcher_are_applied(corpus):
+    path = corpus.knowledge_dir / "fertilizers" / "zinc.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps({"title": "Zinc", "content": "Zinc sulfate for paddy."}), encoding="utf-8")
+    corpus.start_watcher(3600)
+    try:
+        corpus.poll()
+    finally:
+        corpus.stop_watcher()
+    assert corpus.snapshot.documents[corpus._find("fertilizers/zinc")]["title"] == "Zinc"
+
+
+def test_adopting_another_workers_compaction_keeps_local_writes(corpus):
+    other = LiveCorpus(corpus.corpus_path, corpus.knowledge_dir, SEED)
+    mine = corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    theirs = other.add_document(new_doc("Paddy DAP", "Apply DAP at transplanting."))
+    other.compact()  # written before the other worker saw our note
+
+    corpus.poll()
+    other.poll()
+    expected = {"builtin/0", "builtin/1", "pest_control/aphids", mine, theirs}
+    for worker in (corpus, other):
+        assert {doc["id"] for doc in worker.snapshot.live_documents()} == expected
+        assert_matches_fresh_index(worker.snapshot)
+    # The compacted file lacks our note, so a restart finds it stale and rebuilds
+    reopened = LiveCorpus(corpus.corpus_path, corpus.knowledge_dir, SEED)
+    assert {doc["id"] for doc in reopened.snapshot.live_documents()} == expected
+
+
+def test_compaction_folds_the_delta_into_a_new_file(corpus):
+    corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    corpus.delete_document("pest_control/aphids")
+    live = [doc["id"] for doc in corpus.snapshot.live_documents()]
+    corpus.compact()
+
+    assert corpus.snapshot.pending_changes == 0
+    assert [doc["id"] for doc in corpus.snapshot.live_documents()] == live
+    reopened = LiveCorpus(corpus.corpus_path, corpus.knowledge_dir, SEED)
+    assert [doc["id"] for doc in reopened.snapshot.live_documents()] == live
+
+
+def test_writes_during_compaction_are_replayed(corpus, monkeypatch):
+    corpus.add_document(new_doc("Paddy Urea", "Split urea in three doses for paddy."))
+    write_corpus = live_corpus.write_corpus
+
+    def write_while_compacting(*args):
+        # Runs without the write lock: a write from another thread must not block
+        writer = threading.Thread(target=lambda: (
+            corpus.add_document(new_doc("Paddy DAP", "Apply DAP at transplanting.")),
+            corpus.delete_document("fertilizers/paddy-urea"),
+            corpus.delete_document("pest_control/aphids"),
+        ))
+        writer.start()
+        writer.join(timeout=10)
+        assert not writer.is_alive()
+        return write_corpus(*args)
+
+    monkeypatch.setattr(live_corpus, "write_corpus", write_while_compacting)
+    corpus.compact()
+
+    ids = [doc["id"] for doc in corpus.snapshot.live_documents()]
+    assert ids == ["builtin/0", "builtin/1", "fertilizers/paddy-dap"]
+    assert corpus.snapshot.pending_changes == 3  # the replayed writes, on top of the new base
+    assert_matches_fresh_index(corpus.snapshot)
+
+
+def test_reaching_the_threshold_compacts_in_the_background(corpus, monkeypatch):
+    monkeypatch.setattr(live_corpus, "COMPACT_THRESHOLD", 3)
+    done = threading.Event()
+    corpus.listeners.append(lambda snapshot: snapshot.pending_changes == 0 and done.set())
+    for i in range(3):
+        corpus.add_document(new_doc(f"Note {i}", "Soil test every season."))
+    assert done.wait(10)
+    assert corpus.snapshot.index.num_docs == 6
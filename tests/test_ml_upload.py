@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import io
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import ml_service
+from ml_service import read_multipart_upload
+
+
+def photo(seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray((rng.random((60, 80, 3)) * 255).astype(np.uint8)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def multipart(*parts, boundary: bytes = b"leafboundary") -> bytes:
+    """Encode (headers, data) parts as a multipart/form-data body"""
+    body = b""
+    for headers, data in parts:
+        body += b"--" + boundary + b"\r\n" + b"".join(h + b"\r\n" for h in headers) + b"\r\n" + data + b"\r\n"
+    return body + b"--" + boundary + b"--\r\n"
+
+
+FILE_HEADERS = [b'Content-Disposition: form-data; name="file"; filename="leaf.jpg"', b"Content-Type: image/jpeg"]
+
+
+class ChunkedRequest:
+    """Just enough of a Request for read_multipart_upload: the body in fixed-size chunks"""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def read(body: bytes, chunk_size: int = 7, limit: int = 1 << 20) -> bytes:
+    return asyncio.run(read_multipart_upload(ChunkedRequest(body, chunk_size), b"leafboundary", limit))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_multipart_keeps_the_first_file_part(chunk_size):
+    image = photo()
+    body = multipart(([b'Content-Disposition: form-data; name="note"'], b"from the field"),
+                     (FILE_HEADERS, image),
+                     ([b'Content-Disposition: form-data; name="other"; filename="b.jpg"'], photo(1)))
+    assert read(body, chunk_size) == image
+
+
+def test_multipart_accepts_an_image_field_without_filename():
+    assert read(multipart(([b'Content-Disposition: form-data; name="image"'], b"\xff\xd8data"))) == b"\xff\xd8data"
+
+
+def test_multipart_keeps_crlf_inside_the_file():
+    data = b"line one\r\n--leafboundar\r\nline two"
+    assert read(multipart((FILE_HEADERS, data)), chunk_size=3) == data
+
+
+def test_multipart_without_a_file_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        read(multipart(([b'Content-Disposition: form-data; name="note"'], b"no file here")))
+    assert error.value.status_code == 400
+
+
+def test_multipart_stops_at_the_size_limit():
+    with pytest.raises(HTTPException) as error:
+        read(multipart((FILE_HEADERS, b"x" * 5000)), limit=4096)
+    assert error.value.status_code == 413
+
+
+def test_predict_accepts_every_upload_encoding(ml_client):
+    image = photo()
+    results = [
+        ml_client.post("/predict", content=image, headers={"Content-Type": "image/jpeg"}),
+        ml_client.post("/predict", files={"file": ("leaf.jpg", image, "image/jpeg")}),
+        ml_client.post("/predict", json={"image": "data:image/jpeg;base64," + base64.b64encode(image).decode()}),
+    ]
+    bodies = [response.json() for response in results]
+    assert all(response.status_code == 200 for response in results)
+    assert all(body["status"] == "success" for body in bodies)
+    assert len({body["label"] for body in bodies}) == 1
+    assert [body["cached"] for body in bodies] == [False, True, True]
+
+
+def test_predict_rejects_bad_uploads(ml_client, monkeypatch):
+    assert ml_client.post("/predict", content=b"", headers={"Content-Type": "image/jpeg"}).status_code == 400
+    assert ml_client.post("/predict", content=b"x", headers={"Content-Type": "multipart/form-data"}).status_code == 400
+    assert ml_client.post("/predict", content=b"{", headers={"Content-Type": "application/json"}).status_code == 400
+    monkeypatch.setattr(ml_service, "MAX_UPLOAD_BYTES", 1000)
+    response = ml_client.post("/predict", files={"file": ("leaf.jpg", b"x" * 2000, "image/jpeg")})
+    assert response.status_code == 413
+
+
+def test_predict_returns_top_k(ml_client):
+    body = ml_client.post("/predict?top_k=2", content=photo(), headers={"Content-Type": "image/jpeg"}).json()
+    assert len(body["top_k"]) == 2
+
+
+def test_a_failing_cache_write_still_returns_the_prediction(ml_client, monkeypatch):
+    def broken_put(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ml_service.prediction_cache, "put", broken_put)
+    response = ml_client.post("/predict", content=photo(3), headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["status"], body["cached"]) == ("success", False)
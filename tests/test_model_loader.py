@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ml_service
+from model_loader import FAILED, LOADING, PENDING, READY, ModelLoader
+
+
+def test_steps_go_from_pending_through_loading_to_ready():
+    release = threading.Event()
+    loading = threading.Event()
+    loader = ModelLoader()
+    loader.add("model", lambda: (loading.set(), release.wait(5)))
+    assert loader.status()["models"]["model"]["state"] == PENDING
+
+    loader.start()
+    assert loading.wait(5)
+    assert loader.status()["models"]["model"]["state"] == LOADING and not loader.ready
+    release.set()
+    assert loader.wait(5)
+    model = loader.status()["models"]["model"]
+    assert model["state"] == READY and model["seconds"] >= 0 and "error" not in model
+
+
+def test_a_failed_step_reports_its_error_and_fails_its_dependents():
+    def broken():
+        raise OSError("weights not found")
+
+    loader = ModelLoader()
+    loader.add("processor", lambda: None)
+    loader.add("model", broken)
+    loader.add("warmup", lambda: pytest.fail("ran after a failed dependency"), depends_on=["processor", "model"])
+    loader.start()
+    assert loader.wait(5) is False
+
+    models = loader.status()["models"]
+    assert models["processor"]["state"] == READY
+    assert (models["model"]["state"], models["model"]["error"]) == (FAILED, "weights not found")
+    assert (models["warmup"]["state"], models["warmup"]["error"]) == (FAILED, "dependency failed: model")
+    assert loader.failed == ["model", "warmup"] and not loader.ready
+
+
+def test_dependents_start_only_after_their_dependencies_finish():
+    events = []
+
+    def step(name, seconds):
+        def load():
+            events.append(f"{name} start")
+            time.sleep(seconds)
+            events.append(f"{name} end")
+        return load
+
+    loader = ModelLoader()
+    loader.add("slow", step("slow", 0.1))
+    loader.add("fast", step("fast", 0.01))
+    loader.add("after_both", step("after_both", 0), depends_on=["slow", "fast"])
+    loader.start()
+    assert loader.wait(5)
+    # Independent steps run in parallel; the dependent one waits for both
+    assert events.index("fast end") < events.index("slow end")
+    assert events.index("after_both start") > events.index("slow end")
+
+
+def test_optional_failures_do_not_block_readiness():
+    def broken():
+        raise RuntimeError("no GPU")
+
+    loader = ModelLoader()
+    loader.add("model", lambda: None)
+    loader.add("accelerator", broken, required=False)
+    loader.start()
+    assert loader.wait(5) and loader.failed == []
+
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError, match="unknown step"):
+        ModelLoader().add("warmup", lambda: None, depends_on=["model"])
+
+
+def test_wait_times_out_while_loading():
+    release = threading.Event()
+    loader = ModelLoader()
+    loader.add("model", lambda: release.wait(5))
+    loader.start()
+    try:
+        assert loader.wait(0.05) is False
+    finally:
+        release.set()
+
+
+def test_readiness_reports_a_model_that_failed_to_load(monkeypatch):
+    def missing_weights():
+        raise OSError("Can't load the model weights")
+
+    loader = ml_service.create_loader(lambda: None, missing_weights)
+    monkeypatch.setattr(ml_service, "loader", loader)
+    monkeypatch.setattr(ml_service, "scheduler", ml_service.InferenceScheduler())
+    with TestClient(ml_service.app) as client:
+        loader.wait(10)
+        assert client.get("/healthz").json() == {"status": "alive"}
+
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        body = response.json()
+        assert body["ready"] is False
+        model = body["models"]["vit_model"]
+        assert (model["state"], model["error"]) == (FAILED, "Can't load the model weights")
+        assert body["models"]["warmup"]["error"] == "dependency failed: vit_model"
+
+        response = client.post("/predict", content=b"\xff\xd8", headers={"Content-Type": "image/jpeg"})
+        assert response.status_code == 503 and response.json()["detail"] == "ML Model not available"
+
+
+def test_readiness_is_200_once_every_model_loaded(ml_client):
+    response = ml_client.get("/readyz")
+    assert response.status_code == 200
+    assert all(model["state"] == READY for model in response.json()["models"].values())
@@ -0,0 +1,132 @@
+import asyncio
+import io
+import random
+
+import pytest
+from PIL import Image
+
+import ml_service
+from prediction_cache import PredictionCache, hamming_distance, hash_bands
+
+PREDICTION = {"logits": [0.1, 2.0, -1.0]}
+
+
+def flip(phash: int, bits) -> int:
+    for bit in bits:
+        phash ^= 1 << bit
+    return phash
+
+
+def test_exact_hits_and_misses():
+    cache = PredictionCache("vit@1")
+    assert cache.get("a" * 32, 123) is None
+    cache.put("a" * 32, 123, PREDICTION)
+    assert cache.get("a" * 32, 123) == PREDICTION
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_lru_eviction():
+    cache = PredictionCache("vit@1", max_entries=2)
+    cache.put("a", 1, {"logits": [1]})
+    cache.put("b", 2, {"logits": [2]})
+    cache.get("a")
+    cache.put("c", 3, {"logits": [3]})
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_disk_tier_survives_restarts_of_the_same_model(tmp_path):
+    db_path = tmp_path / "cache" / "predictions.db"
+    cache = PredictionCache("vit@1", db_path=db_path)
+    cache.put("a", (1 << 64) - 1, PREDICTION)  # top bit set: stored as a negative SQLite integer
+    cache.close()
+
+    reopened = PredictionCache("vit@1", db_path=db_path, phash_distance=0)
+    assert reopened.get("a") == PREDICTION
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.get("b", (1 << 64) - 1) == PREDICTION  # promoted with its unsigned hash
+    reopened.close()
+
+    other_model = PredictionCache("vit@2", db_path=db_path)
+    assert other_model.get("a") is None and other_model.stats()["disk_entries"] == 0
+    other_model.close()
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = PredictionCache("vit@1", max_entries=0, db_path=tmp_path / "p.db", max_disk_entries=3)
+    for i in range(5):
+        cache.put(f"d{i}", i, {"logits": [i]})
+    assert cache.stats()["disk_entries"] == 3
+    assert cache.get("d0") is None and cache.get("d4") == {"logits": [4]}
+
+
+def test_near_duplicates_match_within_the_distance():
+    cache = PredictionCache("vit@1", phash_distance=4)
+    phash = 0x0123456789ABCDEF
+    cache.put("original", phash, PREDICTION)
+    assert cache.get("resized", flip(phash, [0, 17, 40, 63])) == PREDICTION
+    assert cache.get("other", flip(phash, [0, 17, 40, 50, 63])) is None
+    assert cache.stats()["perceptual_hits"] == 1
+    assert PredictionCache("vit@1").get("resized", phash) is None  # off by default
+
+
+def test_hash_bands_cover_every_bit_once():
+    for distance in range(8):
+        bands = hash_bands(distance)
+        assert len(bands) == distance + 1
+        covered = 0
+        for shift, mask in bands:
+            assert covered & (mask << shift) == 0
+            covered |= mask << shift
+        assert covered == (1 << 64) - 1
+    assert hash_bands(8) is None  # 7-bit bands: scan instead
+
+
+@pytest.mark.parametrize("distance", [0, 3, 6, 7, 10])
+def test_banded_lookup_matches_a_full_scan(distance):
+    rng = random.Random(distance)
+    cache = PredictionCache("vit@1", max_entries=300, phash_distance=distance)
+    hashes = {}
+    for i in range(400):  # the first 100 get evicted and must leave the index
+        phash = rng.getrandbits(64) if i % 2 else flip(rng.choice(list(hashes.values()) or [0]),
+                                                        rng.sample(range(64), rng.randint(0, 12)))
+        hashes[f"d{i}"] = phash
+        cache.put(f"d{i}", phash, {"logits": [i]})
+    live = {digest: phash for digest, phash in hashes.items() if digest in cache._entries}
+
+    for _ in range(300):
+        query = flip(rng.choice(list(hashes.values())), rng.sample(range(64), rng.randint(0, distance + 2)))
+        best = min((hamming_distance(query, phash) for phash in live.values()), default=None)
+        result = cache.get("query", query)
+        if best is None or best > distance:
+            assert result is None
+        else:
+            assert result is not None
+            matched = [phash for digest, phash in live.items() if {"logits": [int(digest[1:])]} == result]
+            assert hamming_distance(query, matched[0]) == best
+    if cache._bands is not None:
+        assert sum(len(digests) for table in cache._band_tables for digests in table.values()) \
+            == len(live) * len(cache._bands)
+
+
+def test_service_reads_and_writes_the_cache_off_the_event_loop(ml_client, monkeypatch):
+    calls = []
+
+    def on_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    cache = ml_service.prediction_cache
+    get, put = cache.get, cache.put
+    monkeypatch.setattr(cache, "get", lambda *args: calls.append(("get", on_loop())) or get(*args))
+    monkeypatch.setattr(cache, "put", lambda *args: calls.append(("put", on_loop())) or put(*args))
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (90, 140, 60)).save(buffer, format="JPEG")
+    for _ in range(2):
+        response = ml_client.post("/predict", content=buffer.getvalue(), headers={"Content-Type": "image/jpeg"})
+        assert response.json()["status"] == "success"
+    assert calls == [("get", False), ("put", False), ("get", False)]
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiler
+from profiler import allocation_growth, create_profiler_router, sample_stacks
+
+TOKEN = "secret-token"
+
+
+@pytest.fixture
+def debug_client():
+    app = FastAPI()
+    app.include_router(create_profiler_router(TOKEN))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_router_is_disabled_without_a_token():
+    assert create_profiler_router("") is None
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Profiler-Token": "wrong"}, {"X-Profiler-Token": TOKEN + "x"}])
+def test_endpoints_reject_missing_or_wrong_tokens(debug_client, headers):
+    for path in ("/debug/profile?seconds=0.01", "/debug/allocations?seconds=0.01"):
+        assert debug_client.get(path, headers=headers).status_code == 403
+
+
+def test_session_length_is_capped(debug_client):
+    headers = {"X-Profiler-Token": TOKEN}
+    response = debug_client.get(f"/debug/profile?seconds={profiler.MAX_SECONDS + 1}", headers=headers)
+    assert response.status_code == 422
+
+
+def test_profile_returns_collapsed_stacks(debug_client):
+    response = debug_client.get("/debug/profile?seconds=0.05&hz=200", headers={"X-Profiler-Token": TOKEN})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+
+def test_allocations_report_growth(debug_client):
+    response = debug_client.get("/debug/allocations?seconds=0.01&top=5", headers={"X-Profiler-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.text.startswith("# 0.01s window, net growth")
+
+
+def test_only_one_session_runs_at_a_time(debug_client):
+    assert profiler._session.acquire(blocking=False)
+    try:
+        response = debug_client.get("/debug/profile?seconds=0.01", headers={"X-Profiler-Token": TOKEN})
+        assert response.status_code == 409
+    finally:
+        profiler._session.release()
+
+
+def test_sampler_sees_other_threads():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_worker, name="busy-worker")
+    worker.start()
+    try:
+        samples = sample_stacks(0.05, hz=200)
+    finally:
+        stop.set()
+        worker.join()
+    stacks = [stack for stack in samples if stack.startswith("busy-worker;")]
+    assert stacks and any(":busy_worker:" in stack for stack in stacks)
+
+
+def test_allocation_growth_finds_the_allocating_call_site():
+    kept = []
+
+    def allocate():
+        # Allocate well inside the tracing window
+        time.sleep(0.05)
+        kept.extend(bytearray(1024) for _ in range(256))
+
+    thread = threading.Thread(target=allocate)
+    thread.start()
+    report = allocation_growth(0.2, top=5)
+    thread.join()
+    assert "test_profiler.py" in report
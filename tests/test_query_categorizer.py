@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from query_categorizer import QueryCategorizer, load_category_config
+from simple_rag_service import CATEGORY_INTROS, CATEGORY_KEYWORDS, CATEGORY_QUESTIONS, PREDEFINED_QUERIES
+
+
+def legacy_scores(query, category_keywords):
+    """The original per-keyword substring scan"""
+    query = query.lower()
+    return [sum(1 for keyword in keywords if keyword in query) for keywords in category_keywords.values()]
+
+
+def legacy_categorize(query, category_keywords):
+    scores = legacy_scores(query, category_keywords)
+    if max(scores) == 0:
+        return "general"
+    return list(category_keywords)[scores.index(max(scores))]
+
+
+QUERIES = [
+    # Overlapping keywords: "pest" inside "pesticide", "rain" inside "drain"/"training"
+    "Which pesticide for stem borer?",
+    "Drain the field before training vines",
+    "Pest and pesticide rates",
+    # No word boundaries, as in the original: "rate" in "separately", "dap" in "adapt", "heat" in "wheat"
+    "Apply separately to adapt the wheat crop",
+    "urea",
+    "ureaurea",
+    # Mixed case
+    "MANDI PRICE for Onion",
+    "Is NPK or DAP better? Blight RUST and Mildew",
+    "PM-KISAN eligibility and PMFBY Insurance",
+    # Ties go to the first category in table order
+    "rain price",
+    "spots spray",
+    "",
+    "hello farmer",
+    "Nitrogen deficiency? rain forecast, storm, frost and drought with heat",
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_matches_the_original_substring_scan(query):
+    categorizer = QueryCategorizer(CATEGORY_KEYWORDS)
+    assert categorizer.scores(query) == legacy_scores(query, CATEGORY_KEYWORDS)
+    assert categorizer.categorize(query) == legacy_categorize(query, CATEGORY_KEYWORDS)
+
+
+def test_predefined_queries_match_the_original_scan():
+    categorizer = QueryCategorizer(CATEGORY_KEYWORDS)
+    for query in (q for questions in PREDEFINED_QUERIES.values() for q in questions):
+        assert categorizer.scores(query) == legacy_scores(query, CATEGORY_KEYWORDS), query
+
+
+@pytest.mark.parametrize("query", ["a ab abc abcd", "bcd", "xabcx", "cdab", "ABC", "b"])
+def test_nested_and_shared_keywords(query):
+    # Keywords inside one another, shared prefixes and suffixes, and one keyword in two categories
+    keywords = {"first": ["abc", "ab", "bc", "b"], "second": ["abcd", "cd", "bc"], "third": ["x"]}
+    categorizer = QueryCategorizer(keywords)
+    assert categorizer.scores(query) == legacy_scores(query, keywords)
+    assert categorizer.categorize(query) == legacy_categorize(query, keywords)
+
+
+def test_regex_metacharacters_are_literal():
+    keywords = {"codes": ["c++", "a.b", "(x)"], "other": ["ab"]}
+    categorizer = QueryCategorizer(keywords)
+    for query in ["c++ and (x)", "a.b", "axb", "cc"]:
+        assert categorizer.scores(query) == legacy_scores(query, keywords)
+
+
+def test_empty_keyword_tables():
+    assert QueryCategorizer({}).categorize("rain") == "general"
+    assert QueryCategorizer({"weather": []}).scores("rain") == [0]
+
+
+def test_category_config_extends_the_builtin_tables(tmp_path):
+    (tmp_path / "categories.json").write_text(json.dumps({
+        "weather": {"keywords": ["Cyclone", "rain"]},
+        "irrigation": {"keywords": ["drip"], "intro": "On irrigation: ", "followups": ["How often?"]},
+    }), encoding="utf-8")
+    keywords, intros, followups = load_category_config(tmp_path, CATEGORY_KEYWORDS, CATEGORY_INTROS,
+                                                        CATEGORY_QUESTIONS)
+    assert keywords["weather"] == CATEGORY_KEYWORDS["weather"] + ["cyclone"]
+    assert intros["irrigation"] == "On irrigation: " and followups["irrigation"] == ["How often?"]
+    assert "cyclone" not in CATEGORY_KEYWORDS["weather"]
+    assert QueryCategorizer(keywords).categorize("Cyclone warning, drip lines") == "weather"
+
+
+def test_invalid_category_config_is_ignored(tmp_path):
+    (tmp_path / "categories.json").write_text("[1, 2]", encoding="utf-8")
+    keywords, _, _ = load_category_config(tmp_path, CATEGORY_KEYWORDS, CATEGORY_INTROS, CATEGORY_QUESTIONS)
+    assert keywords == CATEGORY_KEYWORDS
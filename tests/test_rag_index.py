@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import pytest
+
+from corpus_store import MappedCorpus, MemoryCorpus, write_corpus
+from rag_index import MemoizedIndex, InvertedIndex, legacy_scores, tokenize, top_k
+from simple_rag_service import DOCUMENTS, PREDEFINED_QUERIES
+
+
+def baseline_search(documents, query, top_k=5):
+    """SimpleRAGChatbot.search as it was before the inverted index, verbatim"""
+    query = query.lower()
+    results = []
+    for doc in documents:
+        score = 0
+        content = doc["content"].lower()
+        title = doc["title"].lower()
+        for word in query.split():
+            if len(word) > 3:
+                if word in content:
+                    score += 1
+                if word in title:
+                    score += 2
+        if score > 0:
+            results.append({"title": doc["title"], "score": score})
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results[:top_k]
+
+
+PROBE_QUERIES = [query for queries in PREDEFINED_QUERIES.values() for query in queries] + [
+    "tomatoes blight", "leaves", "ering", "price price price", "blight vs late", "7-10 days",
+    "₹45-50/kg onion", "N-P-K dose", "neem-based spray?", "rain,", "(pmfby)", "....",
+    "Aluva market.", "zinc sulfate 10kg/acre", "KERALA Villages",
+]
+
+SEED_DOCUMENTS = [dict(doc, id=f"builtin/{i}") for i, doc in enumerate(DOCUMENTS)]
+
+
+@pytest.fixture(scope="module", params=["memory", "mapped"])
+def index(request, tmp_path_factory):
+    if request.param == "memory":
+        return MemoryCorpus(SEED_DOCUMENTS)
+    path = tmp_path_factory.mktemp("corpus") / "corpus.bin"
+    return MappedCorpus(write_corpus(path, SEED_DOCUMENTS))
+
+
+def legacy_search(index, query, k=5):
+    return [{"title": DOCUMENTS[doc_id]["title"], "score": score}
+            for doc_id, score in top_k(legacy_scores(index, query), k)]
+
+
+@pytest.mark.parametrize("query", PROBE_QUERIES)
+def test_legacy_scorer_matches_baseline_search(index, query):
+    assert legacy_search(index, query) == baseline_search(DOCUMENTS, query)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("How to treat powdery mildew on grapes?",
+     [("Powdery Mildew Treatment", 9), ("Cotton Aphid Treatment", 2), ("Tomato Yellow Spots", 1)]),
+    ("Compare price of paddy in Palakkad vs Thrissur",
+     [("Paddy Price Comparison", 8), ("Onion Prices Kochi", 3), ("Potato Price Trends", 3),
+      ("Paddy Fertilizer Dosage", 3), ("Soil Test Fertilizer Guide", 1)]),
+    ("tomatoes blight", [("Potato Blight Comparison", 3), ("Tomato Yellow Spots", 1), ("Rice Brown Lesions", 1)]),
+    ("₹45-50/kg onion", [("Onion Prices Kochi", 4)]),
+])
+def test_legacy_scorer_pinned_outputs(index, query, expected):
+    assert [(result["title"], result["score"]) for result in legacy_search(index, query)] == expected
+
+
+def test_memoized_index_gives_identical_scores(index):
+    memoized = MemoizedIndex(index)
+    for query in PROBE_QUERIES:
+        assert legacy_scores(memoized, query) == legacy_scores(index, query)
+
+
+def test_postings_are_per_field_with_term_frequencies():
+    index = InvertedIndex([
+        {"title": "Tomato blight", "content": "Blight spreads fast on tomatoes. Blight!"},
+        {"title": "Rice", "content": "Rice blast"},
+    ])
+    docs, tfs = index.lookup_tf("content", "blight")
+    assert list(docs) == [0] and list(tfs) == [2]
+    assert list(index.lookup("title", "tomato")) == [0]
+    assert list(index.lookup("content", "tomato")) == [0]  # "tomatoes" folds to "tomato"
+    assert index.doc_freq("rice") == 1 and index.doc_freq("missing") == 0
+    assert index.term_idf("missing") is None
+
+
+def test_substring_docs_match_inside_tokens_and_across_punctuation():
+    index = InvertedIndex([
+        {"title": "a", "content": "Use N-P-K 19:19:19 at sowing"},
+        {"title": "b", "content": "npk and sowing machines"},
+    ])
+    assert index.substring_docs("content", "owin") == {0, 1}
+    assert index.substring_docs("content", "n-p-k") == {0}
+    assert index.substring_docs("content", "19:19") == {0}
+    assert index.substring_docs("content", "--") == set()
+
+
+def test_tokenize_folds_simple_plurals():
+    assert tokenize("Tomatoes, Leaves and Varieties!") == ["tomato", "leave", "and", "variety"]
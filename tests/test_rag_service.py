@@ -0,0 +1,151 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import simple_rag_service
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The app over a knowledge base in a temporary directory (no lifespan, so no watcher)"""
+    knowledge_dir = tmp_path / "knowledge_base"
+    monkeypatch.setattr(simple_rag_service, "KNOWLEDGE_DIR", knowledge_dir)
+    monkeypatch.setattr(simple_rag_service, "CORPUS_PATH", knowledge_dir / "corpus.bin")
+    monkeypatch.setattr(simple_rag_service, "rag_bot", simple_rag_service.SimpleRAGChatbot())
+    return TestClient(simple_rag_service.app)
+
+
+def test_document_write_endpoints(client):
+    response = client.post("/add-document", json={"title": "Zinc for Paddy", "content": "Apply zinc sulfate.",
+                                                  "category": "fertilizers"})
+    assert response.status_code == 200
+    doc_id = response.json()["id"]
+    assert doc_id == "fertilizers/zinc-for-paddy"
+    count = response.json()["document_count"]
+
+    response = client.put(f"/documents/{doc_id}", json={"title": "Zinc", "content": "Apply 10 kg zinc sulfate."})
+    assert response.status_code == 200 and response.json()["document_count"] == count
+    assert client.delete(f"/documents/{doc_id}").json()["document_count"] == count - 1
+    assert client.delete(f"/documents/{doc_id}").status_code == 404
+
+
+@pytest.mark.parametrize("method, path", [("post", "/add-document"), ("put", "/documents/fertilizers/zinc")])
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]", b'"text"', b"null", b"\xff"])
+def test_document_writes_reject_bodies_that_are_not_json_objects(client, method, path, body):
+    response = client.request(method, path, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+
+def test_document_writes_reject_invalid_documents(client):
+    assert client.post("/add-document", json={"title": "No content"}).status_code == 400
+    assert client.put("/documents/builtin/0", json={"title": "T", "content": "C"}).status_code == 400
+
+
+def test_batch_answers_items_in_order_with_per_item_errors(client):
+    response = client.post("/rag-chatbot/batch", json={"queries": [
+        "Onion price in Kochi?",
+        {"query": "How to treat powdery mildew on grapes?", "top_k": 1, "scorer": "bm25"},
+        {"query": ""},
+        {"query": "Paddy fertilizer", "top_k": 0},
+        {"query": "Paddy fertilizer", "top_k": None, "scorer": None},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    results = body["results"]
+    assert (body["count"], body["errors"]) == (5, 2)
+    assert results[0]["query"] == "Onion price in Kochi?" and "error" not in results[0]
+    assert len(results[1]["sources"]) == 1
+    assert "error" in results[2] and "error" in results[3]
+    assert "error" not in results[4]
+
+
+def test_batch_level_null_options_mean_defaults(client):
+    response = client.post("/rag-chatbot/batch", json={"queries": ["Onion price", "Paddy fertilizer"],
+                                                       "top_k": None, "language": None, "scorer": None})
+    assert response.status_code == 200
+    assert response.json()["errors"] == 0
+
+
+@pytest.mark.parametrize("body", [
+    {"queries": []},
+    {"queries": "Onion price"},
+    {"queries": ["Onion price", 42]},
+    {"queries": [["nested"]]},
+    {"queries": ["Onion price"], "top_k": 0},
+    {"queries": ["Onion price"], "top_k": "5"},
+    {"queries": ["Onion price"], "top_k": True},
+    {"queries": ["Onion price"], "top_k": 2.5},
+    {"queries": ["Onion price"], "scorer": "tfidf"},
+    {"queries": ["Onion price"], "language": 1},
+    ["Onion price"],
+])
+def test_batch_rejects_invalid_requests(client, body):
+    assert client.post("/rag-chatbot/batch", json=body).status_code == 400
+
+
+def test_batch_rejects_malformed_json(client):
+    response = client.post("/rag-chatbot/batch", content=b'{"queries": [', headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+
+def sse_events(response):
+    return [block.split("\n", 1)[0].removeprefix("event: ") for block in response.text.strip().split("\n\n")]
+
+
+@pytest.mark.parametrize("flag", [True, "true", "1", "TRUE"])
+def test_stream_flag_true(client, flag):
+    response = client.post("/rag-chatbot", json={"query": "Onion price in Kochi?", "stream": flag})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response)
+    assert events[0] == "answer" and events[-2:] == ["metadata", "done"]
+
+
+@pytest.mark.parametrize("flag", [False, "false", "0", None])
+def test_stream_flag_false(client, flag):
+    response = client.post("/rag-chatbot", json={"query": "Onion price in Kochi?", "stream": flag})
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["sources"]
+
+
+@pytest.mark.parametrize("flag", ["no", "yes", "", 1, 0, [], {}])
+def test_stream_flag_rejects_anything_else(client, flag):
+    assert client.post("/rag-chatbot", json={"query": "Onion price", "stream": flag}).status_code == 400
+
+
+def test_stream_endpoint_and_query_parameter(client):
+    assert sse_events(client.post("/rag-chatbot/stream", json={"query": "Onion price"}))[-1] == "done"
+    assert sse_events(client.post("/rag-chatbot?stream=true", json={"query": "Onion price"}))[-1] == "done"
+
+
+def test_query_rejects_bodies_that_are_not_json_objects(client):
+    assert client.post("/rag-chatbot", content=b"{", headers={"Content-Type": "application/json"}).status_code == 400
+    assert client.post("/rag-chatbot", json=["Onion price"]).status_code == 400
+
+
+def test_stream_does_not_block_the_event_loop(client, monkeypatch):
+    """A stream whose answer is slow to compute must not stall other requests"""
+    release = threading.Event()
+    answer_query = simple_rag_service.rag_bot._answer_query
+
+    def slow_answer(query, *args):
+        if query == "slow query":
+            assert release.wait(10)
+        return answer_query(query, *args)
+
+    monkeypatch.setattr(simple_rag_service.rag_bot, "_answer_query", slow_answer)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=simple_rag_service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            stream = asyncio.ensure_future(http.post("/rag-chatbot/stream", json={"query": "slow query"}))
+            await asyncio.sleep(0.2)
+            fast = await asyncio.wait_for(http.get("/categories"), 5)
+            assert fast.status_code == 200 and not stream.done()
+            release.set()
+            return await asyncio.wait_for(stream, 5)
+
+    response = asyncio.run(scenario())
+    assert sse_events(response)[-1] == "done"
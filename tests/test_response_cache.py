@@ -0,0 +1,117 @@
+import simple_rag_service
+from response_cache import DEFAULT_TTL, ResponseCache, normalize_query
+from simple_rag_service import DOCUMENTS, SimpleRAGChatbot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_query():
+    assert normalize_query("  Onion   PRICE\tKochi ") == "onion price kochi"
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1, ["general"])
+    cache.put("b", 2, ["general"])
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3, ["general"])
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_shortest_category_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(category_ttls={"market_prices": 300, "fertilizers": 86400}, clock=clock)
+    cache.put("prices", "answer", ["fertilizers", "market_prices"])
+    cache.put("unknown", "answer", ["no_such_category"])
+    clock.now += 299
+    assert cache.get("prices") == "answer"
+    clock.now += 2
+    assert cache.get("prices") is None
+    assert cache.stats()["expirations"] == 1
+    clock.now += DEFAULT_TTL - 302
+    assert cache.get("unknown") == "answer"
+
+
+def test_clear_discards_results_computed_before_it():
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.clear()
+    cache.put("stale", 1, ["general"], generation=generation)
+    assert cache.get("stale") is None
+    cache.put("fresh", 2, ["general"], generation=cache.generation)
+    assert cache.get("fresh") == 2
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(max_entries=0)
+    cache.put("a", 1, ["general"])
+    assert cache.get("a") is None
+
+
+def test_stats_count_hits_and_misses():
+    cache = ResponseCache()
+    cache.get("a")
+    cache.put("a", 1, ["general"])
+    cache.get("a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"], stats["entries"]) == (1, 1, 0.5, 1)
+
+
+def test_chatbot_reuses_cached_answers(monkeypatch):
+    bot = SimpleRAGChatbot(DOCUMENTS)
+    calls = []
+    answer_query = bot._answer_query
+    monkeypatch.setattr(bot, "_answer_query", lambda *args: calls.append(args) or answer_query(*args))
+
+    first = bot.chat("Onion price in Kochi?")
+    second = bot.chat("  onion PRICE in kochi?  ")
+    assert len(calls) == 1
+    assert second["answer"] == first["answer"] and second["sources"] == first["sources"]
+    assert second["query"] == "  onion PRICE in kochi?  "
+
+    bot.chat("Onion price in Kochi?", language="ml")
+    bot.chat("Onion price in Kochi?", scorer="bm25")
+    assert len(calls) == 3
+    assert bot.cache.stats()["hits"] == 1
+
+
+def test_knowledge_base_changes_clear_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_rag_service, "KNOWLEDGE_DIR", tmp_path)
+    monkeypatch.setattr(simple_rag_service, "CORPUS_PATH", tmp_path / "corpus.bin")
+    bot = SimpleRAGChatbot()
+    before = bot.chat("zinc sulfate for paddy")
+    bot.corpus.add_document({"title": "Zinc Sulfate for Paddy", "content": "Apply 10 kg zinc sulfate per acre.",
+                             "category": "fertilizers"})
+    after = bot.chat("zinc sulfate for paddy")
+    assert after["sources"] != before["sources"]
+    assert after["sources"][0]["title"] == "Zinc Sulfate for Paddy"
+    assert bot.cache.stats()["invalidations"] == 1
+
+
+def test_answers_from_a_superseded_snapshot_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_rag_service, "KNOWLEDGE_DIR", tmp_path)
+    monkeypatch.setattr(simple_rag_service, "CORPUS_PATH", tmp_path / "corpus.bin")
+    bot = SimpleRAGChatbot()
+    answer_query = bot._answer_query
+
+    def answer_then_update(query, *args):
+        # The knowledge base changes while the batch is still answering from its snapshot
+        if query == "onion price":
+            bot.corpus.add_document({"title": "Zinc Sulfate for Paddy", "category": "fertilizers",
+                                     "content": "Apply 10 kg zinc sulfate per acre."})
+        return answer_query(query, *args)
+
+    monkeypatch.setattr(bot, "_answer_query", answer_then_update)
+    batch = bot.chat_batch(["onion price", "zinc sulfate paddy"])
+    assert "Zinc Sulfate for Paddy" not in [source["title"] for source in batch[1]["sources"]]
+
+    after = bot.chat("zinc sulfate paddy")
+    assert after["sources"][0]["title"] == "Zinc Sulfate for Paddy"
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import simple_rag_service
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        assert release.wait(5)
+        return {"answer": 42}
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(flights.do, "key", compute)
+        assert started.wait(5)
+        followers = [pool.submit(flights.do, "key", compute) for _ in range(7)]
+        while flights.followers < 7:
+            threading.Event().wait(0.001)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "followers": 7, "coalescing_ratio": 0.875}
+
+
+def test_followers_receive_the_leaders_error_and_the_key_is_freed():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        assert release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "key", fail)
+        assert started.wait(5)
+        follower = pool.submit(flights.do, "key", fail)
+        while flights.followers < 1:
+            threading.Event().wait(0.001)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result()
+
+    assert flights.in_flight == 0
+    assert flights.do("key", lambda: "fresh") == "fresh"
+
+
+def test_different_keys_do_not_coalesce():
+    flights = SingleFlight()
+    assert [flights.do(key, lambda key=key: key * 2) for key in (1, 2, 1)] == [2, 4, 2]
+    assert flights.stats()["leaders"] == 3 and flights.stats()["followers"] == 0
+
+
+def test_coroutines_share_one_task():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", compute) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["done"] * 5
+    assert len(calls) == 1 and flights.in_flight == 0
+    assert flights.render("coalesced_total", 'service="ml"') == [
+        'coalesced_total{service="ml",role="leader"} 1',
+        'coalesced_total{service="ml",role="follower"} 4',
+    ]
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_work():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do("key", compute))
+        follower = asyncio.ensure_future(flights.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_async_errors_reach_every_waiter():
+    flights = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model down")
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert flights.in_flight == 0
+
+
+def test_identical_cold_queries_are_answered_once(tmp_path, monkeypatch):
+    knowledge_dir = tmp_path / "knowledge_base"
+    monkeypatch.setattr(simple_rag_service, "KNOWLEDGE_DIR", knowledge_dir)
+    monkeypatch.setattr(simple_rag_service, "CORPUS_PATH", knowledge_dir / "corpus.bin")
+    bot = simple_rag_service.SimpleRAGChatbot()
+    answer_query = bot._answer_query
+    release = threading.Event()
+    calls = []
+
+    def slow_answer(*args):
+        calls.append(args[0])
+        assert release.wait(5)
+        return answer_query(*args)
+
+    monkeypatch.setattr(bot, "_answer_query", slow_answer)
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(bot.chat, "How to control aphids?") for _ in range(5)]
+        while bot.flights.followers < 4:
+            threading.Event().wait(0.001)
+        release.set()
+        responses = [future.result() for future in futures]
+
+    assert len({response["answer"] for response in responses}) == 1
+    assert calls == ["How to control aphids?"]
+    assert bot.flights.stats()["in_flight"] == 0
@@ -0,0 +1,92 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from stage_metrics import Histogram, ServerTimingMiddleware, StageMetrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram((0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 3.0):
+        histogram.observe(value)
+    assert histogram.render("latency", 'stage="x"') == [
+        'latency_bucket{stage="x",le="0.01"} 2',
+        'latency_bucket{stage="x",le="0.1"} 3',
+        'latency_bucket{stage="x",le="+Inf"} 4',
+        'latency_sum{stage="x"} 3.065',
+        'latency_count{stage="x"} 4',
+    ]
+
+
+def test_stages_are_recorded_per_name():
+    metrics = StageMetrics("test")
+    with metrics.stage("search"):
+        pass
+    metrics.record_all([("search", 0.2), ("format", 0.001)])
+    assert metrics.stages["search"].count == 2 and metrics.stages["format"].count == 1
+    text = metrics.render()
+    assert 'agrimithra_stage_duration_seconds_count{service="test",stage="search"} 2' in text
+    assert "# TYPE agrimithra_request_duration_seconds histogram" in text
+
+
+def timed_app():
+    metrics = StageMetrics("test")
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware, metrics=metrics)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        with metrics.stage("lookup"):
+            pass
+        # Stages timed on a worker thread still belong to this request
+        await asyncio.to_thread(metrics.record, "search", 0.0125)
+        return {"id": item_id}
+
+    return app, metrics
+
+
+def test_server_timing_header_lists_the_request_stages():
+    app, metrics = timed_app()
+    response = TestClient(app).get("/items/7")
+    assert response.headers["timing-allow-origin"] == "*"
+    entries = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert entries == ["lookup", "search", "total"]
+    assert "search;dur=12.500" in response.headers["server-timing"]
+
+
+def test_requests_are_recorded_per_route_template():
+    app, metrics = timed_app()
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/items/x")
+    client.get("/nowhere")
+    assert {key: histogram.count for key, histogram in metrics.requests.items()} == {
+        ("GET", "/items/{item_id}", "200"): 2,
+        ("GET", "/items/{item_id}", "422"): 1,
+        ("GET", "unmatched", "404"): 1,
+    }
+
+
+def test_concurrent_requests_keep_their_own_stages():
+    app, metrics = timed_app()
+
+    async def scenario():
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get(f"/items/{i}") for i in range(20)))
+
+    for response in asyncio.run(scenario()):
+        assert response.headers["server-timing"].count("lookup;") == 1
+    assert metrics.stages["lookup"].count == 20
+
+
+def test_services_expose_metrics(ml_client):
+    ml_client.post("/predict", content=b"not an image", headers={"Content-Type": "image/jpeg"})
+    text = ml_client.get("/metrics").text
+    assert 'agrimithra_stage_duration_seconds_count{service="ml",stage="upload"}' in text
+    assert 'route="/predict"' in text
+    assert "agrimithra_coalesced_requests_total" in text
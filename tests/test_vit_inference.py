@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import vit_inference
+from vit_inference import describe_logits, parse_label, softmax
+
+ID2LABEL = {0: "Tomato___Early_blight", 1: "Tomato___healthy", 2: "Corn___Common_Rust"}
+
+
+def test_parse_label():
+    assert parse_label("Corn___Common_Rust") == ("Corn", "Common Rust")
+    assert parse_label("Tomato___healthy") == ("Tomato", "healthy")
+
+
+def test_softmax_rows_sum_to_one():
+    probabilities = softmax(np.array([[1.0, 2.0, 3.0], [1000.0, 1000.0, 0.0]]))
+    assert np.allclose(probabilities.sum(axis=1), 1.0)
+    assert np.allclose(probabilities[1], [0.5, 0.5, 0.0])
+
+
+def test_describe_logits_ranks_labels():
+    result = describe_logits([0.5, 3.0, 1.0], ID2LABEL, top_k=2, temperature=1.0)
+    assert (result["label"], result["crop"], result["healthy"]) == ("Tomato___healthy", "Tomato", True)
+    assert [entry["label"] for entry in result["top_k"]] == ["Tomato___healthy", "Corn___Common_Rust"]
+    assert "calibrated_confidence" not in result
+
+
+def test_temperature_softens_the_calibrated_confidence():
+    result = describe_logits([0.5, 3.0, 1.0], ID2LABEL, temperature=2.0)
+    assert result["calibrated_confidence"] < result["confidence"]
+
+
+@pytest.mark.skipif(vit_inference.torch is not None, reason="torch is installed")
+def test_classifier_needs_torch_but_the_module_imports_without_it():
+    with pytest.raises(RuntimeError, match="torch"):
+        vit_inference.ViTClassifier("model")
@@ -0,0 +1,278 @@
+"""
+AgriMithra leaf-disease classifier runtime
+Loads the ViT crop-disease model behind one logits() call with a selectable CPU backend,
+shared by ml_service.py and app.py:
+
+- eager:       PyTorch fp32, as loaded from the hub
+- torchscript: traced, frozen TorchScript graph
+- compile:     torch.compile (slow first call, then faster steady state)
+- int8:        PyTorch dynamic int8 quantization of the Linear layers
+- onnx:        ONNX Runtime on an exported fp32 graph
+- onnx-int8:   ONNX Runtime on a dynamically int8-quantized export
+
+Quantized backends change the numbers slightly; use benchmarks/check_vit_backend.py (or
+ML_VALIDATION_DIR at startup) to confirm top-1 agreement with eager fp32.
+"""
+
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import torch
+    from transformers import ViTForImageClassification
+except ImportError:  # describe_logits and the stub-model load test run without them
+    torch = None
+    ViTForImageClassification = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "compile", "int8", "onnx", "onnx-int8")
+
+DEFAULT_BACKEND = os.environ.get("ML_BACKEND", "eager")
+# 0 keeps the runtime default (usually one thread per physical core)
+INTRA_OP_THREADS = int(os.environ.get("ML_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("ML_INTER_OP_THREADS", "0"))
+# Exported ONNX graphs are reused across restarts, one file per model revision
+EXPORT_DIR = Path(os.environ.get("ML_EXPORT_DIR", Path(__file__).parent / ".model_cache"))
+# Images used to check a non-eager backend against eager fp32 at startup
+VALIDATION_DIR = os.environ.get("ML_VALIDATION_DIR", "")
+MIN_AGREEMENT = float(os.environ.get("ML_MIN_AGREEMENT", "0.98"))
+# Labels returned per prediction, and the softmax temperature fitted on held-out data
+# (1.0 = uncalibrated, in which case no calibrated confidence is reported)
+TOP_K = int(os.environ.get("ML_TOP_K", "3"))
+TEMPERATURE = float(os.environ.get("ML_TEMPERATURE", "1.0"))
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """Row-wise softmax of a (batch x classes) array"""
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def parse_label(label: str) -> Tuple[str, str]:
+    """Split a "Crop___Disease_Name" label into ("Crop", "Disease Name")"""
+    crop, _, disease = label.partition("___")
+    return crop.replace("_", " ").strip(), disease.replace("_", " ").strip()
+
+
+def describe_logits(logits: Sequence[float], id2label: Dict[int, str], top_k: int = TOP_K,
+                    temperature: float = TEMPERATURE) -> Dict:
+    """Label, confidence, crop/disease split and top-k alternatives from one image's logits"""
+    logits = np.asarray(logits, dtype=np.float32)
+    probabilities = softmax(logits[None, :])[0]
+    ranked = np.argsort(-probabilities)[:max(1, top_k)]
+
+    def entry(idx: int) -> Dict:
+        label = id2label[int(idx)]
+        crop, disease = parse_label(label)
+        return {"label": label, "crop": crop, "disease": disease, "confidence": float(probabilities[idx])}
+
+    best = entry(ranked[0])
+    best["healthy"] = best["disease"].lower() == "healthy"
+    best["top_k"] = [entry(idx) for idx in ranked]
+    if temperature != 1.0:
+        best["calibrated_confidence"] = float(softmax(logits[None, :] / temperature)[0][ranked[0]])
+    return best
+
+
+def configure_threads(intra_op: int = INTRA_OP_THREADS, inter_op: int = INTER_OP_THREADS):
+    """Apply torch thread pool sizes; 0 leaves a setting at its default"""
+    if torch is None:
+        return
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:  # only allowed before any inter-op work has run
+            logger.warning(f"Could not set inter-op threads: {e}")
+
+
+def _logits_only(model) -> "torch.nn.Module":
+    """Wrap model with a plain-tensor forward for tracing and export"""
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values: "torch.Tensor") -> "torch.Tensor":
+            return self.model(pixel_values=pixel_values, return_dict=False)[0]
+
+    return LogitsOnly()
+
+
+class ViTClassifier:
+    """ViT image classifier with a pluggable inference backend.
+
+    logits() takes a float32 (batch x 3 x H x W) array and returns a (batch x classes)
+    array, whichever backend runs it.
+    """
+
+    def __init__(self, model_name: str, revision: str = "main", backend: str = DEFAULT_BACKEND,
+                 intra_op_threads: int = INTRA_OP_THREADS, inter_op_threads: int = INTER_OP_THREADS,
+                 export_dir: Path = EXPORT_DIR):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        if torch is None:
+            raise RuntimeError("The ViT classifier needs torch and transformers (pip install -r requirements.txt)")
+        configure_threads(intra_op_threads, inter_op_threads)
+        self.model_name = model_name
+        self.model = ViTForImageClassification.from_pretrained(model_name, revision=revision).eval()
+        self.config = self.model.config
+        self.id2label = self.config.id2label
+        self.revision = getattr(self.config, "_commit_hash", None) or revision
+        self.image_size = self.config.image_size
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.export_dir = Path(export_dir)
+        self.backend = backend
+        self._run = self._load_backend(backend)
+        logger.info(f"ViT classifier backend: {backend} (revision {self.revision})")
+
+    def logits(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self._run(np.ascontiguousarray(pixel_values, dtype=np.float32))
+
+    def reference_logits(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Eager fp32 logits, for validating the selected backend"""
+        return self._torch_runner(self.model)(np.ascontiguousarray(pixel_values, dtype=np.float32))
+
+    def use_eager(self):
+        """Switch to eager fp32, e.g. after a backend failed validation"""
+        self._run = self.reference_logits
+        self.backend = "eager"
+
+    # --- backends ---
+
+    def _load_backend(self, backend: str) -> Callable[[np.ndarray], np.ndarray]:
+        if backend == "eager":
+            return self._torch_runner(self.model)
+        if backend == "torchscript":
+            example = torch.zeros(1, 3, self.image_size, self.image_size)
+            with torch.inference_mode():
+                traced = torch.jit.trace(_logits_only(self.model), example)
+            scripted = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+            return self._torch_runner(scripted, plain_output=True)
+        if backend == "compile":
+            return self._torch_runner(torch.compile(self.model))
+        if backend == "int8":
+            quantized = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            return self._torch_runner(quantized)
+        return self._onnx_runner(quantize=backend == "onnx-int8")
+
+    @staticmethod
+    def _torch_runner(module, plain_output: bool = False) -> Callable[[np.ndarray], np.ndarray]:
+        def run(pixel_values: np.ndarray) -> np.ndarray:
+            with torch.inference_mode():
+                output = module(torch.from_numpy(pixel_values)) if plain_output \
+                    else module(pixel_values=torch.from_numpy(pixel_values)).logits
+            return output.float().numpy()
+        return run
+
+    def _onnx_path(self, suffix: str) -> Path:
+        safe_name = re.sub(r"[^\w.-]+", "_", self.model_name)
+        return self.export_dir / f"{safe_name}-{self.revision}{suffix}.onnx"
+
+    def _export_onnx(self) -> Path:
+        """Export the fp32 graph once per model revision"""
+        path = self._onnx_path("")
+        if not path.exists():
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            example = torch.zeros(1, 3, self.image_size, self.image_size)
+            torch.onnx.export(
+                _logits_only(self.model), example, str(tmp_path), opset_version=14,
+                input_names=["pixel_values"], output_names=["logits"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+            )
+            os.replace(tmp_path, path)
+            logger.info(f"Exported ONNX model to {path}")
+        return path
+
+    def _onnx_runner(self, quantize: bool) -> Callable[[np.ndarray], np.ndarray]:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx backends need onnxruntime (pip install onnxruntime onnx)")
+
+        path = self._export_onnx()
+        if quantize:
+            quantized_path = self._onnx_path("-int8")
+            if not quantized_path.exists():
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                tmp_path = quantized_path.with_suffix(".tmp")
+                quantize_dynamic(str(path), str(tmp_path), weight_type=QuantType.QInt8)
+                os.replace(tmp_path, quantized_path)
+                logger.info(f"Quantized ONNX model to {quantized_path}")
+            path = quantized_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads > 0:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads > 0:
+            options.inter_op_num_threads = self.inter_op_threads
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+        def run(pixel_values: np.ndarray) -> np.ndarray:
+            return session.run(["logits"], {"pixel_values": pixel_values})[0]
+        return run
+
+    # --- validation ---
+
+    def top1_agreement(self, batches: Iterable[np.ndarray]) -> float:
+        """Fraction of images whose top-1 label matches eager fp32"""
+        matches = total = 0
+        for pixel_values in batches:
+            expected = self.reference_logits(pixel_values).argmax(axis=-1)
+            actual = self.logits(pixel_values).argmax(axis=-1)
+            matches += int((expected == actual).sum())
+            total += len(expected)
+        return matches / total if total else 1.0
+
+
+def load_sample_batches(directory: Path, preprocess: Callable[[bytes], np.ndarray],
+                        batch_size: int = 8, limit: Optional[int] = None) -> List[np.ndarray]:
+    """Preprocess the images in directory into (batch x C x H x W) arrays"""
+    paths = sorted(p for p in Path(directory).rglob("*")
+                   if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp", ".bmp"))[:limit]
+    arrays = [preprocess(p.read_bytes()) for p in paths]
+    return [np.concatenate(arrays[i:i + batch_size]) for i in range(0, len(arrays), batch_size)]
+
+
+def load_classifier(model_name: str, revision: str = "main", backend: str = DEFAULT_BACKEND,
+                    preprocess: Optional[Callable[[bytes], np.ndarray]] = None,
+                    validation_dir: str = VALIDATION_DIR, min_agreement: float = MIN_AGREEMENT) -> ViTClassifier:
+    """Load the classifier, falling back to eager if the backend fails to load or, when
+    validation_dir is set, disagrees with eager fp32 on more than 1 - min_agreement of it"""
+    try:
+        classifier = ViTClassifier(model_name, revision, backend)
+    except Exception as e:
+        if backend == "eager":
+            raise
+        logger.error(f"Backend '{backend}' failed to load ({e}), using eager")
+        return ViTClassifier(model_name, revision, "eager")
+
+    if preprocess is not None:
+        validate_classifier(classifier, preprocess, validation_dir, min_agreement)
+    return classifier
+
+
+def validate_classifier(classifier: ViTClassifier, preprocess: Callable[[bytes], np.ndarray],
+                        validation_dir: str = VALIDATION_DIR, min_agreement: float = MIN_AGREEMENT):
+    """Switch a non-eager classifier to eager if it disagrees with eager fp32 on more than
+    1 - min_agreement of the images in validation_dir"""
+    backend = classifier.backend
+    if backend == "eager" or not validation_dir:
+        return
+    batches = load_sample_batches(Path(validation_dir), preprocess)
+    agreement = classifier.top1_agreement(batches)
+    logger.info(f"Backend '{backend}' top-1 agreement with eager fp32: {agreement:.1%}")
+    if agreement < min_agreement:
+        logger.error(f"Backend '{backend}' below the {min_agreement:.1%} agreement threshold, using eager")
+        classifier.use_eager()